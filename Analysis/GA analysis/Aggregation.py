@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+
+percentiles: list[float] = [0.05, 0.25, 0.75, 0.95]
+
+
+class SortedGroups:
+    # Values sorted by group and then by value, so medians, quantiles, minima and maxima of all groups can be read
+    # from it at once.
+    #
+    # The statistics mirror what pandas calculates for a single group (numpy.percentile through Series.quantile and
+    # DataFrame.describe, (a + b) / 2 for even sized medians) operation for operation, so the results are exactly the
+    # same floats as calculating them one group at a time.
+
+    def __init__(self, values: np.ndarray, groupIndex: np.ndarray, groupCount: int):
+        values = np.asarray(values, dtype=np.float64)
+        order = np.lexsort((values, groupIndex))
+        self.values = values[order]
+        self.sizes = np.bincount(groupIndex, minlength=groupCount)
+        self.starts = np.cumsum(self.sizes) - self.sizes
+        self.ends = self.starts + self.sizes - 1
+
+    def min(self) -> np.ndarray:
+        return self.values[self.starts]
+
+    def max(self) -> np.ndarray:
+        return self.values[self.ends]
+
+    def median(self) -> np.ndarray:
+        lower = self.values[self.starts + (self.sizes - 1) // 2]
+        upper = self.values[self.starts + self.sizes // 2]
+        return np.where(self.sizes % 2 == 1, lower, (lower + upper) / 2)
+
+    def quantile(self, quantile: float) -> np.ndarray:
+        # pandas hands percentiles to numpy, which divides them by 100 again.
+        quantile = np.true_divide(np.float64(quantile) * 100.0, 100)
+        virtualIndexes = (self.sizes - 1) * quantile
+        previousIndexes = np.floor(virtualIndexes)
+        gamma = virtualIndexes - previousIndexes
+        previousIndexes = np.minimum(previousIndexes.astype(np.intp), self.sizes - 1)
+        nextIndexes = np.minimum(previousIndexes + 1, self.sizes - 1)
+        previous = self.values[self.starts + previousIndexes]
+        difference = self.values[self.starts + nextIndexes] - previous
+        return np.where(
+            gamma >= 0.5,
+            self.values[self.starts + nextIndexes] - difference * (1 - gamma),
+            previous + difference * gamma
+        )
+
+
+def groupSums(values: np.ndarray, groupIndex: np.ndarray, groupCount: int) -> np.ndarray:
+    # numpy's pairwise summation, which Series.sum uses, can not be reproduced with reduceat, so sum group by group in
+    # the original order. This is only used with a group per level and generation, so it stays cheap.
+    order = np.argsort(groupIndex, kind='stable')
+    bounds = np.cumsum(np.bincount(groupIndex, minlength=groupCount))
+    return np.array([groupValues.sum() for groupValues in np.split(np.asarray(values)[order], bounds[:-1])])
+
+
+def gatherRanges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Indexes of the items of every [start, end) range, range after range.
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def groupByIndexLevels(index: pd.MultiIndex, levelCount: int) -> tuple[np.ndarray, pd.MultiIndex]:
+    # Number the groups formed by the first levelCount levels of an index. As the index comes out of a sorted groupby,
+    # the numbering follows the sort order.
+    groupIndex, groupKeys = pd.factorize(index.droplevel(list(range(levelCount, index.nlevels))))
+    return groupIndex, groupKeys
+
+
+def summariseRuns(tables: pd.DataFrame) -> pd.DataFrame:
+    # Unique TGM count, population size and median fitness of every run, for every level and generation.
+    return tables.groupby(['level', 'generation', 'filename'], observed=True).agg(
+        nunique=('TGM', 'nunique'),
+        count=('TGM', 'count'),
+        median=('fitness', 'median'),
+    )
+
+
+def populationDiversity(runSummary: pd.DataFrame) -> pd.DataFrame:
+    groupIndex, groupKeys = groupByIndexLevels(runSummary.index, 2)
+    # level and generation have always been written as floats in this table.
+    populationDiversityTable = pd.DataFrame({
+        'level': groupKeys.get_level_values(0).astype(np.float64),
+        'generation': groupKeys.get_level_values(1).astype(np.float64),
+    })
+    for column, medianColumn, percentileColumn in [
+        ('nunique', 'median unique genes count', 'unique genes count'),
+        ('count', 'median non-zero fitness population size', 'population size'),
+        ('median', 'fitness median', 'fitness'),
+    ]:
+        sortedGroups = SortedGroups(runSummary[column].to_numpy(), groupIndex, len(groupKeys))
+        populationDiversityTable[medianColumn] = sortedGroups.median()
+        for percentile in percentiles:
+            populationDiversityTable[f'{percentileColumn} {percentile:.0%}'] = sortedGroups.quantile(percentile)
+    return populationDiversityTable
+
+
+def countPerRun(tables: pd.DataFrame, key: str) -> pd.Series:
+    # How often each value of key occurs in every run, for every level and generation.
+    return tables.groupby(['level', 'generation', key, 'filename'], observed=True).size()
+
+
+def medianCountTable(runCounts: pd.Series) -> pd.DataFrame:
+    # Median, percentiles and range of the per run counts of every key value, and the share of the median count of
+    # every key value within its level and generation.
+    groupIndex, groupKeys = groupByIndexLevels(runCounts.index, 3)
+    sortedGroups = SortedGroups(runCounts.to_numpy(), groupIndex, len(groupKeys))
+
+    table = pd.DataFrame(
+        {
+            'level': groupKeys.get_level_values(0),
+            'generation': groupKeys.get_level_values(1),
+            'median': sortedGroups.median(),
+        },
+        index=pd.Index(groupKeys.get_level_values(2), name=None),
+    )
+    levelGenerationIndex, levelGenerationKeys = groupByIndexLevels(groupKeys, 2)
+    medianSums = groupSums(table['median'].to_numpy(), levelGenerationIndex, len(levelGenerationKeys))
+    table['%'] = table['median'].to_numpy() / medianSums[levelGenerationIndex]
+    for percentile in percentiles:
+        table[f'{percentile:.0%}'] = sortedGroups.quantile(percentile)
+    table['min'] = sortedGroups.min().astype(runCounts.dtype)
+    table['max'] = sortedGroups.max().astype(runCounts.dtype)
+    return table
@@ -0,0 +1,79 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import LogLoader
+import TraceDecoder
+
+
+# Every breakdown of the heatmaps that is written to ./data/, by the columns the archives are grouped by.
+breakdowns: list[list[str]] = [
+    ['level'],
+    ['level', 'generation'],
+    ['level', 'TGM'],
+]
+
+
+def makeHeatmaps(traces: TraceDecoder.SweepTraces, keys: list[str]) -> dict[str, np.ndarray]:
+    # Merge the archive cells of every row into one level grid for every combination of values of keys, the same way
+    # renderArchive in the trace visualisation merges cells by their position. The grids of timesSeen, timesChosen,
+    # the highest reward and the number of archives a cell occurs in are dense arrays with one axis per key followed by
+    # y and x. The values of every key are stored alongside them, in axis order.
+    heatmaps: dict[str, np.ndarray] = {}
+    keyCodes: list[np.ndarray] = []
+    for key in keys:
+        codes, values = pd.factorize(traces.rows[key], sort=True)
+        keyCodes.append(codes)
+        values = np.asarray(values)
+        # Store strings as unicode arrays, so the files load without pickle.
+        heatmaps[key] = values.astype(str) if values.dtype == object else values
+    shape = (*[len(heatmaps[key]) for key in keys], TraceDecoder.levelHeight, TraceDecoder.levelWidth)
+
+    cells = traces.archives.items
+    cellRows = traces.archives.rowIndexes()
+    # Cells outside the level and cells of rows without a value for one of the keys can not be placed on a grid.
+    isPlaced = (
+        (cells['x'] >= 0) & (cells['x'] < TraceDecoder.levelWidth)
+        & (cells['y'] >= 0) & (cells['y'] < TraceDecoder.levelHeight)
+        & np.all([codes[cellRows] >= 0 for codes in keyCodes], axis=0)
+    )
+    cells = cells[isPlaced]
+    cellRows = cellRows[isPlaced]
+    gridIndexes = np.ravel_multi_index((*[codes[cellRows] for codes in keyCodes], cells['y'], cells['x']), shape)
+
+    gridSize = int(np.prod(shape))
+    heatmaps['timesSeen'] = np.bincount(gridIndexes, weights=cells['timesSeen'], minlength=gridSize) \
+        .astype(np.int32).reshape(shape)
+    heatmaps['timesChosen'] = np.bincount(gridIndexes, weights=cells['timesChosen'], minlength=gridSize) \
+        .astype(np.int32).reshape(shape)
+    heatmaps['cellCount'] = np.bincount(gridIndexes, minlength=gridSize).astype(np.int32).reshape(shape)
+    maxReward = np.full(gridSize, np.nan)
+    # fmax ignores the NaN of cells that are not in any archive.
+    np.fmax.at(maxReward, gridIndexes, cells['reward'])
+    heatmaps['maxReward'] = maxReward.reshape(shape)
+    return heatmaps
+
+
+def saveHeatmaps(heatmaps: dict[str, np.ndarray], path: str):
+    np.savez_compressed(path, **heatmaps)
+
+
+def getHeatmapPath(keys: list[str], label: str) -> str:
+    return f'./data/archive heatmaps {" ".join(keys)} {label}.npz'
+
+
+def runAnalysis(traces: TraceDecoder.SweepTraces, label: str = 'f9f6c53 40'):
+    for keys in breakdowns:
+        saveHeatmaps(makeHeatmaps(traces, keys), getHeatmapPath(keys, label))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aggregate the GoExplore archives of a sweep into level heatmaps.')
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    arguments = parser.parse_args()
+    folder = LogLoader.resolveFolder(arguments.folder)
+    files = LogLoader.getLogFilesInFolder(folder)
+    os.makedirs('./data', exist_ok=True)
+    runAnalysis(TraceDecoder.readTraces(files), LogLoader.getLabel(folder, files))
@@ -0,0 +1,193 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+# Figures are only written to disk, never shown.
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import ComponentTypesCategories
+import Diversity
+import FitnessConsistency
+import LogLoader
+import SyntheticLogs
+
+
+# Sweep sizes to benchmark, as SyntheticLogs.writeSweep arguments. large is about the size of a full sweep.
+scales: dict[str, dict] = {
+    'small': {'runs': 2, 'generations': 10, 'population': 20, 'archiveSize': 10},
+    'medium': {'runs': 10, 'generations': 15, 'population': 50, 'archiveSize': 40},
+    'large': {'runs': 40, 'generations': 15, 'population': 100, 'archiveSize': 40},
+}
+
+
+def cacheLogs(context: dict):
+    # Start from GA logs without a columnar cache, like the first analysis of a new sweep does.
+    shutil.rmtree(os.path.join(context['folder'], LogLoader.cacheFolderName), ignore_errors=True)
+    for file in context['files']:
+        LogLoader.cacheLog(file)
+
+
+def loadDiversityTables(context: dict):
+    context['diversityTables'] = Diversity.getTableFilesInFolder(context['folder'])
+
+
+def loadFitnessConsistencyTables(context: dict):
+    context['fitnessConsistencyTables'] = Diversity.getTableFilesInFolder(context['folder'], True)
+
+
+def loadComponentTypesTables(context: dict):
+    context['componentTypesTables'] = ComponentTypesCategories.getTableFilesInFolder(context['folder'])
+
+
+# Every benchmarked stage, in the order they run in. Later stages use the tables loaded by earlier ones.
+stages: list[tuple] = [
+    ('LogLoader.cacheLog', cacheLogs),
+    ('Diversity.getTableFilesInFolder', loadDiversityTables),
+    ('Diversity.runAnalysis', lambda context: Diversity.runAnalysis(context['diversityTables'])),
+    ('Diversity.getTableFilesInFolder (zero fitness)', loadFitnessConsistencyTables),
+    (
+        'FitnessConsistency.runAnalysis',
+        lambda context: FitnessConsistency.runAnalysis(context['fitnessConsistencyTables'])
+    ),
+    ('ComponentTypesCategories.getTableFilesInFolder', loadComponentTypesTables),
+    (
+        'ComponentTypesCategories.runAnalysis',
+        lambda context: ComponentTypesCategories.runAnalysis(context['componentTypesTables'])
+    ),
+]
+
+
+def runStage(stage, context: dict, traceMemory: bool) -> tuple[float, int | None]:
+    if traceMemory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    stage(context)
+    seconds = time.perf_counter() - start
+    peakMemory = None
+    if traceMemory:
+        peakMemory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    plt.close('all')
+    return seconds, peakMemory
+
+
+def getCommit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmarkScale(folder: str, parameters: dict, repeat: int) -> tuple[dict, list[dict]]:
+    files = LogLoader.getLogFilesInFolder(folder)
+    if len(files) == 0:
+        files = SyntheticLogs.writeSweep(folder, **parameters)
+    context = {'folder': folder, 'files': files}
+    sweep = {
+        'parameters': parameters,
+        'files': len(files),
+        'rows': int(sum(len(pd.read_csv(file, usecols=['generation'])) for file in files)),
+        'bytes': int(sum(os.path.getsize(file) for file in files)),
+    }
+
+    results = []
+    for name, stage in stages:
+        # Time without tracing allocations, as tracemalloc slows down pandas a lot, and measure memory separately.
+        seconds = [runStage(stage, context, False)[0] for _ in range(repeat)]
+        peakMemory = runStage(stage, context, True)[1]
+        results.append({
+            'stage': name,
+            'seconds': seconds,
+            'bestSeconds': min(seconds),
+            'peakMemoryBytes': peakMemory,
+        })
+        print(f'{name}: {min(seconds):.3f} s, {peakMemory / 2 ** 20:.1f} MiB')
+    return sweep, results
+
+
+def runBenchmark(selectedScales: list[str], repeat: int, workFolder: str | None = None) -> dict:
+    report = {
+        'commit': getCommit(),
+        'createdAt': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'repeat': repeat,
+        'sweeps': {},
+        'results': [],
+    }
+    root = workFolder if workFolder is not None else tempfile.mkdtemp(prefix='GA benchmark ')
+    workingDirectory = os.getcwd()
+    try:
+        for scale in selectedScales:
+            folder = os.path.join(os.path.abspath(root), scale, '')
+            # The analyses write their tables and plots relative to the working directory.
+            os.makedirs(os.path.join(folder, 'data'), exist_ok=True)
+            os.makedirs(os.path.join(folder, 'plots'), exist_ok=True)
+            os.chdir(folder)
+            print(f'{scale} sweep')
+            sweep, results = benchmarkScale(folder, scales[scale], repeat)
+            report['sweeps'][scale] = sweep
+            report['results'].extend({'scale': scale, **result} for result in results)
+    finally:
+        os.chdir(workingDirectory)
+        if workFolder is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return report
+
+
+def compareReports(previousReport: dict, report: dict):
+    previousResults = {(result['scale'], result['stage']): result for result in previousReport['results']}
+    print(f'compared to {previousReport["commit"]} ({previousReport["createdAt"]})')
+    for result in report['results']:
+        previousResult = previousResults.get((result['scale'], result['stage']))
+        if previousResult is None:
+            continue
+        print(
+            f'{result["scale"]} {result["stage"]}: '
+            f'{result["bestSeconds"] / previousResult["bestSeconds"]:.2f}x time, '
+            f'{result["peakMemoryBytes"] / previousResult["peakMemoryBytes"]:.2f}x memory'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time and memory profile the analyses on synthetic sweeps of several sizes.'
+    )
+    parser.add_argument('--scales', nargs='+', choices=list(scales), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of every stage')
+    parser.add_argument(
+        '--work-folder',
+        default=None,
+        help='folder to keep the synthetic sweeps in between benchmarks, defaults to a temporary folder'
+    )
+    parser.add_argument('--output', default=None, help='path of the JSON report')
+    parser.add_argument('--compare', default=None, help='JSON report of an earlier benchmark to compare with')
+    arguments = parser.parse_args()
+
+    benchmarkReport = runBenchmark(arguments.scales, arguments.repeat, arguments.work_folder)
+    output = arguments.output
+    if output is None:
+        output = f'./benchmark {benchmarkReport["commit"]} {"-".join(arguments.scales)}.json'
+    with open(output, 'w') as reportFile:
+        json.dump(benchmarkReport, reportFile, indent=2)
+    if arguments.compare is not None:
+        with open(arguments.compare) as previousReportFile:
+            compareReports(json.load(previousReportFile), benchmarkReport)
@@ -0,0 +1,170 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import Aggregation
+import Diversity
+import LogLoader
+import LogStream
+
+
+# Columns of the run summary to bootstrap, with the names they have in the population diversity table.
+summaryColumns: list[tuple[str, str]] = [
+    ('median', 'fitness'),
+    ('nunique', 'unique genes count'),
+    ('count', 'population size'),
+]
+
+# Largest number of resampled values to hold in memory at once.
+maxResampledValues: int = 2 ** 25
+
+
+def bootstrapGroups(
+    values: np.ndarray,
+    groupIndex: np.ndarray,
+    groupCount: int,
+    resamples: int = 2000,
+    confidence: float = 0.95,
+    seed: int = 0
+) -> dict[str, np.ndarray]:
+    # Median and mean of every group with percentile bootstrap confidence intervals. All groups of the same size are
+    # resampled together: one matrix of resample indexes picks the resampled values of every group at once, and the
+    # number of times each value is picked, multiplied with the matrix of group values, gives the resampled sums.
+    rng = np.random.default_rng(seed)
+    sortedGroups = Aggregation.SortedGroups(values, groupIndex, groupCount)
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+    statistics = {
+        name: np.full(groupCount, np.nan)
+        for name in ['median', 'median low', 'median high', 'mean', 'mean low', 'mean high']
+    }
+    for size in np.unique(sortedGroups.sizes[sortedGroups.sizes > 0]):
+        groups = np.flatnonzero(sortedGroups.sizes == size)
+        # Values of every group of this size as the columns of a matrix.
+        groupValues = sortedGroups.values[sortedGroups.starts[groups] + np.arange(size)[:, np.newaxis]]
+        resampleIndexes = rng.integers(0, size, (resamples, size))
+        pickCounts = np.bincount(
+            (np.arange(resamples)[:, np.newaxis] * size + resampleIndexes).ravel(),
+            minlength=resamples * size
+        ).reshape(resamples, size)
+
+        statistics['median'][groups] = sortedGroups.median()[groups]
+        statistics['mean'][groups] = groupValues.mean(axis=0)
+        means = pickCounts @ groupValues / size
+        statistics['mean low'][groups], statistics['mean high'][groups] = np.quantile(means, quantiles, axis=0)
+        # Resample the medians of a slice of the groups at a time, to bound memory.
+        sliceSize = max(1, maxResampledValues // (resamples * size))
+        for start in range(0, len(groups), sliceSize):
+            sliceGroups = groups[start:start + sliceSize]
+            medians = np.median(groupValues[:, start:start + sliceSize][resampleIndexes], axis=1)
+            statistics['median low'][sliceGroups], statistics['median high'][sliceGroups] = \
+                np.quantile(medians, quantiles, axis=0)
+    return statistics
+
+
+def bootstrapRunSummary(
+    runSummary: pd.DataFrame,
+    resamples: int = 2000,
+    confidence: float = 0.95,
+    seed: int = 0
+) -> pd.DataFrame:
+    # Bootstrap confidence intervals of the median and mean across runs of the run summary columns, for every level and
+    # generation.
+    groupIndex, groupKeys = Aggregation.groupByIndexLevels(runSummary.index, 2)
+    table = pd.DataFrame({
+        'level': groupKeys.get_level_values(0).astype(np.float64),
+        'generation': groupKeys.get_level_values(1).astype(np.float64),
+        'runs': np.bincount(groupIndex, minlength=len(groupKeys)),
+    })
+    for column, name in summaryColumns:
+        statistics = bootstrapGroups(
+            runSummary[column].to_numpy(),
+            groupIndex,
+            len(groupKeys),
+            resamples,
+            confidence,
+            seed
+        )
+        for statistic in ['median', 'mean']:
+            table[f'{name} {statistic}'] = statistics[statistic]
+            table[f'{name} {statistic} CI low'] = statistics[f'{statistic} low']
+            table[f'{name} {statistic} CI high'] = statistics[f'{statistic} high']
+    return table
+
+
+def makeMedianFitnessPlot(level: int, table: pd.DataFrame, x: int, y: int, axes):
+    table = table[table['level'] == level]
+    plot = table.plot(
+        kind='line',
+        y=['fitness median'],
+        x='generation',
+        ax=axes[y, x],
+        color='darkorange',
+    )
+    plot.fill_between(
+        table['generation'],
+        table['fitness median CI low'],
+        table['fitness median CI high'],
+        alpha=0.4,
+        color='darkorange',
+    )
+    plot.set_title(Diversity.levels.get(level))
+    plot.set_xlim(1, 15)
+    plot.set_ylim(0, 1)
+    if x != 0 or y != 0:
+        plot.get_legend().remove()
+    if y == 1:
+        plot.set_xlabel('generation')
+    else:
+        plot.set_xlabel('')
+
+
+def runAnalysis(
+    runSummary: pd.DataFrame,
+    label: str = 'f9f6c53 40',
+    resamples: int = 2000,
+    confidence: float = 0.95,
+    seed: int = 0,
+    tablesOnly: bool = False
+):
+    table = bootstrapRunSummary(runSummary, resamples, confidence, seed)
+    table.to_csv(f'./data/TGM diversity bootstrap {label}.csv')
+    if tablesOnly:
+        return
+    Diversity.renderFigure(
+        makeMedianFitnessPlot,
+        table,
+        (),
+        f'./plots/median fitness bootstrap level 3-4-5-6-8-9 {label}.png'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Bootstrap confidence intervals of the per generation medians and means across runs of a sweep.'
+    )
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    parser.add_argument('--resamples', type=int, default=2000)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--tables-only',
+        action='store_true',
+        help='only write the CSV file, without drawing the figure'
+    )
+    arguments = parser.parse_args()
+    folder = LogLoader.resolveFolder(arguments.folder)
+    os.makedirs('./data', exist_ok=True)
+    if not arguments.tables_only:
+        os.makedirs('./plots', exist_ok=True)
+        # The figure is only written to disk, never shown.
+        os.environ['MPLBACKEND'] = 'Agg'
+    runAnalysis(
+        LogStream.streamFolder(folder).getRunSummary(),
+        LogLoader.getLabel(folder, LogLoader.getLogFilesInFolder(folder)),
+        arguments.resamples,
+        arguments.confidence,
+        arguments.seed,
+        arguments.tables_only,
+    )
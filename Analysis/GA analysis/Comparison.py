@@ -0,0 +1,365 @@
+import argparse
+import itertools
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+import Aggregation
+import Bootstrap
+import Diversity
+import LogLoader
+import SweepCatalog
+
+
+corrections: list[str] = ['holm', 'benjamini-hochberg', 'bonferroni', 'none']
+
+# Largest number of permuted sums to hold in memory at once.
+maxPermutedValues: int = 2 ** 25
+
+# Keys of a catalog query condition, and the queryLogs parameters they select by.
+queryParameters: dict[str, str] = {
+    'commit': 'commit',
+    'levels': 'levels',
+    'population': 'population',
+    'elite': 'elitePercentage',
+    'folder': 'folder',
+}
+
+erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def resolveCondition(source: str) -> list[str]:
+    # GA logs of a condition: a folder of GA logs, the commit hash of a folder in ./data/, or a catalog query of comma
+    # separated key=value pairs, e.g. "commit=bb27b9d, elite=25, levels=3-5 8".
+    if '=' not in source:
+        return LogLoader.getLogFilesInFolder(LogLoader.resolveFolder(source))
+    query = {}
+    for pair in source.split(','):
+        key, _, value = pair.strip().partition('=')
+        if key not in queryParameters:
+            raise ValueError(f'unknown catalog query key {key!r}, expected one of {", ".join(queryParameters)}')
+        if key == 'levels':
+            query['levels'] = SweepCatalog.parseLevels(value.split())
+        elif key in ('population', 'elite'):
+            query[queryParameters[key]] = int(value)
+        else:
+            query[queryParameters[key]] = value.strip()
+    return SweepCatalog.selectLogFiles(**query)
+
+
+def readConditions(conditions: dict[str, list[str]], includeZeroFitness: bool = False) -> pd.DataFrame:
+    # Rows of the GA logs of every condition, with the label of their condition in the condition column.
+    frames: list[pd.DataFrame] = []
+    for condition, files in conditions.items():
+        if len(files) == 0:
+            raise ValueError(f'no GA logs found for condition {condition!r}')
+        frame = Diversity.getTableFiles(files, includeZeroFitness)
+        frame['condition'] = pd.Categorical([condition] * len(frame), categories=list(conditions))
+        frames.append(frame)
+    tables = LogLoader.concatLogs(frames)
+    # concatLogs sorts categories, keep the conditions in the order they were given instead.
+    tables['condition'] = tables['condition'].cat.reorder_categories(list(conditions))
+    return tables
+
+
+def summariseConditionRuns(tables: pd.DataFrame) -> pd.DataFrame:
+    # Same as Aggregation.summariseRuns, for every condition.
+    return tables.groupby(['condition', 'level', 'generation', 'filename'], observed=True).agg(
+        nunique=('TGM', 'nunique'),
+        count=('TGM', 'count'),
+        median=('fitness', 'median'),
+    )
+
+
+def makeSummaryTable(tables: pd.DataFrame, runSummary: pd.DataFrame) -> pd.DataFrame:
+    # Mean and spread of the fitness of all rows, and median and mean across runs of the run summary columns, for every
+    # condition, level and generation.
+    table = tables.groupby(['condition', 'level', 'generation'], observed=True)['fitness'] \
+        .agg(['mean', 'std', 'count'])
+    table.columns = ['fitness mean', 'fitness std', 'rows']
+    runStatistics = runSummary.groupby(level=[0, 1, 2], observed=True) \
+        .agg({column: ['median', 'mean'] for column, _ in Bootstrap.summaryColumns})
+    names = dict(Bootstrap.summaryColumns)
+    runStatistics.columns = [f'{names[column]} {statistic} across runs' for column, statistic in runStatistics.columns]
+    table = table.join(runStatistics)
+    table.insert(3, 'runs', runSummary.groupby(level=[0, 1, 2], observed=True).size())
+    return table.reset_index()
+
+
+def makePairSamples(runValues: pd.Series, pairs: list[tuple[int, int]]) -> dict[str, np.ndarray]:
+    # Values of both conditions of every pair of conditions, for every level and generation that both have values of,
+    # as one array. Every sample holds the values of the first condition of its pair in its group, followed by those
+    # of the second.
+    index = runValues.index
+    conditions = index.get_level_values(0)
+    conditionIndex = conditions.codes.astype(np.intp)
+    conditionCount = len(conditions.categories)
+    groupIndex, groupKeys = pd.factorize(index.droplevel([0, 3]), sort=True)
+    groupCount = len(groupKeys)
+    cellIndex = conditionIndex * groupCount + groupIndex
+    order = np.argsort(cellIndex, kind='stable')
+    sizes = np.bincount(cellIndex, minlength=conditionCount * groupCount)
+    starts = np.cumsum(sizes) - sizes
+
+    pairConditions = np.array(pairs, dtype=np.intp).reshape(-1, 2)
+    pairIndex, groupIndex = np.divmod(np.arange(len(pairConditions) * groupCount), groupCount)
+    firstCells = pairConditions[pairIndex, 0] * groupCount + groupIndex
+    secondCells = pairConditions[pairIndex, 1] * groupCount + groupIndex
+    isTested = (sizes[firstCells] > 0) & (sizes[secondCells] > 0)
+    pairIndex, groupIndex, firstCells, secondCells = (
+        pairIndex[isTested], groupIndex[isTested], firstCells[isTested], secondCells[isTested]
+    )
+    rangeStarts = np.column_stack([starts[firstCells], starts[secondCells]]).ravel()
+    rangeSizes = np.column_stack([sizes[firstCells], sizes[secondCells]]).ravel()
+    items = order[Aggregation.gatherRanges(rangeStarts, rangeStarts + rangeSizes)]
+    return {
+        'values': runValues.to_numpy(dtype=np.float64)[items],
+        'sampleIndex': np.repeat(np.arange(len(firstCells)), sizes[firstCells] + sizes[secondCells]),
+        'isFirst': np.repeat(np.tile([True, False], len(firstCells)), rangeSizes),
+        'firstSizes': sizes[firstCells],
+        'secondSizes': sizes[secondCells],
+        'pairIndex': pairIndex,
+        'level': groupKeys.get_level_values(0)[groupIndex],
+        'generation': groupKeys.get_level_values(1)[groupIndex],
+    }
+
+
+def mannWhitneyU(
+    values: np.ndarray,
+    sampleIndex: np.ndarray,
+    isFirst: np.ndarray,
+    sampleCount: int
+) -> tuple[np.ndarray, np.ndarray]:
+    # U statistic of the first values of every sample, and its two sided p-value, for all samples at once. Ties get the
+    # average of their ranks. The p-value is the normal approximation with tie and continuity correction, the same as
+    # scipy.stats.mannwhitneyu with method='asymptotic'.
+    order = np.lexsort((values, sampleIndex))
+    values, sampleIndex, isFirst = values[order], sampleIndex[order], isFirst[order]
+    sizes = np.bincount(sampleIndex, minlength=sampleCount)
+    starts = np.cumsum(sizes) - sizes
+    isTieStart = np.ones(len(values), dtype=bool)
+    isTieStart[1:] = (sampleIndex[1:] != sampleIndex[:-1]) | (values[1:] != values[:-1])
+    tieStarts = np.flatnonzero(isTieStart)
+    tieIndex = np.cumsum(isTieStart) - 1
+    tieSizes = np.diff(np.append(tieStarts, len(values)))
+    ranks = (tieStarts - starts[sampleIndex[tieStarts]] + (tieSizes + 1) / 2)[tieIndex]
+
+    firstSizes = np.bincount(sampleIndex, weights=isFirst, minlength=sampleCount)
+    secondSizes = sizes - firstSizes
+    u = np.bincount(sampleIndex, weights=ranks * isFirst, minlength=sampleCount) - firstSizes * (firstSizes + 1) / 2
+    tieTerms = np.bincount(sampleIndex[tieStarts], weights=tieSizes ** 3 - tieSizes, minlength=sampleCount)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(firstSizes * secondSizes / 12 * ((sizes + 1) - tieTerms / (sizes * (sizes - 1))))
+        z = (np.abs(u - firstSizes * secondSizes / 2) - 0.5) / sigma
+    return u, np.minimum(erfc(z / math.sqrt(2)).astype(np.float64), 1)
+
+
+def permutationTest(
+    values: np.ndarray,
+    sampleIndex: np.ndarray,
+    isFirst: np.ndarray,
+    sampleCount: int,
+    permutations: int = 2000,
+    seed: int = 0
+) -> np.ndarray:
+    # Two sided p-value of the difference in mean between the first and second values of every sample, from random
+    # reassignments of the values to both. All samples with the same sizes are permuted together, like
+    # Bootstrap.bootstrapGroups: one matrix marks the values every permutation assigns to the first, and multiplied with
+    # the matrix of sample values it gives the permuted sums of every sample at once.
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((~isFirst, sampleIndex))
+    values = values[order]
+    sizes = np.bincount(sampleIndex, minlength=sampleCount)
+    starts = np.cumsum(sizes) - sizes
+    firstSizes = np.bincount(sampleIndex, weights=isFirst, minlength=sampleCount).astype(np.intp)
+    secondSizes = sizes - firstSizes
+    p = np.full(sampleCount, np.nan)
+    isTested = (firstSizes > 0) & (secondSizes > 0)
+    for firstSize, secondSize in np.unique(np.column_stack([firstSizes, secondSizes])[isTested], axis=0):
+        size = firstSize + secondSize
+        samples = np.flatnonzero((firstSizes == firstSize) & (secondSizes == secondSize))
+        # Values of every sample of these sizes as the columns of a matrix, first values on top.
+        sampleValues = values[starts[samples] + np.arange(size)[:, np.newaxis]]
+        totals = sampleValues.sum(axis=0)
+        observed = np.abs(sampleValues[:firstSize].mean(axis=0) - sampleValues[firstSize:].mean(axis=0))
+        assignments = np.zeros((permutations, size))
+        np.put_along_axis(
+            assignments,
+            np.argsort(rng.random((permutations, size)), axis=1)[:, :firstSize],
+            1,
+            axis=1
+        )
+        extremeCounts = np.zeros(len(samples))
+        sliceSize = max(1, maxPermutedValues // permutations)
+        for start in range(0, len(samples), sliceSize):
+            firstSums = assignments @ sampleValues[:, start:start + sliceSize]
+            differences = np.abs(firstSums / firstSize - (totals[start:start + sliceSize] - firstSums) / secondSize)
+            # Allow for rounding, so permutations that only reorder the values count as at least as extreme.
+            extremeCounts[start:start + sliceSize] = \
+                (differences >= observed[start:start + sliceSize] * (1 - 1e-12)).sum(axis=0)
+        p[samples] = (extremeCounts + 1) / (permutations + 1)
+    return p
+
+
+def adjustPValues(p: np.ndarray, correction: str = 'holm') -> np.ndarray:
+    # Corrected p-values over the whole family of tests. Untested values (NaN) are left out of the family.
+    adjusted = np.full(len(p), np.nan)
+    isTested = ~np.isnan(p)
+    testCount = isTested.sum()
+    order = np.argsort(p[isTested])
+    sortedP = p[isTested][order]
+    if correction == 'holm':
+        sortedP = np.maximum.accumulate(sortedP * (testCount - np.arange(testCount)))
+    elif correction == 'benjamini-hochberg':
+        sortedP = np.minimum.accumulate((sortedP * testCount / np.arange(1, testCount + 1))[::-1])[::-1]
+    elif correction == 'bonferroni':
+        sortedP = sortedP * testCount
+    elif correction != 'none':
+        raise ValueError(f'unknown correction {correction!r}, expected one of {", ".join(corrections)}')
+    testedAdjusted = np.empty(testCount)
+    testedAdjusted[order] = np.minimum(sortedP, 1)
+    adjusted[isTested] = testedAdjusted
+    return adjusted
+
+
+def makeTestTable(
+    runSummary: pd.DataFrame,
+    column: str = 'median',
+    permutations: int = 2000,
+    correction: str = 'holm',
+    seed: int = 0
+) -> pd.DataFrame:
+    # Mann-Whitney U and permutation tests between the runs of every pair of conditions, for every level and
+    # generation that both have runs of, on one run summary column.
+    conditions = list(runSummary.index.get_level_values(0).categories)
+    pairs = list(itertools.combinations(range(len(conditions)), 2))
+    samples = makePairSamples(runSummary[column], pairs)
+    sampleCount = len(samples['pairIndex'])
+    sampleArguments = (samples['values'], samples['sampleIndex'], samples['isFirst'], sampleCount)
+    u, mannWhitneyP = mannWhitneyU(*sampleArguments)
+    permutationP = permutationTest(*sampleArguments, permutations, seed)
+
+    # Medians of both conditions, from the values in the same order as the samples.
+    sortedSamples = Aggregation.SortedGroups(
+        samples['values'],
+        samples['sampleIndex'] * 2 + ~samples['isFirst'],
+        sampleCount * 2
+    )
+    medians = sortedSamples.median().reshape(sampleCount, 2)
+    table = pd.DataFrame({
+        'metric': dict(Bootstrap.summaryColumns)[column],
+        'condition A': [conditions[pairs[pair][0]] for pair in samples['pairIndex']],
+        'condition B': [conditions[pairs[pair][1]] for pair in samples['pairIndex']],
+        'level': samples['level'],
+        'generation': samples['generation'],
+        'runs A': samples['firstSizes'],
+        'runs B': samples['secondSizes'],
+        'median A': medians[:, 0],
+        'median B': medians[:, 1],
+        'U': u,
+        # Probability that a run of A is above a run of B, counting ties as half.
+        'P(A > B)': u / (samples['firstSizes'] * samples['secondSizes']),
+        'Mann-Whitney p': mannWhitneyP,
+        'permutation p': permutationP,
+    })
+    table['Mann-Whitney p adjusted'] = adjustPValues(mannWhitneyP, correction)
+    table['permutation p adjusted'] = adjustPValues(permutationP, correction)
+    return table
+
+
+def makeFitnessPlot(level: int, table: pd.DataFrame, x: int, y: int, axes):
+    # Mean fitness of every condition, with a band of one standard deviation.
+    table = table[table['level'] == level]
+    for condition, group in table.groupby('condition', observed=True, sort=False):
+        plot = group.plot(kind='line', y=['fitness mean'], x='generation', ax=axes[y, x], label=[condition])
+        plot.fill_between(
+            group['generation'],
+            group['fitness mean'] - group['fitness std'],
+            group['fitness mean'] + group['fitness std'],
+            alpha=0.2,
+        )
+    axes[y, x].set_title(Diversity.levels.get(level))
+    axes[y, x].set_xlim(1, 15)
+    axes[y, x].set_ylim(0, 1)
+    if x != 0 or y != 0:
+        axes[y, x].get_legend().remove()
+    if y == 1:
+        axes[y, x].set_xlabel('generation')
+    else:
+        axes[y, x].set_xlabel('')
+
+
+def runAnalysis(
+    tables: pd.DataFrame,
+    label: str = 'comparison',
+    permutations: int = 2000,
+    correction: str = 'holm',
+    seed: int = 0,
+    tablesOnly: bool = False
+):
+    runSummary = summariseConditionRuns(tables)
+    summaryTable = makeSummaryTable(tables, runSummary)
+    summaryTable.to_csv(f'./data/comparison summary {label}.csv', index=False)
+    testTables = [
+        makeTestTable(runSummary, column, permutations, correction, seed) for column, _ in Bootstrap.summaryColumns
+    ]
+    pd.concat(testTables, ignore_index=True).to_csv(f'./data/comparison tests {label}.csv', index=False)
+    if tablesOnly:
+        return
+    Diversity.renderFigure(
+        makeFitnessPlot,
+        summaryTable,
+        (),
+        f'./plots/comparison fitness level 3-4-5-6-8-9 {label}.png'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare the runs of several conditions with each other for every level and generation.'
+    )
+    parser.add_argument(
+        '--condition',
+        nargs=2,
+        action='append',
+        required=True,
+        metavar=('LABEL', 'LOGS'),
+        help='label of a condition and its GA logs: a folder, the commit hash of a folder in ./data/, or a catalog '
+             f'query such as "commit=bb27b9d, elite=25, levels=3-5", with keys {", ".join(queryParameters)}'
+    )
+    parser.add_argument('--label', default='comparison', help='name of the output files')
+    parser.add_argument('--permutations', type=int, default=2000)
+    parser.add_argument(
+        '--correction',
+        choices=corrections,
+        default='holm',
+        help='multiple comparison correction over all tests of a metric'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--include-zero-fitness', action='store_true')
+    parser.add_argument(
+        '--tables-only',
+        action='store_true',
+        help='only write the CSV files, without drawing the figure'
+    )
+    arguments = parser.parse_args()
+    labels = [label for label, _ in arguments.condition]
+    duplicateLabels = sorted({label for label in labels if labels.count(label) > 1})
+    if len(duplicateLabels) > 0:
+        parser.error(f'condition labels must be unique, got {", ".join(duplicateLabels)} more than once')
+    os.makedirs('./data', exist_ok=True)
+    if not arguments.tables_only:
+        os.makedirs('./plots', exist_ok=True)
+    runAnalysis(
+        readConditions(
+            {label: resolveCondition(source) for label, source in arguments.condition},
+            arguments.include_zero_fitness
+        ),
+        arguments.label,
+        arguments.permutations,
+        arguments.correction,
+        arguments.seed,
+        arguments.tables_only,
+    )
@@ -1,31 +1,30 @@
-import glob
+from typing import TYPE_CHECKING
 
 import pandas as pd
-import matplotlib.pyplot as plt
+
+import LogLoader
+
+if TYPE_CHECKING:
+    import GeneTensor
 
 
 def getTableFilesInFolder(path: str) -> pd.DataFrame:
-    files = glob.glob(f'{path}GA log *.csv')
     frames: list[pd.DataFrame] = []
-    for file in files:
-        frame = pd.read_csv(file)
+    for file in LogLoader.getLogFilesInFolder(path):
+        frame = LogLoader.readLog(file, ['generation', 'level', 'fitness', *LogLoader.geneColumns])
         # where filter causes filtered rows to be replaced with NaN
         frame = frame.where(frame['fitness'] > 0)
-        frame['filename'] = file.split('/')[-1]
-        frame['TGM'] = (
-            frame['gameObject'].astype(str) + ',' +
-            frame['component'].astype(str) + ',' +
-            frame['componentField'].astype(str) + ',' +
-            frame['modifier'].astype(str)
-        )
+        frame['filename'] = pd.Series(file.split('/')[-1], index=frame.index, dtype='category')
         frames.append(frame)
-    mergedFrames = pd.concat(frames, ignore_index=True)
+    mergedFrames = LogLoader.concatLogs(frames)
+    LogLoader.addTGMColumns(mergedFrames)
     return mergedFrames
 
 
-def runAnalysis(tables: pd.DataFrame):
+def makeTable(tables: pd.DataFrame) -> tuple[pd.DataFrame, list]:
+    # Number of unique TGMs of every component, for every level and generation, and the components in column order.
     groupedData = tables.groupby(['level', 'generation'])
-    allComponentTypes = tables.dropna().drop_duplicates(subset=['component'])['component'].to_list()
+    allComponentTypes = tables.dropna(subset=['fitness']).drop_duplicates(subset=['component'])['component'].to_list()
     populationDiversityTable = pd.DataFrame(
         columns=[
             'level',
@@ -45,6 +44,33 @@ def runAnalysis(tables: pd.DataFrame):
         for componentName, componentTypeCount in uniqueComponentCount.items():
             newRow[componentName] = componentTypeCount
         populationDiversityTable = pd.concat([populationDiversityTable, newRow.to_frame().T], ignore_index=True)
+    return populationDiversityTable, allComponentTypes
+
+
+def makeTensorTable(tensor: 'GeneTensor.GeneTensor') -> tuple[pd.DataFrame, list]:
+    # Same as makeTable, from the gene tensor of a sweep instead of its rows. A TGM is a combination of genes, so
+    # the unique TGMs of a level and generation are the non-empty cells of the sum over runs.
+    tgmCounts = tensor.sum(['level', 'generation', *LogLoader.geneColumns])
+    tgms = tgmCounts.index.to_frame(index=False)
+    allComponentTypes = tensor.getFirstSeenOrder('component')
+    componentCounts = tgms.groupby(['level', 'generation', 'component'], observed=True).size() \
+        .unstack('component', fill_value=0)
+    totalUniqueGeneCounts = tgms.groupby(['level', 'generation']).size()
+    populationDiversityTable = pd.DataFrame({
+        'level': totalUniqueGeneCounts.index.get_level_values(0).astype(float),
+        'generation': totalUniqueGeneCounts.index.get_level_values(1).astype(float),
+        'totalUniqueGenes': totalUniqueGeneCounts.to_numpy(dtype=float),
+    })
+    # Components count as 0 in the generations they do not occur in, same as value_counts over the sweep categories.
+    for component in allComponentTypes:
+        populationDiversityTable[component] = componentCounts.get(component, pd.Series(dtype=float)) \
+            .reindex(totalUniqueGeneCounts.index, fill_value=0).to_numpy(dtype=float)
+    return populationDiversityTable, allComponentTypes
+
+
+def makeFigure(populationDiversityTable: pd.DataFrame, allComponentTypes: list):
+    # Only load matplotlib once a figure is drawn, so the table can be made without it.
+    import matplotlib.pyplot as plt
 
     fig, axes = plt.subplots(nrows=2, ncols=3, figsize=(18, 8))
     makePlot(3, 'Wall', populationDiversityTable, allComponentTypes, 0, 0, axes)
@@ -53,6 +79,11 @@ def runAnalysis(tables: pd.DataFrame):
     makePlot(6, 'Deadly River', populationDiversityTable, allComponentTypes, 0, 1, axes)
     makePlot(8, 'Ravine', populationDiversityTable, allComponentTypes, 1, 1, axes)
     makePlot(9, 'Ravine + Spikes', populationDiversityTable, allComponentTypes, 2, 1, axes)
+    return fig
+
+
+def runAnalysis(tables: pd.DataFrame):
+    return makeFigure(*makeTable(tables))
 
 
 def makePlot(level: int, levelName: str, table: pd.DataFrame, componentTypes: list, x: int, y: int, axes):
@@ -76,8 +107,11 @@ def makePlot(level: int, levelName: str, table: pd.DataFrame, componentTypes: li
         axes[y, x].legend(loc='upper left', bbox_to_anchor=(1.01, 1))
 
 
-diversityTables = getTableFilesInFolder('./data/f65acba/')
-runAnalysis(diversityTables)
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    diversityTables = getTableFilesInFolder('./data/f65acba/')
+    runAnalysis(diversityTables)
 
-plt.tight_layout()
-plt.show()
+    plt.tight_layout()
+    plt.show()
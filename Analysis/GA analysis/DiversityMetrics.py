@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+import Aggregation
+import LogLoader
+
+
+def getGeneCodes(tgms: pd.Index, tgmGenes: pd.DataFrame) -> np.ndarray:
+    # Integer code of every gene of every TGM, with one column per gene in LogLoader.geneColumns order, taken from the
+    # categorical gene columns of LogLoader.getTGMGenes. Codes follow the sorted gene values, so sums over them add up
+    # in the same order for any subset of the runs. A missing gene gets a code of its own.
+    genes = tgmGenes.set_index(tgmGenes['TGM'].astype(str)).reindex(tgms.astype(str))
+    return np.column_stack([genes[column].cat.codes.to_numpy() + 1 for column in LogLoader.geneColumns])
+
+
+def runDiversityMetrics(tgmCounts: pd.Series, tgmGenes: pd.DataFrame) -> pd.DataFrame:
+    # Gene entropy, mean pairwise Hamming distance and TGM coverage of the population of every run, for every level
+    # and generation, from the per run TGM counts of Aggregation.countPerRun and the genes of LogLoader.getTGMGenes.
+    # All of these follow from how often every gene value occurs, so no chromosomes are compared pair by pair:
+    # - the entropy of a gene is -sum(p * log2(p)) over the shares p of its values,
+    # - two chromosomes differ in a gene unless they share its value, so the pairs that differ in a gene are all
+    #   n * (n - 1) / 2 pairs minus c * (c - 1) / 2 for the count c of every value,
+    # - coverage is the share of the TGMs found at a level across the sweep that a run has found up to a generation.
+    index = tgmCounts.index
+    counts = tgmCounts.to_numpy(dtype=np.float64)
+    runIndex, runKeys = pd.factorize(
+        pd.MultiIndex.from_arrays([index.get_level_values(0), index.get_level_values(1), index.get_level_values(3)]),
+        sort=True
+    )
+    runCount = len(runKeys)
+    tgmCodes, tgms = pd.factorize(index.get_level_values(2))
+    geneCodes = getGeneCodes(pd.Index(tgms), tgmGenes)
+
+    populationSizes = np.bincount(runIndex, weights=counts, minlength=runCount)
+    pairCounts = populationSizes * (populationSizes - 1) / 2
+    metrics = pd.DataFrame(index=pd.MultiIndex.from_tuples(runKeys, names=['level', 'generation', 'filename']))
+    differingPairs = np.zeros(runCount)
+    for gene, column in enumerate(LogLoader.geneColumns):
+        valueCount = geneCodes[:, gene].max() + 1
+        valueCounts = np.bincount(
+            runIndex * valueCount + geneCodes[tgmCodes, gene],
+            weights=counts,
+            minlength=runCount * valueCount
+        )
+        valueRuns = np.flatnonzero(valueCounts) // valueCount
+        valueCounts = valueCounts[valueCounts > 0]
+        shares = valueCounts / populationSizes[valueRuns]
+        metrics[f'{column} entropy'] = -np.bincount(valueRuns, weights=shares * np.log2(shares), minlength=runCount)
+        differingPairs += pairCounts - np.bincount(
+            valueRuns,
+            weights=valueCounts * (valueCounts - 1) / 2,
+            minlength=runCount
+        )
+    # A population of one has no pairs, and no diversity either.
+    metrics['mean Hamming distance'] = np.divide(
+        differingPairs,
+        pairCounts,
+        out=np.zeros(runCount),
+        where=pairCounts > 0
+    )
+
+    levels = index.get_level_values(0).to_numpy()
+    generations = index.get_level_values(1).to_numpy()
+    filenames = index.get_level_values(3)
+    # Generation every run found every one of its TGMs in, and how many TGMs it found in every generation.
+    firstGenerations = pd.Series(generations).groupby([levels, filenames, tgmCodes], observed=True).min()
+    newTGMCounts = firstGenerations.groupby([
+        firstGenerations.index.get_level_values(0),
+        firstGenerations.index.get_level_values(1),
+        firstGenerations.to_numpy(),
+    ], observed=True).size()
+    runLevels = metrics.index.get_level_values(0)
+    runFilenames = metrics.index.get_level_values(2)
+    runGenerations = metrics.index.get_level_values(1)
+    foundTGMCounts = pd.Series(
+        newTGMCounts.reindex(pd.MultiIndex.from_arrays([runLevels, runFilenames, runGenerations]), fill_value=0)
+        .to_numpy(),
+        index=metrics.index
+    )
+    # Runs are sorted by level and generation, so a cumulative sum per level and run counts the TGMs found so far.
+    foundTGMCounts = foundTGMCounts.groupby([runLevels, runFilenames], observed=True).cumsum()
+    levelTGMCounts = pd.Series(tgmCodes).groupby(levels).nunique()
+    metrics['TGM coverage'] = foundTGMCounts.to_numpy() / levelTGMCounts.reindex(runLevels).to_numpy()
+    return metrics
+
+
+def addDiversityMetrics(
+    populationDiversityTable: pd.DataFrame,
+    tgmCounts: pd.Series,
+    tgmGenes: pd.DataFrame
+) -> pd.DataFrame:
+    # Median across runs of every diversity metric, as extra columns of the table of Aggregation.populationDiversity.
+    metrics = runDiversityMetrics(tgmCounts, tgmGenes)
+    groupIndex, groupKeys = Aggregation.groupByIndexLevels(metrics.index, 2)
+    # level and generation are floats in the table, and floats or integers in the counts.
+    rows = pd.MultiIndex.from_arrays([
+        groupKeys.get_level_values(0).astype(np.float64),
+        groupKeys.get_level_values(1).astype(np.float64),
+    ]).get_indexer(pd.MultiIndex.from_arrays([
+        populationDiversityTable['level'].to_numpy(dtype=np.float64),
+        populationDiversityTable['generation'].to_numpy(dtype=np.float64),
+    ]))
+    for column in metrics.columns:
+        medians = Aggregation.SortedGroups(metrics[column].to_numpy(), groupIndex, len(groupKeys)).median()
+        populationDiversityTable[f'median {column}'] = medians[rows]
+    return populationDiversityTable
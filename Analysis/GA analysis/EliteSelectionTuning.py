@@ -1,50 +1,76 @@
-import glob
-
 import pandas as pd
-import matplotlib.pyplot as plt
+
+import Comparison
+import LogLoader
+
+
+eliteSelectionFolders: dict[str, str] = {
+    '0% elite selection': './data/bb27b9d 0p elite/',
+    '2% elite selection': './data/bb27b9d 2p elite/',
+    '10% elite selection': './data/bb27b9d 10p elite/',
+    '25% elite selection': './data/bb27b9d 25p elite/',
+}
 
 
 def getTableFilesInFolder(path: str, category: str) -> pd.DataFrame:
-    files = glob.glob(f'{path}GA log *.csv')
-    frames = pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+    frames = pd.concat([
+        LogLoader.readLog(file, ['generation', 'level', 'fitness']).assign(filename=file.split('/')[-1])
+        for file in LogLoader.getLogFilesInFolder(path)
+    ], ignore_index=True)
     frames['category'] = category
     return frames.where(frames['fitness'] > 0)
 
 
+def makeTable(tables: pd.DataFrame) -> pd.DataFrame:
+    return tables.groupby(['category', 'level', 'generation'])['fitness'].agg(['mean', 'std']).reset_index()
+
+
+def summariseRuns(tables: pd.DataFrame) -> pd.DataFrame:
+    # Median fitness of every run, indexed like Comparison.summariseConditionRuns, so Comparison.makeTestTable can
+    # test it without reading the genes.
+    categories = pd.Categorical(tables['category'], categories=list(eliteSelectionFolders))
+    return tables.groupby([categories, 'level', 'generation', 'filename'], observed=True) \
+        .agg(median=('fitness', 'median'))
+
+
 def runAnalysis(tables: pd.DataFrame):
-    groupedData = tables.groupby(['category', 'level', 'generation'])['fitness'].agg(['mean', 'std']).reset_index()
+    # Only load matplotlib once a figure is drawn, so the table can be made without it.
+    import matplotlib.pyplot as plt
+
+    groupedData = makeTable(tables)
 
     fig, axes = plt.subplots(nrows=1, ncols=3, figsize=(12, 3))
+    for index, level in enumerate([3, 4, 5]):
+        for name, group in groupedData[groupedData['level'] == level].groupby('category'):
+            plot = group.plot(kind='line', y=['mean'], x='generation', ax=axes[index], label=[name])
+            plot.fill_between(
+                group['generation'],
+                group['mean'] - group['std'],
+                group['mean'] + group['std'],
+                alpha=0.2
+            )
+        axes[index].set_title(f'Level {level}')
+        axes[index].set_ylim(0, 1)
+        axes[index].set_xlim(1, 15)
+        if index > 0:
+            axes[index].get_legend().remove()
+
+    return fig
+
+
+def getEliteSelectionComparisonTables() -> pd.DataFrame:
+    return pd.concat([
+        getTableFilesInFolder(folder, category) for category, folder in eliteSelectionFolders.items()
+    ], ignore_index=True)
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    eliteSelectionTables = getEliteSelectionComparisonTables()
+    runAnalysis(eliteSelectionTables)
+    Comparison.makeTestTable(summariseRuns(eliteSelectionTables)) \
+        .to_csv('./data/comparison tests elite selection.csv', index=False)
 
-    for name, group in groupedData[groupedData['level'] == 3].groupby('category'):
-        plot = group.plot(kind='line', y=['mean'], x='generation', ax=axes[0], label=[name])
-        plot.fill_between(group['generation'], group['mean'] - group['std'], group['mean'] + group['std'], alpha=0.2)
-    axes[0].set_title('Level 3')
-    axes[0].set_ylim(0, 1)
-    axes[0].set_xlim(1, 15)
-    for name, group in groupedData[groupedData['level'] == 4].groupby('category'):
-        plot = group.plot(kind='line', y=['mean'], x='generation', ax=axes[1], label=[name])
-        plot.fill_between(group['generation'], group['mean'] - group['std'], group['mean'] + group['std'], alpha=0.2)
-    axes[1].set_title('Level 4')
-    axes[1].set_ylim(0, 1)
-    axes[1].set_xlim(1, 15)
-    axes[1].get_legend().remove()
-    for name, group in groupedData[groupedData['level'] == 5].groupby('category'):
-        plot = group.plot(kind='line', y=['mean'], x='generation', ax=axes[2], label=[name])
-        plot.fill_between(group['generation'], group['mean'] - group['std'], group['mean'] + group['std'], alpha=0.2)
-    axes[2].set_title('Level 5')
-    axes[2].set_ylim(0, 1)
-    axes[2].set_xlim(1, 15)
-    axes[2].get_legend().remove()
-
-
-eliteSelectionComparisonTables = pd.concat([
-    getTableFilesInFolder('./data/bb27b9d 0p elite/', '0% elite selection'),
-    getTableFilesInFolder('./data/bb27b9d 2p elite/', '2% elite selection'),
-    getTableFilesInFolder('./data/bb27b9d 10p elite/', '10% elite selection'),
-    getTableFilesInFolder('./data/bb27b9d 25p elite/', '25% elite selection'),
-], ignore_index=True)
-runAnalysis(eliteSelectionComparisonTables)
-
-plt.tight_layout()
-plt.show()
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,190 @@
+import argparse
+import heapq
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import LogLoader
+
+
+policies: list[str] = ['LRU', 'LFU']
+
+# A cache is either emptied at the start of every run, or shared by all runs of a level, in the order they ran in.
+scopes: list[str] = ['run', 'level']
+
+
+def readEvaluations(files: list[str]) -> pd.DataFrame:
+    # Every GoExplore run of a sweep, in the order they ran in. GeneticSharp only evaluates chromosomes without a
+    # fitness, so elite chromosomes that carry over to the next generation with the same id are not evaluated again
+    # and only their first row counts.
+    frames: list[pd.DataFrame] = []
+    for file in files:
+        frame = LogLoader.readLog(
+            file,
+            ['generation', 'level', 'id', 'hash', 'fitness', 'iterations', *LogLoader.geneColumns]
+        )
+        frame = frame[~frame['id'].duplicated()].drop(columns=['id'])
+        frame['filename'] = pd.Series(file.split('/')[-1], index=frame.index, dtype='category')
+        frames.append(frame)
+    evaluations = LogLoader.concatLogs(frames)
+    LogLoader.addTGMColumns(evaluations)
+    # GA log file names start with the time the run started, so sorting by file name and generation gives the order of
+    # the evaluations.
+    return evaluations.sort_values(['filename', 'generation'], kind='stable').reset_index(drop=True)
+
+
+def getCacheKeys(evaluations: pd.DataFrame) -> np.ndarray:
+    # One integer per (level, hash), the key an evaluation cache in the evolution loop would look chromosomes up by.
+    return (evaluations['level'].to_numpy(dtype=np.int64) << 32) \
+        | (evaluations['hash'].to_numpy(dtype=np.int64) & 0xFFFFFFFF)
+
+
+def makeRepeatReport(evaluations: pd.DataFrame) -> pd.DataFrame:
+    # Per level, how many evaluations repeat a (level, hash) that was evaluated before, in the same run or in an
+    # earlier run, and how much fitness and iterations vary between evaluations of the same hash.
+    keys = ['level', 'hash']
+    isRepeat = evaluations.duplicated(keys)
+    isRunRepeat = evaluations.duplicated([*keys, 'filename'])
+    groups = evaluations.groupby(keys, observed=True)
+    solvedCounts = (evaluations['fitness'] > 0).groupby([evaluations[key] for key in keys]).sum()
+    hashes = pd.DataFrame({
+        'evaluations': groups.size(),
+        'TGMs': groups['TGM'].nunique(),
+        'fitness std': groups['fitness'].std(),
+        'fitness range': groups['fitness'].max() - groups['fitness'].min(),
+        # Found the level exit in some evaluations, but not in others.
+        'solved inconsistently': (solvedCounts > 0) & (solvedCounts < groups.size()),
+        'iterations cv': groups['iterations'].std() / groups['iterations'].mean(),
+    })
+    repeatedHashes = hashes[hashes['evaluations'] > 1].groupby(level='level')
+    evaluationsPerLevel = evaluations.groupby('level')
+    report = pd.DataFrame({
+        'evaluations': evaluationsPerLevel.size(),
+        'distinct hashes': hashes.groupby(level='level').size(),
+        'repeated evaluations': isRepeat.groupby(evaluations['level']).sum(),
+        'repeated within run': isRunRepeat.groupby(evaluations['level']).sum(),
+        'iterations': evaluationsPerLevel['iterations'].sum(),
+        'repeated iterations': evaluations['iterations'].where(isRepeat, 0).groupby(evaluations['level']).sum(),
+        # Hashes that more than one TGM shares, for which a cache would return the result of the wrong TGM.
+        'hash collisions': (hashes['TGMs'] > 1).groupby(level='level').sum(),
+        'median fitness std': repeatedHashes['fitness std'].median(),
+        'median fitness range': repeatedHashes['fitness range'].median(),
+        'solved inconsistently': repeatedHashes['solved inconsistently'].sum(),
+        'median iterations cv': repeatedHashes['iterations cv'].median(),
+    })
+    report['repeated %'] = report['repeated evaluations'] / report['evaluations']
+    report['repeated across runs'] = report['repeated evaluations'] - report['repeated within run']
+    return report
+
+
+def simulateLRU(keys: list, capacity: int) -> np.ndarray:
+    # Whether every lookup hits a least recently used cache of capacity entries.
+    cache: OrderedDict = OrderedDict()
+    hits = np.zeros(len(keys), dtype=bool)
+    for index, key in enumerate(keys):
+        if key in cache:
+            hits[index] = True
+            cache.move_to_end(key)
+            continue
+        cache[key] = None
+        if len(cache) > capacity:
+            cache.popitem(last=False)
+    return hits
+
+
+def simulateLFU(keys: list, capacity: int) -> np.ndarray:
+    # Whether every lookup hits a least frequently used cache of capacity entries, evicting the least recently used of
+    # the least frequently used entries. The heap holds (uses, last use, key) and entries that went stale when their
+    # key was used again are skipped on eviction.
+    uses: dict = {}
+    lastUses: dict = {}
+    heap: list = []
+    hits = np.zeros(len(keys), dtype=bool)
+    for index, key in enumerate(keys):
+        if key in uses:
+            hits[index] = True
+            uses[key] += 1
+        else:
+            if len(uses) == capacity:
+                while True:
+                    evictedUses, evictedLastUse, evictedKey = heapq.heappop(heap)
+                    if uses.get(evictedKey) == evictedUses and lastUses[evictedKey] == evictedLastUse:
+                        break
+                del uses[evictedKey]
+                del lastUses[evictedKey]
+            uses[key] = 1
+        lastUses[key] = index
+        heapq.heappush(heap, (uses[key], index, key))
+    return hits
+
+
+def simulateCache(evaluations: pd.DataFrame, policy: str, capacity: int, scope: str) -> np.ndarray:
+    # Whether every evaluation would have been a cache hit. Every level, and for the run scope every run, has a cache of
+    # its own.
+    simulate = {'LRU': simulateLRU, 'LFU': simulateLFU}[policy]
+    keys = getCacheKeys(evaluations)
+    hits = np.zeros(len(evaluations), dtype=bool)
+    cacheColumns = ['level', 'filename'] if scope == 'run' else ['level']
+    for rowIndexes in evaluations.groupby(cacheColumns, observed=True).indices.values():
+        hits[rowIndexes] = simulate(keys[rowIndexes].tolist(), capacity)
+    return hits
+
+
+def makeHitRateTable(evaluations: pd.DataFrame, capacities: list[int]) -> pd.DataFrame:
+    # Hit rate and saved GoExplore iterations of every cache policy, scope and capacity, per level.
+    # simulateLFU evicts an entry before adding a new one, so every cache needs room for at least one entry.
+    if min(capacities) < 1:
+        raise ValueError(f'cache capacities must be at least 1, got {min(capacities)}')
+    rows: list[pd.DataFrame] = []
+    for policy in policies:
+        for scope in scopes:
+            for capacity in capacities:
+                hits = pd.Series(simulateCache(evaluations, policy, capacity, scope))
+                levels = evaluations['level']
+                rows.append(pd.DataFrame({
+                    'policy': policy,
+                    'scope': scope,
+                    'capacity': capacity,
+                    'hit rate': hits.groupby(levels).mean(),
+                    'saved iterations': evaluations['iterations'].where(hits, 0).groupby(levels).sum(),
+                }))
+    return pd.concat(rows).rename_axis('level').reset_index()
+
+
+def makeLookupTable(evaluations: pd.DataFrame) -> pd.DataFrame:
+    # Best known result of every (level, hash): the evaluation with the highest fitness, and the fewest iterations
+    # among those, along with how many evaluations it is based on.
+    bestEvaluations = evaluations.sort_values(['fitness', 'iterations'], ascending=[False, True], kind='stable')
+    lookupTable = bestEvaluations.drop_duplicates(['level', 'hash']).set_index(['level', 'hash'])
+    lookupTable = lookupTable[['TGM', 'fitness', 'iterations', 'filename', 'generation']].rename(
+        columns={'fitness': 'best fitness', 'iterations': 'best iterations'}
+    )
+    groups = evaluations.groupby(['level', 'hash'], observed=True)
+    lookupTable['evaluations'] = groups.size()
+    lookupTable['median fitness'] = groups['fitness'].median()
+    lookupTable['mean iterations'] = groups['iterations'].mean()
+    return lookupTable.sort_index()
+
+
+def runAnalysis(evaluations: pd.DataFrame, capacities: list[int], label: str = 'f9f6c53 40'):
+    makeRepeatReport(evaluations).to_csv(f'./data/evaluation repeats {label}.csv')
+    makeHitRateTable(evaluations, capacities).to_csv(f'./data/evaluation cache hit rates {label}.csv', index=False)
+    makeLookupTable(evaluations).to_csv(f'./data/evaluation cache lookup {label}.csv')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Report repeated GoExplore evaluations of the same chromosome hash, and simulate an evaluation '
+                    'cache.'
+    )
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    parser.add_argument('--capacities', type=int, nargs='+', default=[10, 50, 100, 500], help='cache sizes to simulate')
+    arguments = parser.parse_args()
+    if min(arguments.capacities) < 1:
+        parser.error(f'cache capacities must be at least 1, got {min(arguments.capacities)}')
+    folder = LogLoader.resolveFolder(arguments.folder)
+    files = LogLoader.getLogFilesInFolder(folder)
+    os.makedirs('./data', exist_ok=True)
+    runAnalysis(readEvaluations(files), arguments.capacities, LogLoader.getLabel(folder, files))
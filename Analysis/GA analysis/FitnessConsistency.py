@@ -1,44 +1,146 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
+import Aggregation
 import Diversity
+import Instrumentation
+import LogStream
 
 
-def runAnalysis(table: pd.DataFrame):
+def runAnalysis(table: pd.DataFrame, tablesOnly: bool = False):
     table = table.dropna(subset=['fitness'])
+    makeLevel = makeTable if tablesOnly else makePlot
 
-    makePlot(3, table)
-    makePlot(4, table)
-    makePlot(5, table)
-    makePlot(6, table)
-    makePlot(8, table)
-    makePlot(9, table)
+    makeLevel(3, table)
+    makeLevel(4, table)
+    makeLevel(5, table)
+    makeLevel(6, table)
+    makeLevel(8, table)
+    makeLevel(9, table)
 
     return table
 
 
-def makePlot(level: int, table: pd.DataFrame):
-    table = table[table['level'] == level]
-    groupedData = table.groupby(['TGM'])
-    for name, group in groupedData:
-        if len(group[group['fitness'] == 0]) == len(group):
-            table = table.drop(group.index)
+def runStreamingAnalysis(path: str, tablesOnly: bool = False):
+    fitnessCounts = LogStream.streamFolder(path).getFitnessCounts()
+    for level in [3, 4, 5, 6, 8, 9]:
+        makeCountsPlot(level, fitnessCounts, tablesOnly=tablesOnly)
 
-    fig1, axe = plt.subplots(figsize=(10, np.ceil(0.2 * len(table['TGM'].unique()))))
 
-    table.plot.box(
-        column='fitness',
-        by='TGM',
-        ax=axe,
+def makeCountsPlot(level: int, fitnessCounts: pd.Series, label: str = 'f9f6c53 40', tablesOnly: bool = False):
+    # Only expand one level at a time back into rows for the box plots.
+    levelFitnessCounts = fitnessCounts[fitnessCounts.index.get_level_values('level') == level]
+    makeLevel = makeTable if tablesOnly else makePlot
+    makeLevel(level, LogStream.expandCounts(levelFitnessCounts), label)
+
+
+def removeZeroFitnessTGMs(table: pd.DataFrame) -> pd.DataFrame:
+    # Leave out TGMs that never have a fitness above zero on a level.
+    hasFitness = (table['fitness'] != 0).groupby([table['level'], table['TGM']], observed=True).transform('any')
+    return table[hasFitness]
+
+
+def makeBoxTable(table: pd.DataFrame, whiskerRange: float = 1.5) -> tuple[pd.DataFrame, list[np.ndarray]]:
+    # Box plot statistics of the fitness of every TGM on every level, sorted by level and TGM, and the fitness values
+    # outside the whiskers of every box. The statistics are calculated operation for operation like
+    # matplotlib.cbook.boxplot_stats does for a single box, so the plots look the same as letting matplotlib calculate
+    # them.
+    groupIndex, groupKeys = pd.factorize(pd.MultiIndex.from_arrays([table['level'], table['TGM']]))
+    levels = groupKeys.get_level_values(0).to_numpy()
+    tgms = groupKeys.get_level_values(1).astype(str).to_numpy()
+    # Renumber the groups in level and TGM order.
+    order = np.lexsort((tgms, levels))
+    groupIndex = np.argsort(order)[groupIndex]
+    groupCount = len(order)
+
+    sortedGroups = Aggregation.SortedGroups(table['fitness'].to_numpy(), groupIndex, groupCount)
+    q1 = sortedGroups.quantile(0.25)
+    median = sortedGroups.quantile(0.5)
+    q3 = sortedGroups.quantile(0.75)
+    iqr = q3 - q1
+    lowerLimit = q1 - whiskerRange * iqr
+    upperLimit = q3 + whiskerRange * iqr
+
+    # Whiskers end at the most extreme values within whiskerRange times the interquartile range of the box.
+    values = sortedGroups.values
+    valueGroups = np.repeat(np.arange(groupCount), sortedGroups.sizes)
+    belowLowerCount = np.bincount(valueGroups, weights=values < lowerLimit[valueGroups], minlength=groupCount) \
+        .astype(np.int64)
+    notAboveUpperCount = np.bincount(valueGroups, weights=values <= upperLimit[valueGroups], minlength=groupCount) \
+        .astype(np.int64)
+    lowerWhisker = np.where(
+        belowLowerCount < sortedGroups.sizes,
+        values[np.minimum(sortedGroups.starts + belowLowerCount, sortedGroups.ends)],
+        q1
+    )
+    lowerWhisker = np.where(lowerWhisker > q1, q1, lowerWhisker)
+    upperWhisker = np.where(
+        notAboveUpperCount > 0,
+        values[np.maximum(sortedGroups.starts + notAboveUpperCount - 1, sortedGroups.starts)],
+        q3
+    )
+    upperWhisker = np.where(upperWhisker < q3, q3, upperWhisker)
+
+    isFlier = (values < lowerWhisker[valueGroups]) | (values > upperWhisker[valueGroups])
+    fliers = np.split(values[isFlier], np.cumsum(np.bincount(valueGroups[isFlier], minlength=groupCount))[:-1])
+
+    boxTable = pd.DataFrame({
+        'level': levels[order],
+        'TGM': tgms[order],
+        'count': sortedGroups.sizes,
+        'lower whisker': lowerWhisker,
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'upper whisker': upperWhisker,
+        'fliers': [len(levelFliers) for levelFliers in fliers],
+    })
+    return boxTable, fliers
+
+
+def makeTable(level: int, table: pd.DataFrame, label: str = 'f9f6c53 40') -> tuple[pd.DataFrame, list[np.ndarray]]:
+    table = removeZeroFitnessTGMs(table[table['level'] == level])
+    with Instrumentation.stage('FitnessConsistency.makeBoxTable', f'level {level}'):
+        boxTable, fliers = makeBoxTable(table)
+    boxTable.to_csv(f'./data/FitnessConsistency level {level} {label}.csv', index=False)
+    return boxTable, fliers
+
+
+def makePlot(level: int, table: pd.DataFrame, label: str = 'f9f6c53 40'):
+    # Only load matplotlib once a figure is drawn, so the tables can be made without it.
+    import matplotlib.pyplot as plt
+
+    boxTable, fliers = makeTable(level, table, label)
+    fig1, axe = plt.subplots(figsize=(10, np.ceil(0.2 * len(boxTable))))
+
+    boxPlot = axe.bxp(
+        [
+            {
+                'label': box['TGM'],
+                'whislo': box['lower whisker'],
+                'q1': box['q1'],
+                'med': box['median'],
+                'q3': box['q3'],
+                'whishi': box['upper whisker'],
+                'fliers': boxFliers,
+            }
+            for box, boxFliers in zip(boxTable.to_dict('records'), fliers)
+        ],
         vert=False,
     )
+    # Same colours as the pandas box plots this used to be drawn with.
+    plt.setp(boxPlot['boxes'], color='C0')
+    plt.setp(boxPlot['whiskers'], color='C0')
+    plt.setp(boxPlot['caps'], color='C0')
+    plt.setp(boxPlot['medians'], color='C2')
     axe.set_title(Diversity.levels.get(level))
     axe.set_xlim(0, 1)
     axe.set_xlabel('Fitness per TGM')
     plt.tight_layout()
     plt.show()
-    fig1.savefig(f'./plots/FitnessConsistency level {level} f9f6c53 40.png')
+    with Instrumentation.stage('savefig', f'FitnessConsistency level {level} {label}.png'):
+        fig1.savefig(f'./plots/FitnessConsistency level {level} {label}.png')
+    plt.close(fig1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,371 @@
+import argparse
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+
+import Aggregation
+import Diversity
+import LogLoader
+
+
+tensorFileName: str = 'gene tensor.npz'
+
+# Dimensions of the tensor, in the order of the columns of its coordinates.
+dimensions: list[str] = ['run', 'level', 'generation', *LogLoader.geneColumns]
+
+
+def sumCells(coordinates: np.ndarray, *counts: np.ndarray) -> tuple[np.ndarray, ...]:
+    # Sort cells by their coordinates and add up the counts of cells with the same coordinates.
+    if len(coordinates) == 0:
+        return coordinates, *counts
+    order = np.lexsort(coordinates.T[::-1])
+    coordinates = coordinates[order]
+    isNew = np.ones(len(coordinates), dtype=bool)
+    isNew[1:] = (coordinates[1:] != coordinates[:-1]).any(axis=1)
+    starts = np.flatnonzero(isNew)
+    return coordinates[starts], *[np.add.reduceat(count[order], starts) for count in counts]
+
+
+class GeneTensor:
+    # Sparse tensor of the number of GA log rows with every combination of run, level, generation and genes. Only
+    # non-empty cells are stored, as one row of integer coordinates per cell, sorted, with the number of rows with a
+    # fitness and the number of rows with non-zero fitness in the cell. Runs are numbered by their place in files,
+    # genes by their place in the sorted labels of the gene, and missing genes are -1. Level and generation are their
+    # own coordinates.
+    #
+    # Gene frequency tables sum the cells over some of the dimensions instead of grouping the rows of a sweep. The
+    # tensor of a folder is kept in its cache folder and brought up to date by update, which only counts the rows that
+    # were added to the GA logs since the last update.
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.files: list[str] = []
+        # Size, modification time and fingerprint of every file when it was counted, and the number of rows counted.
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.modificationTimes = np.zeros(0, dtype=np.int64)
+        self.fingerprints = np.zeros(0, dtype=np.int64)
+        self.rowCounts = np.zeros(0, dtype=np.int64)
+        self.labels: dict[str, np.ndarray] = {gene: np.zeros(0, dtype=str) for gene in LogLoader.geneColumns}
+        # Row number of the first row with non-zero fitness of every gene value in every run, or -1, so tables can
+        # list gene values in the order they first appear in a sweep.
+        self.firstRows: dict[str, np.ndarray] = {
+            gene: np.zeros((0, 0), dtype=np.int64) for gene in LogLoader.geneColumns
+        }
+        self.coordinates = np.zeros((0, len(dimensions)), dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.nonZeroFitnessCounts = np.zeros(0, dtype=np.int64)
+
+    def getTensorPath(self) -> str:
+        return os.path.join(self.folder, LogLoader.cacheFolderName, tensorFileName)
+
+    @staticmethod
+    def load(folder: str) -> 'GeneTensor':
+        # The saved tensor of a folder, brought up to date with the GA logs in it.
+        tensor = GeneTensor(folder)
+        if os.path.exists(tensor.getTensorPath()):
+            with np.load(tensor.getTensorPath()) as savedTensor:
+                tensor.files = savedTensor['files'].tolist()
+                for name in ['sizes', 'modificationTimes', 'rowCounts', 'coordinates', 'counts']:
+                    setattr(tensor, name, savedTensor[name])
+                # Tensors saved before fingerprints were kept are read again from scratch.
+                tensor.fingerprints = savedTensor['fingerprints'] if 'fingerprints' in savedTensor \
+                    else np.zeros(len(tensor.files), dtype=np.int64)
+                tensor.nonZeroFitnessCounts = savedTensor['nonZeroFitnessCounts']
+                for gene in LogLoader.geneColumns:
+                    tensor.labels[gene] = savedTensor[f'{gene} labels']
+                    tensor.firstRows[gene] = savedTensor[f'{gene} first rows']
+        if tensor.update():
+            tensor.save()
+        return tensor
+
+    def save(self):
+        tensorPath = self.getTensorPath()
+        os.makedirs(os.path.dirname(tensorPath), exist_ok=True)
+        # Write to a temporary file first, so other processes never read a half written tensor.
+        temporaryTensorPath = f'{tensorPath}.{os.getpid()}.tmp.npz'
+        np.savez(
+            temporaryTensorPath,
+            files=np.array(self.files, dtype=str),
+            sizes=self.sizes,
+            modificationTimes=self.modificationTimes,
+            fingerprints=self.fingerprints,
+            rowCounts=self.rowCounts,
+            coordinates=self.coordinates,
+            counts=self.counts,
+            nonZeroFitnessCounts=self.nonZeroFitnessCounts,
+            **{f'{gene} labels': self.labels[gene] for gene in LogLoader.geneColumns},
+            **{f'{gene} first rows': self.firstRows[gene] for gene in LogLoader.geneColumns},
+        )
+        os.replace(temporaryTensorPath, tensorPath)
+
+    def update(self) -> bool:
+        # Count new GA logs and rows appended to counted ones. A GA log that shrank, was rewritten or disappeared is
+        # removed from the tensor first, and counted again if it is still there. Returns whether anything changed.
+        newRows: list[tuple[int, int, pd.DataFrame]] = []
+        removedFiles: list[int] = []
+        currentFiles = {os.path.basename(file): file for file in LogLoader.getLogFilesInFolder(self.folder)}
+
+        for fileNumber, name in enumerate(self.files):
+            if name not in currentFiles and self.rowCounts[fileNumber] > 0:
+                removedFiles.append(fileNumber)
+                self.sizes[fileNumber] = self.modificationTimes[fileNumber] = self.rowCounts[fileNumber] = 0
+                self.fingerprints[fileNumber] = 0
+        for name, file in currentFiles.items():
+            if name not in self.files:
+                self.files.append(name)
+                self.sizes = np.append(self.sizes, 0)
+                self.modificationTimes = np.append(self.modificationTimes, 0)
+                self.fingerprints = np.append(self.fingerprints, 0)
+                self.rowCounts = np.append(self.rowCounts, 0)
+                for gene in LogLoader.geneColumns:
+                    self.firstRows[gene] = np.vstack([
+                        self.firstRows[gene],
+                        np.full((1, len(self.labels[gene])), -1, dtype=np.int64)
+                    ])
+            fileNumber = self.files.index(name)
+            fileStat = os.stat(file)
+            isUnchanged = fileStat.st_size == self.sizes[fileNumber] \
+                and fileStat.st_mtime_ns == self.modificationTimes[fileNumber]
+            if isUnchanged:
+                continue
+            if self.rowCounts[fileNumber] > 0 \
+                    and not LogLoader.isAppendedTo(file, self.sizes[fileNumber], self.fingerprints[fileNumber]):
+                removedFiles.append(fileNumber)
+                self.rowCounts[fileNumber] = 0
+            frame = LogLoader.readLog(file, ['generation', 'level', 'fitness', *LogLoader.geneColumns])
+            newRows.append((fileNumber, int(self.rowCounts[fileNumber]), frame))
+            self.sizes[fileNumber] = fileStat.st_size
+            self.modificationTimes[fileNumber] = fileStat.st_mtime_ns
+            self.fingerprints[fileNumber] = LogLoader.fingerprintPrefix(file, fileStat.st_size)
+            self.rowCounts[fileNumber] = len(frame)
+
+        if len(newRows) == 0 and len(removedFiles) == 0:
+            return False
+        for gene in LogLoader.geneColumns:
+            self.firstRows[gene][removedFiles] = -1
+        self.addLabels([frame for _, _, frame in newRows])
+        isKept = ~np.isin(self.coordinates[:, 0], removedFiles)
+        coordinates = [self.coordinates[isKept]]
+        counts = [self.counts[isKept]]
+        nonZeroFitnessCounts = [self.nonZeroFitnessCounts[isKept]]
+        for fileNumber, firstRow, frame in newRows:
+            rowCoordinates, isNonZeroFitness = self.countRows(fileNumber, firstRow, frame)
+            coordinates.append(rowCoordinates)
+            counts.append(np.ones(len(rowCoordinates), dtype=np.int64))
+            nonZeroFitnessCounts.append(isNonZeroFitness.astype(np.int64))
+        self.coordinates, self.counts, self.nonZeroFitnessCounts = sumCells(
+            np.concatenate(coordinates),
+            np.concatenate(counts),
+            np.concatenate(nonZeroFitnessCounts)
+        )
+        return True
+
+    def addLabels(self, frames: list[pd.DataFrame]):
+        # Add the gene values of frames to the labels, and renumber the genes of the cells to the new labels.
+        for gene in LogLoader.geneColumns:
+            labels = np.unique(np.concatenate([
+                self.labels[gene],
+                *[frame[gene].cat.categories.astype(str) for frame in frames]
+            ]).astype(str))
+            if len(labels) == len(self.labels[gene]):
+                continue
+            newCodes = np.searchsorted(labels, self.labels[gene])
+            axis = dimensions.index(gene)
+            isPresent = self.coordinates[:, axis] >= 0
+            self.coordinates[isPresent, axis] = newCodes[self.coordinates[isPresent, axis]]
+            firstRows = np.full((len(self.files), len(labels)), -1, dtype=np.int64)
+            firstRows[:, newCodes] = self.firstRows[gene]
+            self.labels[gene] = labels
+            self.firstRows[gene] = firstRows
+
+    def countRows(self, fileNumber: int, firstRow: int, frame: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        # Coordinates of every row of a GA log from firstRow onwards that has a fitness, and whether its fitness is
+        # non-zero. Also notes the first row with non-zero fitness of every gene value of the run.
+        rows = frame.iloc[firstRow:]
+        rowNumbers = np.arange(firstRow, len(frame))
+        hasCoordinates = rows[['fitness', 'level', 'generation']].notna().all(axis=1).to_numpy()
+        rows = rows[hasCoordinates]
+        rowNumbers = rowNumbers[hasCoordinates]
+        isNonZeroFitness = rows['fitness'].to_numpy() > 0
+
+        coordinates = np.empty((len(rows), len(dimensions)), dtype=np.int64)
+        coordinates[:, 0] = fileNumber
+        coordinates[:, 1] = rows['level'].to_numpy()
+        coordinates[:, 2] = rows['generation'].to_numpy()
+        for gene in LogLoader.geneColumns:
+            categoryCodes = np.searchsorted(self.labels[gene], rows[gene].cat.categories.astype(str))
+            codes = rows[gene].cat.codes.to_numpy()
+            codes = np.where(codes >= 0, categoryCodes[codes], -1)
+            coordinates[:, dimensions.index(gene)] = codes
+
+            isFirstRowCandidate = isNonZeroFitness & (codes >= 0)
+            seenCodes, firstIndexes = np.unique(codes[isFirstRowCandidate], return_index=True)
+            firstRows = self.firstRows[gene][fileNumber]
+            isNewCode = firstRows[seenCodes] < 0
+            firstRows[seenCodes[isNewCode]] = rowNumbers[isFirstRowCandidate][firstIndexes[isNewCode]]
+        return coordinates, isNonZeroFitness
+
+    def getCodes(self, dimension: str, values) -> np.ndarray:
+        # Coordinates of labels of a dimension. Runs are labelled by file name. Labels that do not occur get a
+        # coordinate that no cell has.
+        values = np.atleast_1d(values)
+        if dimension == 'run':
+            return np.array(
+                [self.files.index(value) if value in self.files else -2 for value in values],
+                dtype=np.int64
+            )
+        if dimension in ('level', 'generation'):
+            return values.astype(np.int64)
+        labels = self.labels[dimension]
+        positions = np.minimum(np.searchsorted(labels, values.astype(str)), max(len(labels) - 1, 0))
+        isLabel = (len(labels) > 0) & (labels[positions] == values.astype(str))
+        return np.where(isLabel, positions, -2)
+
+    def getLabels(self, dimension: str, codes: np.ndarray):
+        if dimension == 'run':
+            runFiles = self.getRunFiles()
+            runCodes = np.array(
+                [runFiles.index(name) if name in runFiles else -1 for name in self.files],
+                dtype=np.int64
+            )
+            return pd.Categorical.from_codes(runCodes[codes], categories=runFiles)
+        if dimension in ('level', 'generation'):
+            return codes
+        return pd.Categorical.from_codes(codes, categories=self.labels[dimension])
+
+    def getRunFiles(self) -> list[str]:
+        # File names of the runs with counted rows, sorted like LogLoader.getLogFilesInFolder sorts them.
+        return sorted(name for name, rowCount in zip(self.files, self.rowCounts) if rowCount > 0)
+
+    def select(self, **selections) -> 'GeneTensor':
+        # The cells with the given labels in every selected dimension, e.g. select(level=3, component=['Grid']).
+        tensor = copy.copy(self)
+        isSelected = np.ones(len(self.coordinates), dtype=bool)
+        for dimension, values in selections.items():
+            isSelected &= np.isin(self.coordinates[:, dimensions.index(dimension)], self.getCodes(dimension, values))
+        tensor.coordinates = self.coordinates[isSelected]
+        tensor.counts = self.counts[isSelected]
+        tensor.nonZeroFitnessCounts = self.nonZeroFitnessCounts[isSelected]
+        return tensor
+
+    def getCellCounts(self, includeZeroFitness: bool = False) -> np.ndarray:
+        return self.counts if includeZeroFitness else self.nonZeroFitnessCounts
+
+    def sum(self, keptDimensions: list[str], includeZeroFitness: bool = False) -> pd.Series:
+        # Number of rows with every combination of labels of keptDimensions, summed over all other dimensions. Only
+        # rows with non-zero fitness are counted, unless includeZeroFitness is set, and only combinations that occur
+        # are included, sorted by run, level, generation and gene labels.
+        cellCounts = self.getCellCounts(includeZeroFitness)
+        isCounted = cellCounts > 0
+        axes = [dimensions.index(dimension) for dimension in keptDimensions]
+        coordinates, counts = sumCells(self.coordinates[isCounted][:, axes], cellCounts[isCounted])
+        return pd.Series(counts, index=pd.MultiIndex.from_arrays(
+            [self.getLabels(dimension, coordinates[:, axis]) for axis, dimension in enumerate(keptDimensions)],
+            names=keptDimensions
+        ))
+
+    def getCells(self, includeZeroFitness: bool = False) -> pd.DataFrame:
+        # One row per cell with its labels and number of rows, in the columns of Diversity.getTableFiles. level and
+        # generation are floats without zero fitness rows, same as the where filter leaves them there.
+        cellCounts = self.getCellCounts(includeZeroFitness)
+        isCounted = cellCounts > 0
+        coordinates = self.coordinates[isCounted]
+        coordinateType = np.int64 if includeZeroFitness else np.float64
+        cells = pd.DataFrame({
+            'generation': coordinates[:, dimensions.index('generation')].astype(coordinateType),
+            'level': coordinates[:, dimensions.index('level')].astype(coordinateType),
+            **{gene: self.getLabels(gene, coordinates[:, dimensions.index(gene)]) for gene in LogLoader.geneColumns},
+            'filename': self.getLabels('run', coordinates[:, 0]),
+            'count': cellCounts[isCounted],
+        })
+        LogLoader.addTGMColumns(cells)
+        return cells
+
+    def getCountPerRun(self, key: str, includeZeroFitness: bool = False) -> pd.Series:
+        # Same as Aggregation.countPerRun over the rows of Diversity.getTableFiles, for any of its columns.
+        cells = self.getCells(includeZeroFitness)
+        return cells.groupby(['level', 'generation', key, 'filename'], observed=True)['count'].sum().rename(None)
+
+    def getFirstSeenOrder(self, gene: str) -> list[str]:
+        # Values of a gene that occur in rows with non-zero fitness, in the order the rows of the GA logs of the folder
+        # would list them.
+        fileNumbers = [self.files.index(name) for name in self.getRunFiles()]
+        firstRows = self.firstRows[gene][fileNumbers]
+        seenCodes = np.flatnonzero((firstRows >= 0).any(axis=0))
+        firstRuns = np.argmax(firstRows[:, seenCodes] >= 0, axis=0)
+        order = np.lexsort((firstRows[firstRuns, seenCodes], firstRuns))
+        return self.labels[gene][seenCodes[order]].tolist()
+
+
+def makeGeneFrequencyTable(tensor: GeneTensor, includeZeroFitness: bool = False) -> pd.DataFrame:
+    # Number of rows with every value of every gene, and its share of the rows, for every level and generation,
+    # counted over all runs.
+    frames: list[pd.DataFrame] = []
+    for gene in LogLoader.geneColumns:
+        counts = tensor.sum(['level', 'generation', gene], includeZeroFitness)
+        totals = counts.groupby(level=[0, 1]).transform('sum')
+        frames.append(pd.DataFrame({
+            'level': counts.index.get_level_values(0),
+            'generation': counts.index.get_level_values(1),
+            'gene': gene,
+            'value': counts.index.get_level_values(2).astype(str),
+            'count': counts.to_numpy(),
+            '%': counts.to_numpy() / totals.to_numpy(),
+        }))
+    return pd.concat(frames, ignore_index=True).sort_values(['level', 'generation', 'gene'], kind='stable')
+
+
+def runAnalysis(tensor: GeneTensor, label: str, includeZeroFitness: bool = False, tablesOnly: bool = False):
+    makeGeneFrequencyTable(tensor, includeZeroFitness).to_csv(f'./data/gene frequencies {label}.csv', index=False)
+    # The TGM group tables and figures of Diversity, from the tensor instead of the rows.
+    tgmGroupCounts = tensor.getCountPerRun('TGMgroup', includeZeroFitness)
+    tgmGroups = sorted(tgmGroupCounts.index.unique('TGMgroup').to_list())
+    medianTGMGroupCountTable = Aggregation.medianCountTable(tgmGroupCounts)
+    medianTGMGroupCountTable.to_csv(f'./data/TGM median group types {label}.csv')
+    for level in Diversity.levels:
+        Diversity.makeTGMTypesTable(level, medianTGMGroupCountTable, tgmGroups, '%').to_csv(
+            f'./data/median TGM types level {level} {label}.csv',
+            index=False
+        )
+    if tablesOnly:
+        return
+    Diversity.renderFigure(
+        Diversity.makeTGMCategoriesPlot,
+        medianTGMGroupCountTable,
+        (tgmGroups,),
+        f'./plots/TGM groups level 3-4-5-6-8-9 {label}.png'
+    )
+    Diversity.renderFigure(
+        Diversity.makeTGMCategoriesAbsolutePlot,
+        medianTGMGroupCountTable,
+        (tgmGroups,),
+        f'./plots/TGM groups absolute level 3-4-5-6-8-9 {label}.png'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Update the gene tensor of a sweep and write its gene frequency and TGM group tables and figures.'
+    )
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    parser.add_argument('--include-zero-fitness', action='store_true')
+    parser.add_argument(
+        '--tables-only',
+        action='store_true',
+        help='only write the CSV files, without drawing any figures'
+    )
+    arguments = parser.parse_args()
+    folder = LogLoader.resolveFolder(arguments.folder)
+    os.makedirs('./data', exist_ok=True)
+    if not arguments.tables_only:
+        os.makedirs('./plots', exist_ok=True)
+        # Figures are only written to disk, never shown.
+        os.environ['MPLBACKEND'] = 'Agg'
+    runAnalysis(
+        GeneTensor.load(folder),
+        LogLoader.getLabel(folder, LogLoader.getLogFilesInFolder(folder)),
+        arguments.include_zero_fitness,
+        arguments.tables_only
+    )
@@ -0,0 +1,144 @@
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+from multiprocessing import util
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak RSS is left out of the report.
+    resource = None
+
+
+# Set to a folder to write a timing report of every analysis process to, or to 1 for ./profile/. Set
+# profileMemoryVariable as well to trace Python allocations, which makes pandas a lot slower.
+profileVariable: str = 'GA_ANALYSIS_PROFILE'
+profileMemoryVariable: str = 'GA_ANALYSIS_PROFILE_MEMORY'
+
+defaultOutputFolder: str = './profile/'
+
+disabledStage = contextlib.nullcontext()
+
+
+class Profile:
+    # Wall time, CPU time and memory of every stage that ran in this process, and the stack of stages that are
+    # running, so nested stages can be written as flame graph stacks.
+
+    def __init__(self, outputFolder: str, traceMemory: bool):
+        self.outputFolder = outputFolder
+        self.traceMemory = traceMemory
+        self.records: list[dict] = []
+        self.runningStages: list[dict] = []
+        if traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # multiprocessing runs its finalizers at exit of worker processes as well, where atexit handlers do not run.
+        util.Finalize(self, self.save, exitpriority=0)
+        util.register_after_fork(self, Profile.afterFork)
+
+    def afterFork(self):
+        # Forked worker processes start with a copy of the stages of their parent, and without its finalizers.
+        self.records = []
+        self.runningStages = []
+        util.Finalize(self, self.save, exitpriority=0)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, detail: str | None = None):
+        if self.traceMemory:
+            # Keep the peak of the enclosing stage before resetting the peak for this one.
+            if len(self.runningStages) > 0:
+                self.runningStages[-1]['tracedPeak'] = max(
+                    self.runningStages[-1]['tracedPeak'],
+                    tracemalloc.get_traced_memory()[1]
+                )
+            tracemalloc.reset_peak()
+        runningStage = {'name': name, 'tracedPeak': 0}
+        self.runningStages.append(runningStage)
+        startTime = time.time()
+        startWallTime = time.perf_counter()
+        startCPUTime = time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                'stage': name,
+                'detail': detail,
+                'stack': ';'.join(running['name'] for running in self.runningStages),
+                'startTime': startTime,
+                'wallSeconds': time.perf_counter() - startWallTime,
+                'cpuSeconds': time.process_time() - startCPUTime,
+                'maxRSSBytes': getMaxRSS(),
+                'tracedPeakBytes': None,
+            }
+            self.runningStages.pop()
+            if self.traceMemory:
+                record['tracedPeakBytes'] = max(runningStage['tracedPeak'], tracemalloc.get_traced_memory()[1])
+                if len(self.runningStages) > 0:
+                    self.runningStages[-1]['tracedPeak'] = max(
+                        self.runningStages[-1]['tracedPeak'],
+                        record['tracedPeakBytes']
+                    )
+            self.records.append(record)
+
+    def getFoldedStacks(self) -> list[str]:
+        # Self time of every stack in microseconds, in the folded format of flamegraph.pl and speedscope.
+        stackSeconds: dict[str, float] = {}
+        for record in self.records:
+            stackSeconds[record['stack']] = stackSeconds.get(record['stack'], 0.0) + record['wallSeconds']
+            parentStack = record['stack'].rpartition(';')[0]
+            if parentStack != '':
+                stackSeconds[parentStack] = stackSeconds.get(parentStack, 0.0) - record['wallSeconds']
+        return [f'{stack} {max(0, round(seconds * 1e6))}' for stack, seconds in stackSeconds.items()]
+
+    def save(self):
+        if len(self.records) == 0:
+            return
+        os.makedirs(self.outputFolder, exist_ok=True)
+        path = os.path.join(self.outputFolder, f'profile {os.getpid()}')
+        with open(f'{path}.json', 'w') as reportFile:
+            json.dump({
+                'pid': os.getpid(),
+                'argv': sys.argv,
+                'traceMemory': self.traceMemory,
+                'stages': self.records,
+            }, reportFile, indent=2)
+        with open(f'{path}.folded', 'w') as foldedFile:
+            foldedFile.write('\n'.join(self.getFoldedStacks()) + '\n')
+        self.records = []
+
+
+def getMaxRSS() -> int | None:
+    if resource is None:
+        return None
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return maxRSS if sys.platform == 'darwin' else maxRSS * 1024
+
+
+profile: Profile | None = None
+
+
+def enable(outputFolder: str = defaultOutputFolder, traceMemory: bool = False):
+    # Profile this process, and worker processes started after this, through the environment they inherit.
+    global profile
+    os.environ[profileVariable] = outputFolder
+    if traceMemory:
+        os.environ[profileMemoryVariable] = '1'
+    if profile is None or profile.outputFolder != outputFolder:
+        profile = Profile(outputFolder, traceMemory)
+
+
+def stage(name: str, detail: str | None = None):
+    # Context manager that records a named stage of an analysis when profiling is on, and does nothing otherwise.
+    if profile is None:
+        return disabledStage
+    return profile.stage(name, detail)
+
+
+if os.environ.get(profileVariable, '') not in ('', '0'):
+    enable(
+        defaultOutputFolder if os.environ[profileVariable] == '1' else os.environ[profileVariable],
+        os.environ.get(profileMemoryVariable, '') not in ('', '0')
+    )
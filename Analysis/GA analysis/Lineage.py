@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+import LogLoader
+
+
+class LineageGraph:
+    # Parent and child links between the chromosomes of a sweep. Every distinct chromosome id is a node, numbered in
+    # order of first appearance, and its parent is the node of its lineageId, or -1 for chromosomes of the first
+    # generation and parents outside of the sweep. The children of node i are
+    # children[childOffsets[i]:childOffsets[i + 1]].
+
+    def __init__(self, ids: pd.Index, parents: np.ndarray):
+        self.ids = ids
+        self.parents = parents
+        hasParent = parents >= 0
+        self.childOffsets = np.concatenate([[0], np.cumsum(np.bincount(parents[hasParent], minlength=len(ids)))])
+        self.children = np.flatnonzero(hasParent)[np.argsort(parents[hasParent], kind='stable')]
+        self.roots: np.ndarray | None = None
+        self.depths: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def fromRows(ids: pd.Series, lineageIds: pd.Series) -> tuple['LineageGraph', np.ndarray]:
+        # Graph of the chromosomes of a GA log table, and the node of every row. Elite chromosomes carry over to the
+        # next generation with the same id, so one node can belong to several rows.
+        rowNodes, nodeIds = pd.factorize(ids)
+        nodeIds = pd.Index(nodeIds)
+        rowParents = nodeIds.get_indexer(lineageIds.fillna(''))
+        parents = np.full(len(nodeIds), -1, dtype=np.int64)
+        # Take the parent of the first row of every node.
+        parents[rowNodes[::-1]] = rowParents[::-1]
+        # A chromosome is never its own parent.
+        parents[parents == np.arange(len(parents))] = -1
+        return LineageGraph(nodeIds, parents), rowNodes
+
+    def getNodes(self, ids) -> np.ndarray:
+        # Node of every id, -1 for ids that are not in the sweep.
+        return self.ids.get_indexer(ids)
+
+    def getChildren(self, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Children of every node, as (index into nodes, child) pairs.
+        nodes = np.asarray(nodes)
+        counts = self.childOffsets[nodes + 1] - self.childOffsets[nodes]
+        queryIndexes = np.repeat(np.arange(len(nodes)), counts)
+        # Position of every child within the children of its node.
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return queryIndexes, self.children[self.childOffsets[nodes][queryIndexes] + positions]
+
+    def getAncestors(self, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Ancestors of every node, nearest first, as (index into nodes, ancestor) pairs.
+        queryIndexes: list[np.ndarray] = []
+        ancestors: list[np.ndarray] = []
+        frontierIndexes = np.arange(len(nodes))
+        frontier = self.parents[np.asarray(nodes)]
+        while len(frontier) > 0:
+            hasParent = frontier >= 0
+            frontierIndexes = frontierIndexes[hasParent]
+            frontier = frontier[hasParent]
+            queryIndexes.append(frontierIndexes)
+            ancestors.append(frontier)
+            frontier = self.parents[frontier]
+        order = np.argsort(np.concatenate(queryIndexes), kind='stable')
+        return np.concatenate(queryIndexes)[order], np.concatenate(ancestors)[order]
+
+    def getDescendants(self, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Descendants of every node, generation by generation, as (index into nodes, descendant) pairs.
+        queryIndexes: list[np.ndarray] = []
+        descendants: list[np.ndarray] = []
+        frontierIndexes = np.arange(len(nodes))
+        frontier = np.asarray(nodes)
+        while len(frontier) > 0:
+            childIndexes, frontier = self.getChildren(frontier)
+            frontierIndexes = frontierIndexes[childIndexes]
+            queryIndexes.append(frontierIndexes)
+            descendants.append(frontier)
+        order = np.argsort(np.concatenate(queryIndexes), kind='stable')
+        return np.concatenate(queryIndexes)[order], np.concatenate(descendants)[order]
+
+    def getRootsAndDepths(self) -> tuple[np.ndarray, np.ndarray]:
+        # First ancestor and number of ancestors of every node. Pointer jumping halves the remaining distance to the
+        # root of every node in each step, so this takes a handful of passes over the nodes, however long the run.
+        if self.roots is None:
+            nodes = np.arange(len(self))
+            jumps = np.where(self.parents >= 0, self.parents, nodes)
+            depths = (self.parents >= 0).astype(np.int64)
+            while True:
+                nextJumps = jumps[jumps]
+                if np.array_equal(nextJumps, jumps):
+                    break
+                depths = depths + depths[jumps]
+                jumps = nextJumps
+            self.roots = jumps
+            self.depths = depths
+        return self.roots, self.depths
+
+    def getRoots(self) -> np.ndarray:
+        return self.getRootsAndDepths()[0]
+
+    def getDepths(self) -> np.ndarray:
+        return self.getRootsAndDepths()[1]
+
+
+def readLineage(files: list[str]) -> tuple[pd.DataFrame, LineageGraph]:
+    # GA log rows of a sweep with the lineage graph of their chromosomes. The node column holds the node of every row.
+    frames: list[pd.DataFrame] = []
+    for file in files:
+        frame = LogLoader.readLog(
+            file,
+            ['generation', 'level', 'lineageId', 'id', 'fitness', *LogLoader.geneColumns]
+        )
+        frame['filename'] = pd.Series(file.split('/')[-1], index=frame.index, dtype='category')
+        frames.append(frame)
+    rows = LogLoader.concatLogs(frames)
+    LogLoader.addTGMColumns(rows)
+    graph, rows['node'] = LineageGraph.fromRows(rows['id'], rows['lineageId'])
+    return rows.drop(columns=['id', 'lineageId']), graph
+
+
+def readLineageInFolder(path: str) -> tuple[pd.DataFrame, LineageGraph]:
+    return readLineage(LogLoader.getLogFilesInFolder(path))
+
+
+def survivingLineages(rows: pd.DataFrame, graph: LineageGraph) -> pd.Series:
+    # Number of first generation chromosomes that still have descendants (or themselves, as elite) in the population,
+    # for every level, generation and run.
+    rootRows = rows[['level', 'generation', 'filename']].assign(root=graph.getRoots()[rows['node'].to_numpy()])
+    return rootRows.groupby(['level', 'generation', 'filename'], observed=True)['root'].nunique()
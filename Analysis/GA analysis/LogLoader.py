@@ -0,0 +1,192 @@
+import glob
+import hashlib
+import os
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import Instrumentation
+
+
+# Genes of a TGMChromosome, in gene index order.
+geneColumns: list[str] = ['gameObject', 'component', 'componentField', 'modifier']
+
+# JSON encoded GoExplore archive and terminal trajectories. These make up the bulk of every GA log, but none of the
+# table analyses need them, so only read them when asked for explicitly.
+jsonColumns: list[str] = ['archive', 'terminalTrajectories']
+
+cacheFolderName: str = '.cache'
+
+# Bytes at the start and at the end of the part of a GA log that was read, that are hashed to tell a GA log that was
+# appended to from one that was rewritten.
+fingerprintBlockSize: int = 4096
+
+
+def getLogFilesInFolder(path: str) -> list[str]:
+    return sorted(glob.glob(f'{path}GA log *.csv'))
+
+
+def resolveFolder(folder: str) -> str:
+    # Accept both a path to a folder of GA logs and the commit hash of a folder in ./data/.
+    if not os.path.isdir(folder):
+        folder = os.path.join('.', 'data', folder)
+    return os.path.join(folder, '')
+
+
+def getLevelOfLogFile(file: str) -> int | None:
+    match = re.search(r' - level (\d+) - ', file.split('/')[-1])
+    return int(match.group(1)) if match else None
+
+
+def getLabel(folder: str, files: list[str]) -> str:
+    # Output files are named after the folder and the number of runs per level, e.g. "f9f6c53 40".
+    runsPerLevel = max(Counter(getLevelOfLogFile(file) for file in files).values(), default=0)
+    return f'{os.path.basename(os.path.normpath(folder))} {runsPerLevel}'
+
+
+def getCachePath(file: str) -> str:
+    # A cache file is only valid for the exact version of the GA log it was made from. Its name starts with a hash of
+    # the path of the log, followed by the modification time and size of the log at the time of caching.
+    fileStat = os.stat(file)
+    pathHash = hashlib.sha1(os.path.abspath(file).encode()).hexdigest()[:16]
+    return os.path.join(
+        os.path.dirname(file),
+        cacheFolderName,
+        f'{pathHash}-{fileStat.st_mtime_ns}-{fileStat.st_size}.parquet'
+    )
+
+
+def cacheLog(file: str) -> str:
+    cachePath = getCachePath(file)
+    if os.path.exists(cachePath):
+        return cachePath
+
+    os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+    # Remove cache files made from older versions of the same GA log.
+    pathHash = os.path.basename(cachePath).split('-')[0]
+    for staleCachePath in glob.glob(os.path.join(os.path.dirname(cachePath), f'{pathHash}-*.parquet')):
+        os.remove(staleCachePath)
+
+    with Instrumentation.stage('LogLoader.cacheLog', os.path.basename(file)):
+        frame = pd.read_csv(file)
+        # Write to a temporary file first, so other processes never read a half written cache file.
+        temporaryCachePath = f'{cachePath}.{os.getpid()}.tmp'
+        frame.to_parquet(temporaryCachePath, index=False)
+        os.replace(temporaryCachePath, cachePath)
+    return cachePath
+
+
+def fingerprintPrefix(file: str, size: int) -> int:
+    # Hash of the first and last block of the first size bytes of a file, as a signed 64 bit integer so it can be kept
+    # in an int64 array. Appending rows leaves it the same, while rewriting a GA log changes it, even when the new
+    # version is as large or larger.
+    with open(file, 'rb') as logFile:
+        head = logFile.read(min(size, fingerprintBlockSize))
+        logFile.seek(max(size - fingerprintBlockSize, 0))
+        tail = logFile.read(min(size, fingerprintBlockSize))
+    return int.from_bytes(hashlib.blake2b(head + tail, digest_size=8).digest(), 'little', signed=True)
+
+
+def isAppendedTo(file: str, size: int, fingerprint: int) -> bool:
+    # Whether the first size bytes of a GA log are still the ones that were fingerprinted, so only the bytes after
+    # them are new. False if the GA log was removed, shrank or was rewritten.
+    if not os.path.exists(file) or os.path.getsize(file) < size:
+        return False
+    return fingerprintPrefix(file, size) == fingerprint
+
+
+def readLog(file: str, columns: list[str] | None = None) -> pd.DataFrame:
+    with Instrumentation.stage('LogLoader.readLog', os.path.basename(file)):
+        frame = pd.read_parquet(cacheLog(file), columns=columns)
+        encodeGeneColumns(frame)
+    return frame
+
+
+def encodeGeneColumns(frame: pd.DataFrame):
+    # Only a handful of distinct game objects, components, fields and modifiers exist, so store genes as categoricals.
+    for column in geneColumns:
+        if column in frame:
+            frame[column] = frame[column].astype('category')
+
+
+def concatLogs(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    # Give each categorical column the same sorted categories in every frame, so the columns stay categorical after
+    # combining the frames and their integer codes mean the same thing throughout a sweep.
+    for column in frames[0].select_dtypes('category').columns:
+        categories = sorted(set().union(*[frame[column].cat.categories for frame in frames]))
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+# gameObject:
+# - player = PlayerAgent
+# - level = everything else
+# component:
+# - BoxCollider2D, CompositeCollider2D, EdgeCollider2D, TilemapCollider2D
+# - Grid
+# - PlayerController
+# - RigidBody2D
+# - Transform
+def getComponentType(component: str):
+    if 'Collider' in component:
+        return 'collider'
+    if 'Rigidbody' in component:
+        return 'rigidbody'
+    if 'Transform' in component:
+        return 'transform'
+    if 'Grid' in component:
+        return 'grid'
+    return 'other'
+
+
+def encodeStrings(values: np.ndarray, codes: np.ndarray) -> pd.Categorical:
+    # Categorical with sorted categories from a small array of strings and, for every row, the index of its string.
+    categories, categoryIndexes = np.unique(values, return_inverse=True)
+    return pd.Categorical.from_codes(categoryIndexes[codes], categories=categories)
+
+
+def mapCategories(column: pd.Series, function) -> pd.Series:
+    # Apply function once per category instead of once per row. Missing values are mapped as the string 'nan', same as
+    # applying function to column.astype(str) would.
+    values = np.array([function(category) for category in [*column.cat.categories.astype(str), 'nan']], dtype=object)
+    return pd.Series(encodeStrings(values, column.cat.codes.to_numpy()), index=column.index)
+
+
+def joinCategories(columns: list[pd.Series], separator: str) -> pd.Series:
+    # Same as joining column.astype(str) row by row, but only the distinct combinations of categories are joined.
+    combinedCodes = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        combinedCodes = combinedCodes * (len(column.cat.categories) + 1) + column.cat.codes.to_numpy() + 1
+    rowIndexes, uniqueCombinedCodes = pd.factorize(combinedCodes)
+
+    parts: list[np.ndarray] = []
+    for column in reversed(columns):
+        categoryCount = len(column.cat.categories) + 1
+        names = np.array(['nan', *column.cat.categories.astype(str)], dtype=object)
+        parts.insert(0, names[uniqueCombinedCodes % categoryCount])
+        uniqueCombinedCodes = uniqueCombinedCodes // categoryCount
+    values = np.array([separator.join(combination) for combination in zip(*parts)], dtype=object)
+    return pd.Series(encodeStrings(values, rowIndexes), index=columns[0].index)
+
+
+def addTGMColumns(frame: pd.DataFrame):
+    with Instrumentation.stage('LogLoader.addTGMColumns'):
+        encodeGeneColumns(frame)
+        frame['TGM'] = joinCategories([frame[column] for column in geneColumns], ',')
+        frame['gameObjectType'] = mapCategories(
+            frame['gameObject'],
+            lambda gameObject: 'player' if gameObject.startswith('Player') else 'level'
+        )
+        frame['componentType'] = mapCategories(frame['component'], getComponentType)
+        frame['TGMgroup'] = joinCategories([frame['gameObjectType'], frame['componentType']], '-')
+
+
+def getTGMGenes(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    # The genes of every distinct TGM in frames with TGM columns, one row per TGM. The gene columns keep the sorted
+    # categories of concatLogs, so their codes stand in for the gene values without splitting TGMs up again.
+    return concatLogs([
+        frame[['TGM', *geneColumns]].drop_duplicates('TGM').copy() for frame in frames
+    ]).drop_duplicates('TGM', ignore_index=True)
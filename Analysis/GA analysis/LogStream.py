@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+import Aggregation
+import LogLoader
+
+
+defaultChunkSize: int = 5000
+
+
+def addCounts(total: pd.Series | None, counts: pd.Series) -> pd.Series:
+    if total is None:
+        return counts
+    counts = pd.concat([total, counts])
+    return counts.groupby(level=list(range(counts.index.nlevels)), observed=True).sum()
+
+
+def countRows(frame: pd.DataFrame, keys: list[str]) -> pd.Series:
+    return frame.groupby(keys, observed=True).size()
+
+
+def histogramMedians(histogram: pd.Series) -> pd.Series:
+    # Median of every group of a histogram indexed by (*group, value), without expanding it back into rows. Gives the
+    # same floats as a groupby median over the original rows.
+    groupIndex, groupKeys = Aggregation.groupByIndexLevels(histogram.index, histogram.index.nlevels - 1)
+    values = histogram.index.get_level_values(-1).to_numpy(dtype=np.float64)
+    cumulativeCounts = np.cumsum(histogram.to_numpy())
+    sizes = np.bincount(groupIndex, weights=histogram.to_numpy(), minlength=len(groupKeys)).astype(np.int64)
+    starts = np.cumsum(sizes) - sizes
+    lower = values[np.searchsorted(cumulativeCounts, starts + (sizes - 1) // 2, side='right')]
+    upper = values[np.searchsorted(cumulativeCounts, starts + sizes // 2, side='right')]
+    return pd.Series(np.where(sizes % 2 == 1, lower, (lower + upper) / 2), index=groupKeys)
+
+
+def expandCounts(counts: pd.Series) -> pd.DataFrame:
+    # Turn counts back into one row per counted item.
+    frame = counts.index.to_frame(index=False)
+    return frame.loc[frame.index.repeat(counts.to_numpy())].reset_index(drop=True)
+
+
+def readLogChunks(file: str, chunkSize: int = defaultChunkSize):
+    return pd.read_csv(
+        file,
+        usecols=['generation', 'level', 'fitness', *LogLoader.geneColumns],
+        dtype={column: 'category' for column in LogLoader.geneColumns},
+        chunksize=chunkSize,
+    )
+
+
+class RunAccumulator:
+    # Per (level, generation) TGM counts and fitness histogram of a single run. These can keep growing while the GA
+    # log of the run is still being written.
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.counts: dict[str, pd.Series | None] = {'TGM': None, 'TGMgroup': None}
+        self.fitnessCounts: pd.Series | None = None
+        self.tgmGenes: pd.DataFrame | None = None
+        self.runSummary: pd.DataFrame | None = None
+
+    def addRows(self, frame: pd.DataFrame):
+        for key in self.counts:
+            self.counts[key] = addCounts(self.counts[key], countRows(frame, ['level', 'generation', key]))
+        self.fitnessCounts = addCounts(self.fitnessCounts, countRows(frame, ['level', 'generation', 'fitness']))
+        self.runSummary = None
+
+    def isEmpty(self) -> bool:
+        return self.fitnessCounts is None or len(self.fitnessCounts) == 0
+
+    def getRunSummary(self) -> pd.DataFrame:
+        if self.runSummary is None:
+            tgmCounts = self.counts['TGM']
+            runSummary = pd.DataFrame({
+                'nunique': tgmCounts.groupby(level=[0, 1]).size(),
+                'count': tgmCounts.groupby(level=[0, 1]).sum(),
+                'median': histogramMedians(self.fitnessCounts),
+            })
+            self.runSummary = pd.concat({self.filename: runSummary}, names=['filename']).reorder_levels([1, 2, 0])
+        return self.runSummary
+
+    def getCountPerRun(self, key: str) -> pd.Series:
+        return pd.concat({self.filename: self.counts[key]}, names=['filename']).reorder_levels([1, 2, 3, 0])
+
+
+class SweepAccumulator:
+    # Folds GA logs, one chunk of rows at a time, into the per run aggregates that Diversity and FitnessConsistency
+    # are made from. Peak memory is one chunk plus the aggregates, regardless of how many runs a sweep holds.
+
+    def __init__(self, includeZeroFitness: bool = False, chunkSize: int = defaultChunkSize):
+        self.includeZeroFitness = includeZeroFitness
+        self.chunkSize = chunkSize
+        self.runs: dict[str, RunAccumulator] = {}
+        self.fitnessCounts: pd.Series | None = None
+        self.tgmGenes: pd.DataFrame | None = None
+
+    def addChunk(self, filename: str, chunk: pd.DataFrame) -> pd.MultiIndex:
+        # Returns the (level, generation) pairs of the rows that were added to the run.
+        chunk = chunk.dropna(subset=['fitness'])
+        LogLoader.addTGMColumns(chunk)
+        # FitnessConsistency looks at zero fitness rows as well, so count these before filtering.
+        self.fitnessCounts = addCounts(self.fitnessCounts, countRows(chunk, ['level', 'TGM', 'fitness']))
+        self.tgmGenes = LogLoader.getTGMGenes([chunk] if self.tgmGenes is None else [self.tgmGenes, chunk])
+        # Filter in the same way as Diversity.getTableFilesInFolder, so the aggregates end up with the same types.
+        if not self.includeZeroFitness:
+            chunk = chunk.where(chunk['fitness'] > 0).dropna(subset=['fitness'])
+        if filename not in self.runs:
+            self.runs[filename] = RunAccumulator(filename)
+        self.runs[filename].addRows(chunk)
+        return pd.MultiIndex.from_frame(chunk[['level', 'generation']].drop_duplicates())
+
+    def addLog(self, file: str):
+        for chunk in readLogChunks(file, self.chunkSize):
+            self.addChunk(file.split('/')[-1], chunk)
+
+    def getRuns(self) -> list[RunAccumulator]:
+        return [run for run in self.runs.values() if not run.isEmpty()]
+
+    def getRunSummary(self) -> pd.DataFrame:
+        # Same as Aggregation.summariseRuns over the full table.
+        return pd.concat([run.getRunSummary() for run in self.getRuns()]).sort_index()
+
+    def getCountPerRun(self, key: str) -> pd.Series:
+        # Same as Aggregation.countPerRun over the full table.
+        return pd.concat([run.getCountPerRun(key) for run in self.getRuns()]).sort_index()
+
+    def getTGMGenes(self) -> pd.DataFrame:
+        # Same as LogLoader.getTGMGenes over the full table.
+        return self.tgmGenes
+
+    def getFitnessCounts(self) -> pd.Series:
+        # Number of rows with each fitness value, for every level and TGM, including zero fitness rows.
+        return self.fitnessCounts
+
+
+def streamFolder(path: str, includeZeroFitness: bool = False, chunkSize: int = defaultChunkSize) -> SweepAccumulator:
+    sweep = SweepAccumulator(includeZeroFitness, chunkSize)
+    for file in LogLoader.getLogFilesInFolder(path):
+        sweep.addLog(file)
+    return sweep
@@ -0,0 +1,151 @@
+import argparse
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+import pandas as pd
+
+import Aggregation
+import ComponentTypesCategories
+import Diversity
+import FitnessConsistency
+import GeneTensor
+import Instrumentation
+import LogLoader
+
+
+analyses: list[str] = ['diversity', 'fitnessConsistency', 'componentTypes']
+
+
+def aggregateDiversityLog(file: str) -> tuple[pd.DataFrame, pd.Series, pd.Series, pd.DataFrame]:
+    tables = Diversity.getTableFiles([file])
+    return (
+        Aggregation.summariseRuns(tables),
+        Aggregation.countPerRun(tables, 'TGM'),
+        Aggregation.countPerRun(tables, 'TGMgroup'),
+        LogLoader.getTGMGenes([tables]),
+    )
+
+
+def renderFitnessConsistencyLevel(files: list[str], level: int, label: str, tablesOnly: bool = False):
+    makeLevel = FitnessConsistency.makeTable if tablesOnly else FitnessConsistency.makePlot
+    makeLevel(level, Diversity.getTableFiles(files, True), label)
+
+
+def renderComponentTypes(folder: str, label: str, tablesOnly: bool = False):
+    # The gene tensor of the folder is saved, so later runs only count rows that were added since.
+    table, componentTypes = ComponentTypesCategories.makeTensorTable(GeneTensor.GeneTensor.load(folder))
+    table.to_csv(f'./data/component types {label}.csv', index=False)
+    if tablesOnly:
+        return
+    import matplotlib.pyplot as plt
+
+    fig = ComponentTypesCategories.makeFigure(table, componentTypes)
+    plt.tight_layout()
+    with Instrumentation.stage('savefig', f'component types level 3-4-5-6-8-9 {label}.png'):
+        fig.savefig(f'./plots/component types level 3-4-5-6-8-9 {label}.png')
+    plt.close(fig)
+
+
+def finishDiversity(runAggregateJobs: list, label: str) -> list[tuple]:
+    runAggregates = [job.result() for job in runAggregateJobs]
+    tables = Diversity.makeTables(
+        pd.concat([runAggregate[0] for runAggregate in runAggregates]).sort_index(),
+        pd.concat([runAggregate[1] for runAggregate in runAggregates]).sort_index(),
+        pd.concat([runAggregate[2] for runAggregate in runAggregates]).sort_index(),
+        LogLoader.getTGMGenes([runAggregate[3] for runAggregate in runAggregates]),
+    )
+    Diversity.saveTables(tables, label)
+    return Diversity.getFigureJobs(tables, label)
+
+
+def runFitnessConsistency(executor: Executor, files: list[str], label: str, tablesOnly: bool = False) -> list:
+    return [
+        executor.submit(
+            renderFitnessConsistencyLevel,
+            [file for file in files if LogLoader.getLevelOfLogFile(file) in (level, None)],
+            level,
+            label,
+            tablesOnly
+        )
+        for level in Diversity.levels
+    ]
+
+
+def run(folders: list[str], selectedAnalyses: list[str], workers: int | None = None, tablesOnly: bool = False):
+    # With tablesOnly only the CSV files are written, and matplotlib is never loaded.
+    os.makedirs('./data', exist_ok=True)
+    if not tablesOnly:
+        os.makedirs('./plots', exist_ok=True)
+        # Workers only write figures to disk, never show them. They inherit the backend through the environment.
+        os.environ['MPLBACKEND'] = 'Agg'
+    filesPerFolder = {folder: LogLoader.getLogFilesInFolder(folder) for folder in map(LogLoader.resolveFolder, folders)}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Convert every GA log to its columnar cache first, so no two workers parse the same CSV file.
+        list(executor.map(LogLoader.cacheLog, [file for files in filesPerFolder.values() for file in files]))
+
+        pendingJobs = []
+        diversityJobs: dict[str, list] = {}
+        for folder, files in filesPerFolder.items():
+            if len(files) == 0:
+                print(f'No GA logs found in {folder}')
+                continue
+            label = LogLoader.getLabel(folder, files)
+            if 'diversity' in selectedAnalyses:
+                diversityJobs[label] = [executor.submit(aggregateDiversityLog, file) for file in files]
+            if 'componentTypes' in selectedAnalyses:
+                pendingJobs.append(executor.submit(renderComponentTypes, folder, label, tablesOnly))
+            if 'fitnessConsistency' in selectedAnalyses:
+                pendingJobs.extend(runFitnessConsistency(executor, files, label, tablesOnly))
+
+        # Diversity figures can only be rendered once all runs of a folder are aggregated.
+        for label, runAggregateJobs in diversityJobs.items():
+            figureJobs = finishDiversity(runAggregateJobs, label)
+            if tablesOnly:
+                continue
+            for figureJob in figureJobs:
+                pendingJobs.append(executor.submit(Diversity.renderFigure, *figureJob))
+        for job in pendingJobs:
+            job.result()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run GA log analyses over several folders of runs in parallel.')
+    parser.add_argument(
+        'folders',
+        nargs='+',
+        help='folders with GA logs, or commit hashes of folders in ./data/'
+    )
+    parser.add_argument(
+        '--analyses',
+        nargs='+',
+        choices=analyses,
+        default=analyses,
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='number of worker processes, defaults to the number of CPUs'
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const=Instrumentation.defaultOutputFolder,
+        default=None,
+        help=f'write the time and memory of every stage of every process to a folder, '
+             f'{Instrumentation.defaultOutputFolder} if left out. Same as setting {Instrumentation.profileVariable}'
+    )
+    parser.add_argument(
+        '--profile-memory',
+        action='store_true',
+        help='trace Python allocations of every stage as well, which makes the analyses a lot slower'
+    )
+    parser.add_argument(
+        '--tables-only',
+        action='store_true',
+        help='only write the CSV files of the analyses, without drawing any figures'
+    )
+    arguments = parser.parse_args()
+    if arguments.profile is not None:
+        Instrumentation.enable(arguments.profile, arguments.profile_memory)
+    run(arguments.folders, arguments.analyses, arguments.workers, arguments.tables_only)
@@ -0,0 +1,308 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import Aggregation
+import LogLoader
+import TraceDecoder
+import TraceStore
+
+
+# Every breakdown of the distinct strategy counts that is written to ./data/, by the columns trajectories are grouped
+# by.
+breakdowns: list[list[str]] = [
+    ['level'],
+    ['level', 'generation'],
+]
+
+# Steps per shingle. Trajectories are at most GoExplore.maxTrajectoryLength = 30 steps, so short shingles keep enough of
+# them to compare paths that only share part of their route.
+shingleSize: int = 3
+
+# The MinHash signature of a trajectory is split into bands of rowsPerBand hashes. Two trajectories become candidates
+# when all hashes of a band are equal, which is likely above a Jaccard similarity of about
+# (1 / bands) ** (1 / rowsPerBand), 0.5 for the defaults.
+bands: int = 16
+rowsPerBand: int = 4
+
+# Lowest share of equal signature hashes, an estimate of the Jaccard similarity of their shingles, for candidates to be
+# counted as the same strategy.
+similarityThreshold: float = 0.5
+
+# Largest number of hashes to hold in memory at once.
+maxHashedValues: int = 2 ** 25
+
+# Odd multiplier of the polynomial hash of a window of steps, modulo 2 ** 64.
+hashBase = np.uint64(0x100000001B3)
+
+
+def mix(values: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer, which spreads every bit of a 64 bit value over all bits of its hash. Arithmetic wraps around
+    # modulo 2 ** 64.
+    values = np.asarray(values, dtype=np.uint64)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def encodeSteps(steps: np.ndarray) -> np.ndarray:
+    # Every step as one small integer of its action and the grid cell it ends in. Steps with an action outside of
+    # actionNames get a token of their own, and positions outside the level count as its nearest edge.
+    x = np.clip(steps['x'], 0, TraceDecoder.levelWidth - 1)
+    y = np.clip(steps['y'], 0, TraceDecoder.levelHeight - 1)
+    return (((steps['action'].astype(np.int16) + 1) * TraceDecoder.levelHeight + y) * TraceDecoder.levelWidth + x) \
+        .astype(np.int16)
+
+
+def hashWindows(tokens: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # Rolling polynomial hash of the tokens of every window, one step of all windows at a time.
+    hashes = np.zeros(len(starts), dtype=np.uint64)
+    for step in range(int(lengths.max(initial=0))):
+        isInWindow = step < lengths
+        stepTokens = tokens[np.minimum(starts + step, len(tokens) - 1)].astype(np.uint64) + np.uint64(1)
+        hashes = np.where(isInWindow, hashes * hashBase + stepTokens, hashes)
+    return mix(hashes ^ lengths.astype(np.uint64))
+
+
+def hashShingles(tokens: np.ndarray, offsets: np.ndarray, size: int = shingleSize) -> tuple[np.ndarray, np.ndarray]:
+    # Hashes of the overlapping windows of size steps of every trajectory, and the offsets of the windows of every
+    # trajectory. A trajectory shorter than size is one window.
+    lengths = np.diff(offsets)
+    windowCounts = np.maximum(lengths - size + 1, 1)
+    windowOffsets = np.concatenate([[0], np.cumsum(windowCounts)])
+    windowStarts = Aggregation.gatherRanges(offsets[:-1], offsets[:-1] + windowCounts)
+    windowLengths = np.repeat(np.minimum(lengths, size), windowCounts)
+    return hashWindows(tokens, windowStarts, windowLengths), windowOffsets
+
+
+def minHash(shingles: np.ndarray, shingleOffsets: np.ndarray, hashCount: int, seed: int = 0) -> np.ndarray:
+    # MinHash signature of the set of shingles of every trajectory: the smallest value of every one of hashCount
+    # independent hashes. The shingles are mixed already, so the upper 32 bits of a random odd multiplier times a
+    # shingle plus a random increment, modulo 2 ** 64, are enough of a hash. Every trajectory needs at least one
+    # shingle.
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(0, 2 ** 63, hashCount, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    increments = rng.integers(0, 2 ** 63, hashCount, dtype=np.uint64)
+    signatures = np.zeros((hashCount, len(shingleOffsets) - 1), dtype=np.uint32)
+    blockSize = max(1, maxHashedValues // max(len(shingles), 1))
+    for start in range(0, hashCount, blockSize):
+        hashes = multipliers[start:start + blockSize, np.newaxis] * shingles \
+            + increments[start:start + blockSize, np.newaxis]
+        signatures[start:start + blockSize] = np.minimum.reduceat(hashes, shingleOffsets[:-1], axis=1) >> np.uint64(32)
+    # One signature per row, so the hashes of a band or a pair of trajectories are next to each other.
+    return np.ascontiguousarray(signatures.T)
+
+
+def findCandidates(
+    signatures: np.ndarray,
+    groups: np.ndarray,
+    bandCount: int = bands,
+    bandRows: int = rowsPerBand
+) -> tuple[np.ndarray, np.ndarray]:
+    # Pairs of trajectories of the same group that have equal hashes in at least one band. Within every band,
+    # trajectories with the same band key are linked to the first of them, which connects them all without listing
+    # every pair.
+    firsts: list[np.ndarray] = []
+    seconds: list[np.ndarray] = []
+    groupKeys = mix(groups.astype(np.uint64))
+    for band in range(bandCount):
+        keys = mix(groupKeys ^ np.uint64(band))
+        for column in range(band * bandRows, (band + 1) * bandRows):
+            keys = mix(keys ^ signatures[:, column].astype(np.uint64))
+        order = np.argsort(keys, kind='stable')
+        sortedKeys = keys[order]
+        isFirst = np.ones(len(keys), dtype=bool)
+        isFirst[1:] = sortedKeys[1:] != sortedKeys[:-1]
+        groupFirsts = order[np.flatnonzero(isFirst)][np.cumsum(isFirst) - 1]
+        firsts.append(groupFirsts[~isFirst])
+        seconds.append(order[~isFirst])
+    pairs = np.unique(np.concatenate(firsts) * len(signatures) + np.concatenate(seconds))
+    return np.divmod(pairs, len(signatures))
+
+
+def estimateSimilarity(signatures: np.ndarray, firsts: np.ndarray, seconds: np.ndarray) -> np.ndarray:
+    # Share of equal signature hashes of every pair, a slice of the pairs at a time to bound memory.
+    similarities = np.zeros(len(firsts))
+    sliceSize = max(1, maxHashedValues // signatures.shape[1])
+    for start in range(0, len(firsts), sliceSize):
+        similarities[start:start + sliceSize] = (
+            signatures[firsts[start:start + sliceSize]] == signatures[seconds[start:start + sliceSize]]
+        ).mean(axis=1)
+    return similarities
+
+
+def connectComponents(count: int, firsts: np.ndarray, seconds: np.ndarray) -> np.ndarray:
+    # Connected component of every node of a graph, as the smallest node in it. Every pass hooks nodes onto the smallest
+    # label of their neighbours and then lets every node skip to the label of its label.
+    labels = np.arange(count)
+    while True:
+        linkedLabels = np.minimum(labels[firsts], labels[seconds])
+        hookedLabels = labels.copy()
+        np.minimum.at(hookedLabels, firsts, linkedLabels)
+        np.minimum.at(hookedLabels, seconds, linkedLabels)
+        hookedLabels = hookedLabels[hookedLabels]
+        if np.array_equal(hookedLabels, labels):
+            return labels
+        labels = hookedLabels
+
+
+def getTrajectoryTable(traces: TraceDecoder.SweepTraces) -> pd.DataFrame:
+    # Level, generation, run and row of every terminal trajectory, with the number of the trajectory within its row. The
+    # index is the number of the trajectory in traces.trajectories.steps.
+    trajectoryRows = np.zeros(len(traces.trajectories.steps), dtype=np.int64)
+    trajectoryRows[traces.trajectories.trajectories.items] = traces.trajectories.rowIndexes()
+    rowNumbers = traces.rows['row'] if 'row' in traces.rows \
+        else traces.rows.groupby('filename', observed=True).cumcount()
+    trajectoryNumbers = np.zeros(len(trajectoryRows), dtype=np.int64)
+    trajectoryNumbers[traces.trajectories.trajectories.items] = \
+        np.arange(len(traces.trajectories.trajectories.items)) \
+        - np.repeat(traces.trajectories.trajectories.offsets[:-1], traces.trajectories.trajectories.lengths())
+    return pd.DataFrame({
+        'level': traces.rows['level'].to_numpy()[trajectoryRows],
+        'generation': traces.rows['generation'].to_numpy()[trajectoryRows],
+        'filename': traces.rows['filename'].to_numpy()[trajectoryRows],
+        'row': np.asarray(rowNumbers)[trajectoryRows],
+        'trajectory': trajectoryNumbers,
+        'steps': traces.trajectories.lengths(),
+    })
+
+
+def clusterTrajectories(
+    traces: TraceDecoder.SweepTraces,
+    shingleSteps: int = shingleSize,
+    bandCount: int = bands,
+    bandRows: int = rowsPerBand,
+    threshold: float = similarityThreshold,
+    seed: int = 0
+) -> pd.DataFrame:
+    # The trajectory table with the distinct path and the strategy of every trajectory. Paths are the exact sequences of
+    # actions and cells, strategies the clusters of paths with similar shingles, both numbered within their level by
+    # how many trajectories take them. Trajectories of different levels never share a path or strategy.
+    table = getTrajectoryTable(traces)
+    table = table[table['steps'] > 0].copy()
+    if len(table) == 0:
+        return table.assign(path=pd.Series(dtype=np.int64), strategy=pd.Series(dtype=np.int64))
+    steps = traces.trajectories.steps
+    tokens = encodeSteps(steps.items)
+    starts = steps.offsets[:-1][table.index]
+    lengths = table['steps'].to_numpy()
+    levels = table['level'].to_numpy()
+
+    # Most trajectories repeat a path that was found before, so only hash the shingles of every distinct path once.
+    pathKeys = mix(hashWindows(tokens, starts, lengths) ^ mix(levels.astype(np.uint64)))
+    _, pathFirsts, paths = np.unique(pathKeys, return_index=True, return_inverse=True)
+    pathOffsets = np.concatenate([[0], np.cumsum(lengths[pathFirsts])])
+    pathTokens = tokens[Aggregation.gatherRanges(starts[pathFirsts], starts[pathFirsts] + lengths[pathFirsts])]
+    shingles, shingleOffsets = hashShingles(pathTokens, pathOffsets, shingleSteps)
+    signatures = minHash(shingles, shingleOffsets, bandCount * bandRows, seed)
+
+    firsts, seconds = findCandidates(signatures, levels[pathFirsts], bandCount, bandRows)
+    isSimilar = estimateSimilarity(signatures, firsts, seconds) >= threshold
+    strategies = connectComponents(len(pathFirsts), firsts[isSimilar], seconds[isSimilar])[paths]
+
+    table['path'] = rankWithinLevel(levels, paths)
+    table['strategy'] = rankWithinLevel(levels, strategies)
+    return table
+
+
+def rankWithinLevel(levels: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    # Number the labels of every level from 0, by descending number of trajectories and then by first occurrence.
+    _, firstIndexes, labelIndex, counts = np.unique(labels, return_index=True, return_inverse=True, return_counts=True)
+    order = np.lexsort((firstIndexes, -counts, levels[firstIndexes]))
+    sortedLevels = levels[firstIndexes][order]
+    isLevelStart = np.ones(len(order), dtype=bool)
+    isLevelStart[1:] = sortedLevels[1:] != sortedLevels[:-1]
+    levelStarts = np.flatnonzero(isLevelStart)
+    ranks = np.zeros(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - levelStarts[np.cumsum(isLevelStart) - 1]
+    return ranks[labelIndex]
+
+
+def makeStrategyTable(trajectoryTable: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    # Number of runs, rows and terminal trajectories, and of distinct paths and strategies among them, for every
+    # combination of values of keys.
+    table = trajectoryTable.groupby(keys).agg(
+        runs=('filename', 'nunique'),
+        trajectories=('trajectory', 'count'),
+        paths=('path', 'nunique'),
+        strategies=('strategy', 'nunique'),
+    )
+    table.insert(1, 'rows', trajectoryTable.drop_duplicates(['filename', 'row']).groupby(keys).size())
+    return table.reset_index()
+
+
+def makeRepresentativeTable(trajectoryTable: pd.DataFrame, traces: TraceDecoder.SweepTraces) -> pd.DataFrame:
+    # Every strategy of every level with its size, and the path most trajectories of it take as its representative.
+    strategyColumns = ['level', 'strategy']
+    table = trajectoryTable.groupby(strategyColumns).agg(
+        trajectories=('path', 'count'),
+        paths=('path', 'nunique'),
+        runs=('filename', 'nunique'),
+        firstGeneration=('generation', 'min'),
+    )
+    # Paths are numbered by descending number of trajectories, so the smallest path of a strategy is its most common.
+    representatives = trajectoryTable.sort_values([*strategyColumns, 'path']).groupby(strategyColumns).head(1)
+    representativeSteps = [traces.trajectories.steps[index] for index in representatives.index]
+    representatives = representatives.set_index(strategyColumns)
+    for column in ['filename', 'row', 'trajectory', 'generation', 'steps']:
+        table[f'representative {column}'] = representatives[column]
+    table['actions'] = [
+        ' '.join(TraceDecoder.actionNames[action] if action >= 0 else '?' for action in trajectorySteps['action'])
+        for trajectorySteps in representativeSteps
+    ]
+    table['cells'] = [
+        ' '.join(f'{x},{y}' for x, y in zip(trajectorySteps['x'], trajectorySteps['y']))
+        for trajectorySteps in representativeSteps
+    ]
+    return table.reset_index()
+
+
+def getStrategyPath(keys: list[str], label: str) -> str:
+    return f'./data/solution strategies {" ".join(keys)} {label}.csv'
+
+
+def runAnalysis(
+    traces: TraceDecoder.SweepTraces,
+    label: str = 'f9f6c53 40',
+    shingleSteps: int = shingleSize,
+    bandCount: int = bands,
+    bandRows: int = rowsPerBand,
+    threshold: float = similarityThreshold,
+    seed: int = 0
+):
+    trajectoryTable = clusterTrajectories(traces, shingleSteps, bandCount, bandRows, threshold, seed)
+    for keys in breakdowns:
+        makeStrategyTable(trajectoryTable, keys).to_csv(getStrategyPath(keys, label), index=False)
+    makeRepresentativeTable(trajectoryTable, traces) \
+        .to_csv(f'./data/solution strategy clusters {label}.csv', index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Cluster the terminal trajectories of a sweep into distinct solution strategies.'
+    )
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    parser.add_argument('--shingle-size', type=int, default=shingleSize, help='steps per shingle')
+    parser.add_argument('--bands', type=int, default=bands)
+    parser.add_argument('--rows-per-band', type=int, default=rowsPerBand)
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=similarityThreshold,
+        help='lowest estimated Jaccard similarity of the shingles of two paths of the same strategy'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args()
+    folder = LogLoader.resolveFolder(arguments.folder)
+    os.makedirs('./data', exist_ok=True)
+    runAnalysis(
+        TraceStore.TraceStore.open(folder).getTraces(),
+        LogLoader.getLabel(folder, LogLoader.getLogFilesInFolder(folder)),
+        arguments.shingle_size,
+        arguments.bands,
+        arguments.rows_per_band,
+        arguments.threshold,
+        arguments.seed,
+    )
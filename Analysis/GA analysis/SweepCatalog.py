@@ -0,0 +1,206 @@
+import argparse
+import glob
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+import LogLoader
+
+
+catalogPath: str = './data/catalog.sqlite'
+
+# Same as the GA log file name of MechanicMiner.RunEvolution.
+logFileNamePattern = re.compile(
+    r'^GA log (?P<timestamp>[\d-]+-T-[\d-]+) - (?P<commit>\w+) - level (?P<level>\d+) - '
+    r'population (?P<population>\d+) \((?P<elitePercentage>\d+) % elite selection\)\.csv$'
+)
+
+# MechanicMiner always writes 10 % elite selection in the file name, so the elite selection tuning sweeps record the
+# actual percentage in their folder name instead, e.g. "bb27b9d 25p elite".
+eliteFolderPattern = re.compile(r'(\d+)p elite')
+
+columns: list[tuple[str, str]] = [
+    ('path', 'TEXT PRIMARY KEY'),
+    ('folder', 'TEXT'),
+    ('timestamp', 'TEXT'),
+    ('commitHash', 'TEXT'),
+    ('level', 'INTEGER'),
+    ('population', 'INTEGER'),
+    ('elitePercentage', 'INTEGER'),
+    ('size', 'INTEGER'),
+    ('modificationTime', 'INTEGER'),
+    ('rowCount', 'INTEGER'),
+    ('firstGeneration', 'INTEGER'),
+    ('lastGeneration', 'INTEGER'),
+    ('nonZeroFitnessCount', 'INTEGER'),
+    ('maxFitness', 'REAL'),
+    ('medianNonZeroFitness', 'REAL'),
+    ('TGMCount', 'INTEGER'),
+    ('nonZeroFitnessTGMCount', 'INTEGER'),
+]
+
+
+def connect(path: str = catalogPath) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    connection.execute(f'CREATE TABLE IF NOT EXISTS logs ({", ".join(f"{name} {type}" for name, type in columns)})')
+    for column in ['commitHash', 'level', 'population']:
+        connection.execute(f'CREATE INDEX IF NOT EXISTS logs{column} ON logs ({column})')
+    return connection
+
+
+def parseLogPath(file: str) -> dict:
+    # Run parameters of a GA log from its file and folder name. Parameters of files that are not named like a GA log
+    # are None.
+    folder = os.path.basename(os.path.dirname(os.path.abspath(file)))
+    match = logFileNamePattern.match(os.path.basename(file))
+    parameters = {
+        'folder': folder,
+        'timestamp': None,
+        'commitHash': None,
+        'level': None,
+        'population': None,
+        'elitePercentage': None,
+    }
+    if match is not None:
+        parameters.update(
+            timestamp=pd.to_datetime(match['timestamp'], format='%Y-%m-%d-T-%H-%M-%S').isoformat(),
+            commitHash=match['commit'],
+            level=int(match['level']),
+            population=int(match['population']),
+            elitePercentage=int(match['elitePercentage']),
+        )
+    eliteMatch = eliteFolderPattern.search(folder)
+    if eliteMatch is not None:
+        parameters['elitePercentage'] = int(eliteMatch.group(1))
+    return parameters
+
+
+def summariseLog(file: str) -> dict:
+    frame = LogLoader.readLog(file, ['generation', 'fitness', *LogLoader.geneColumns])
+    LogLoader.addTGMColumns(frame)
+    isNonZeroFitness = frame['fitness'] > 0
+    return {
+        'rowCount': len(frame),
+        'firstGeneration': int(frame['generation'].min()) if len(frame) > 0 else None,
+        'lastGeneration': int(frame['generation'].max()) if len(frame) > 0 else None,
+        'nonZeroFitnessCount': int(isNonZeroFitness.sum()),
+        'maxFitness': float(frame['fitness'].max()) if len(frame) > 0 else None,
+        'medianNonZeroFitness': float(frame['fitness'][isNonZeroFitness].median()) if isNonZeroFitness.any() else None,
+        'TGMCount': frame['TGM'].nunique(),
+        'nonZeroFitnessTGMCount': frame['TGM'][isNonZeroFitness].nunique(),
+    }
+
+
+def updateCatalog(root: str = './data/', path: str = catalogPath) -> int:
+    # Add every GA log below root to the catalog, and update the entries of GA logs that changed since. Entries of
+    # GA logs below root that no longer exist are removed. Returns the number of GA logs that were read.
+    files = sorted(glob.glob(os.path.join(glob.escape(root), '**', 'GA log *.csv'), recursive=True))
+    absolutePaths = {os.path.abspath(file): file for file in files}
+    readCount = 0
+    with connect(path) as connection:
+        catalogued = {
+            cataloguedPath: (size, modificationTime)
+            for cataloguedPath, size, modificationTime
+            in connection.execute('SELECT path, size, modificationTime FROM logs')
+            if cataloguedPath.startswith(os.path.join(os.path.abspath(root), ''))
+        }
+        connection.executemany(
+            'DELETE FROM logs WHERE path = ?',
+            [(cataloguedPath,) for cataloguedPath in catalogued if cataloguedPath not in absolutePaths]
+        )
+        for absolutePath, file in absolutePaths.items():
+            fileStat = os.stat(file)
+            if catalogued.get(absolutePath) == (fileStat.st_size, fileStat.st_mtime_ns):
+                continue
+            entry = {
+                'path': absolutePath,
+                **parseLogPath(file),
+                'size': fileStat.st_size,
+                'modificationTime': fileStat.st_mtime_ns,
+                **summariseLog(file),
+            }
+            connection.execute(
+                f'INSERT OR REPLACE INTO logs ({", ".join(entry)}) VALUES ({", ".join("?" * len(entry))})',
+                list(entry.values())
+            )
+            readCount += 1
+    connection.close()
+    return readCount
+
+
+def queryLogs(
+    commit: str | None = None,
+    levels: list[int] | None = None,
+    population: int | None = None,
+    elitePercentage: int | None = None,
+    folder: str | None = None,
+    path: str = catalogPath
+) -> pd.DataFrame:
+    # Catalog entries of the GA logs with the given run parameters, ordered by path. Parameters that are None match
+    # every GA log.
+    conditions: list[str] = []
+    values: list = []
+    for column, value in [
+        ('commitHash', commit),
+        ('population', population),
+        ('elitePercentage', elitePercentage),
+        ('folder', folder),
+    ]:
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            values.append(value)
+    if levels is not None:
+        conditions.append(f'level IN ({", ".join("?" * len(levels))})')
+        values.extend(levels)
+    connection = connect(path)
+    try:
+        return pd.read_sql_query(
+            f'SELECT * FROM logs {"WHERE " + " AND ".join(conditions) if conditions else ""} ORDER BY path',
+            connection,
+            params=values
+        )
+    finally:
+        connection.close()
+
+
+def selectLogFiles(*arguments, **keywordArguments) -> list[str]:
+    # Paths of the GA logs that match queryLogs, to pass to the analyses in place of LogLoader.getLogFilesInFolder.
+    return queryLogs(*arguments, **keywordArguments)['path'].tolist()
+
+
+def parseLevels(values: list[str]) -> list[int]:
+    # Levels as numbers and inclusive ranges, e.g. 3-9.
+    levels: list[int] = []
+    for value in values:
+        first, _, last = value.partition('-')
+        levels.extend(range(int(first), int(last or first) + 1))
+    return levels
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Catalog the GA logs in ./data/ and select runs by their parameters.')
+    parser.add_argument('--update', action='store_true', help='add new and changed GA logs to the catalog first')
+    parser.add_argument('--root', default='./data/', help='folder to look for GA logs in when updating')
+    parser.add_argument('--commit', default=None)
+    parser.add_argument('--levels', nargs='+', default=None, help='levels and level ranges, e.g. 3-9')
+    parser.add_argument('--population', type=int, default=None)
+    parser.add_argument('--elite', type=int, default=None, help='elite selection percentage')
+    parser.add_argument('--folder', default=None, help='name of the folder the GA logs are in')
+    parser.add_argument('--paths', action='store_true', help='only print the paths of the selected GA logs')
+    arguments = parser.parse_args()
+
+    if arguments.update:
+        print(f'read {updateCatalog(arguments.root)} GA logs')
+    selectedLogs = queryLogs(
+        arguments.commit,
+        parseLevels(arguments.levels) if arguments.levels is not None else None,
+        arguments.population,
+        arguments.elite,
+        arguments.folder,
+    )
+    if arguments.paths:
+        print('\n'.join(selectedLogs['path']))
+    else:
+        print(selectedLogs.drop(columns=['path', 'size', 'modificationTime']).to_string(index=False))
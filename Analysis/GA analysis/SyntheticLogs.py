@@ -0,0 +1,226 @@
+import argparse
+import os
+import uuid
+import zlib
+
+import numpy as np
+import orjson
+import pandas as pd
+
+import TraceDecoder
+
+
+# TGMs to draw genes from, as (gameObject, component, componentField, fieldType).
+tgmPool: list[tuple[str, str, str, str]] = [
+    ('PlayerAgent', 'UnityEngine.Rigidbody2D', 'mass', 'System.Single'),
+    ('PlayerAgent', 'UnityEngine.Rigidbody2D', 'gravityScale', 'System.Single'),
+    ('PlayerAgent', 'UnityEngine.Rigidbody2D', 'drag', 'System.Single'),
+    ('PlayerAgent', 'UnityEngine.Rigidbody2D', 'velocity', 'UnityEngine.Vector2'),
+    ('PlayerAgent', 'UnityEngine.Rigidbody2D', 'freezeRotation', 'System.Boolean'),
+    ('PlayerAgent', 'PlayerController', 'jumpForce', 'System.Single'),
+    ('PlayerAgent', 'PlayerController', 'moveSpeed', 'System.Single'),
+    ('PlayerAgent', 'UnityEngine.BoxCollider2D', 'isTrigger', 'System.Boolean'),
+    ('PlayerAgent', 'UnityEngine.BoxCollider2D', 'size', 'UnityEngine.Vector2'),
+    ('PlayerAgent', 'UnityEngine.BoxCollider2D', 'offset', 'UnityEngine.Vector2'),
+    ('PlayerAgent', 'UnityEngine.Transform', 'localScale', 'UnityEngine.Vector3'),
+    ('PlayerAgent', 'UnityEngine.Transform', 'rotation', 'UnityEngine.Quaternion'),
+    ('Level', 'UnityEngine.Grid', 'cellSize', 'UnityEngine.Vector3'),
+    ('Level', 'UnityEngine.Grid', 'cellGap', 'UnityEngine.Vector3'),
+    ('Level', 'UnityEngine.Grid', 'cellLayout', 'UnityEngine.GridLayout+CellLayout'),
+    ('Level/Tilemap', 'UnityEngine.Tilemaps.TilemapCollider2D', 'isTrigger', 'System.Boolean'),
+    ('Level/Tilemap', 'UnityEngine.Tilemaps.TilemapCollider2D', 'usedByComposite', 'System.Boolean'),
+    ('Level/Tilemap', 'UnityEngine.CompositeCollider2D', 'isTrigger', 'System.Boolean'),
+    ('Level/Tilemap', 'UnityEngine.CompositeCollider2D', 'offset', 'UnityEngine.Vector2'),
+    ('Level/Tilemap', 'UnityEngine.Transform', 'localScale', 'UnityEngine.Vector3'),
+    ('Level/Tilemap', 'UnityEngine.Transform', 'position', 'UnityEngine.Vector3'),
+]
+
+# Same as ToggleableGameMechanic.GetValidModifiersForType.
+modifiersPerFieldType: dict[str, list[str]] = {
+    'System.Boolean': ['invert'],
+    'UnityEngine.GridLayout+CellLayout': ['add', 'subtract'],
+}
+allModifiers: list[str] = ['double', 'half', 'invert', 'add', 'subtract']
+
+columns: list[str] = [
+    'generation', 'level', 'levelSeed', 'lineageId', 'id', 'hash', 'fitness', 'gameObject', 'component',
+    'componentField', 'modifier', 'fieldType', 'iterations', 'archiveLength', 'archive', 'terminalTrajectories',
+]
+
+
+def getLogFileName(timestamp: pd.Timestamp, commit: str, level: int, population: int) -> str:
+    # Same as MechanicMiner.RunEvolution.
+    return f'GA log {timestamp:%Y-%m-%d-T-%H-%M-%S} - {commit} - level {level} - population {population} ' \
+           f'(10 % elite selection).csv'
+
+
+def getHash(tgm: tuple) -> int:
+    # Stands in for TGMChromosome.GetHashCode, which is the same for the same genes.
+    return int(np.int32(np.uint32(zlib.crc32(','.join(tgm).encode()))))
+
+
+def getModifier(rng: np.random.Generator, tgm: tuple) -> str:
+    validModifiers = modifiersPerFieldType.get(tgm[3], allModifiers)
+    return validModifiers[int(rng.integers(0, len(validModifiers)))]
+
+
+def getReward(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    # GoExplore rewards progress towards the level exit on the right.
+    return x + y * 0.1
+
+
+def makeArchive(rng: np.random.Generator, cellCount: int) -> str:
+    x = rng.integers(0, TraceDecoder.levelWidth, cellCount)
+    y = rng.integers(0, TraceDecoder.levelHeight, cellCount)
+    timesSeen = rng.integers(1, 60, cellCount)
+    return orjson.dumps([
+        {
+            'reward': float(reward),
+            'x': int(cellX),
+            'y': int(cellY),
+            'hash': int(cellX * 1000 + cellY),
+            'timesChosen': int(rng.integers(0, seen + 1)),
+            'timesSeen': int(seen),
+        }
+        for reward, cellX, cellY, seen in zip(getReward(x, y), x, y, timesSeen)
+    ]).decode()
+
+
+def makeTrajectories(rng: np.random.Generator, trajectoryCount: int, maxLength: int = 30) -> str:
+    trajectories = []
+    for _ in range(trajectoryCount):
+        length = int(rng.integers(2, maxLength + 1))
+        actions = rng.integers(0, len(TraceDecoder.actionNames), length)
+        x = np.clip(np.cumsum(rng.integers(-1, 3, length)), 0, TraceDecoder.levelWidth - 1)
+        y = np.clip(np.cumsum(rng.integers(-1, 2, length)), 0, TraceDecoder.levelHeight - 1)
+        startX = np.concatenate([[0], x[:-1]])
+        startY = np.concatenate([[0], y[:-1]])
+        trajectories.append([
+            {
+                'reward': float(reward),
+                'isTerminal': step == length - 1,
+                'action': TraceDecoder.actionNames[action],
+                'x': int(stepX),
+                'y': int(stepY),
+                'hash': int(stepX * 1000 + stepY),
+                'startX': int(stepStartX),
+                'startY': int(stepStartY),
+            }
+            for step, (reward, action, stepX, stepY, stepStartX, stepStartY)
+            in enumerate(zip(getReward(x, y), actions, x, y, startX, startY))
+        ])
+    return orjson.dumps(trajectories).decode()
+
+
+def makeRun(
+    rng: np.random.Generator,
+    level: int,
+    generations: int,
+    population: int,
+    archiveSize: int,
+    trajectoryCount: int
+) -> pd.DataFrame:
+    # One run of the GA, with 10 % elite selection. Only TGMs that find the level exit get a non-zero fitness and
+    # terminal trajectories, and these get more common as the run goes on.
+    eliteCount = max(1, population // 10)
+    tgms = [tgmPool[index] for index in rng.integers(0, len(tgmPool), population)]
+    modifiers = [getModifier(rng, tgm) for tgm in tgms]
+    ids = [''] * population
+    rows = []
+    for generation in range(1, generations + 1):
+        solveChance = 0.3 + 0.4 * generation / generations
+        fitness = np.where(
+            rng.random(population) < solveChance,
+            np.round(rng.uniform(0.05, 1, population), int(rng.integers(1, 4))),
+            0.0
+        )
+        newIds = [str(uuid.UUID(int=int(rng.integers(0, 2 ** 63)))) for _ in range(population)]
+        for index in range(population):
+            tgm = (*tgms[index][:3], modifiers[index])
+            cellCount = max(1, int(rng.poisson(archiveSize)))
+            rows.append({
+                'generation': generation,
+                'level': level,
+                'levelSeed': 0,
+                'lineageId': ids[index],
+                'id': newIds[index],
+                'hash': getHash(tgm),
+                'fitness': fitness[index],
+                'gameObject': tgm[0],
+                'component': tgm[1],
+                'componentField': tgm[2],
+                'modifier': tgm[3],
+                'fieldType': tgms[index][3],
+                'iterations': int(rng.integers(10, 200)),
+                'archiveLength': cellCount,
+                'archive': makeArchive(rng, cellCount),
+                'terminalTrajectories': makeTrajectories(rng, trajectoryCount if fitness[index] > 0 else 0),
+            })
+
+        # The elite carries over, the rest of the next generation descends from a fitness weighted parent and half
+        # of these get their field and modifier genes mutated, like UniformMutation in MechanicMiner.
+        order = np.argsort(-fitness, kind='stable')
+        weights = fitness + 0.01
+        parents = [*order[:eliteCount], *rng.choice(population, population - eliteCount, p=weights / weights.sum())]
+        nextTGMs = []
+        nextModifiers = []
+        for child, parent in enumerate(parents):
+            tgm = tgms[parent]
+            modifier = modifiers[parent]
+            if child >= eliteCount and rng.random() < 0.5:
+                fields = [candidate for candidate in tgmPool if candidate[:2] == tgm[:2]]
+                tgm = fields[int(rng.integers(0, len(fields)))]
+                modifier = getModifier(rng, tgm)
+            nextTGMs.append(tgm)
+            nextModifiers.append(modifier)
+        tgms, modifiers = nextTGMs, nextModifiers
+        ids = [newIds[parent] for parent in parents]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def writeSweep(
+    folder: str,
+    runs: int = 4,
+    levels: list[int] | None = None,
+    generations: int = 15,
+    population: int = 100,
+    archiveSize: int = 40,
+    trajectoryCount: int = 2,
+    seed: int = 0,
+    commit: str = 'f9f6c53'
+) -> list[str]:
+    # A folder of GA logs laid out like ./data/<commit>/, one log per run and level. archiveSize is the mean number
+    # of archive cells per row, trajectoryCount the number of terminal trajectories of every row with a fitness.
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for run in range(runs):
+        timestamp = pd.Timestamp('2024-01-01T10:00:00') + pd.Timedelta(hours=run)
+        for level in levels if levels is not None else [3, 4, 5, 6, 8, 9]:
+            file = os.path.join(folder, getLogFileName(timestamp, commit, level, population))
+            makeRun(rng, level, generations, population, archiveSize, trajectoryCount).to_csv(file, index=False)
+            files.append(file)
+    return files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a folder of synthetic GA logs.')
+    parser.add_argument('folder')
+    parser.add_argument('--runs', type=int, default=4, help='runs per level')
+    parser.add_argument('--levels', type=int, nargs='+', default=[3, 4, 5, 6, 8, 9])
+    parser.add_argument('--generations', type=int, default=15)
+    parser.add_argument('--population', type=int, default=100)
+    parser.add_argument('--archive-size', type=int, default=40, help='mean number of archive cells per row')
+    parser.add_argument('--trajectories', type=int, default=2, help='terminal trajectories per row with a fitness')
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args()
+    writeSweep(
+        arguments.folder,
+        arguments.runs,
+        arguments.levels,
+        arguments.generations,
+        arguments.population,
+        arguments.archive_size,
+        arguments.trajectories,
+        arguments.seed,
+    )
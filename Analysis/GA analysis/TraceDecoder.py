@@ -0,0 +1,261 @@
+import numpy as np
+import orjson
+import pandas as pd
+
+import LogLoader
+
+
+# SimulationInstance.actionSpaceNames, in action index order. Steps with an action outside of it are written with an
+# empty action name and decoded as action -1.
+actionNames: list[str] = ['MOVE_LEFT', 'MOVE_RIGHT', 'JUMP', 'SPECIAL', 'DO_NOTHING']
+
+# Size of every level in grid cells, same as levelSize in the trace visualisation.
+levelWidth: int = 18
+levelHeight: int = 12
+
+# GoExplore.Cell as written to the archive column.
+cellType = np.dtype([
+    ('x', np.int32),
+    ('y', np.int32),
+    ('reward', np.float64),
+    ('hash', np.int32),
+    ('timesChosen', np.int32),
+    ('timesSeen', np.int32),
+])
+
+# SimulationInstance.StepResult as written to the terminalTrajectories column.
+stepType = np.dtype([
+    ('x', np.int32),
+    ('y', np.int32),
+    ('startX', np.int32),
+    ('startY', np.int32),
+    ('action', np.int8),
+    ('reward', np.float64),
+    ('isTerminal', np.bool_),
+    ('hash', np.int32),
+])
+
+
+class RaggedArray:
+    # Items of many rows in one flat structured array. The items of row i are items[offsets[i]:offsets[i + 1]].
+
+    def __init__(self, items: np.ndarray, offsets: np.ndarray):
+        self.items = items
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        return self.items[self.offsets[row]:self.offsets[row + 1]]
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def rowIndexes(self) -> np.ndarray:
+        # Row of every item.
+        return np.repeat(np.arange(len(self)), self.lengths())
+
+    @staticmethod
+    def concat(arrays: list['RaggedArray']) -> 'RaggedArray':
+        itemCounts = np.cumsum([0, *[len(array.items) for array in arrays]])
+        return RaggedArray(
+            np.concatenate([array.items for array in arrays]),
+            np.concatenate([[0], *[array.offsets[1:] + itemCount for array, itemCount in zip(arrays, itemCounts)]]),
+        )
+
+
+class Trajectories:
+    # Terminal trajectories of many rows. steps holds the steps of every trajectory, and trajectories the indexes of
+    # the trajectories of every row.
+
+    def __init__(self, steps: RaggedArray, trajectories: RaggedArray):
+        self.steps = steps
+        self.trajectories = trajectories
+
+    def __len__(self) -> int:
+        return len(self.trajectories)
+
+    def __getitem__(self, row: int) -> list[np.ndarray]:
+        return [self.steps[trajectory] for trajectory in self.trajectories[row]]
+
+    def lengths(self) -> np.ndarray:
+        # Number of steps of every trajectory.
+        return self.steps.lengths()
+
+    def rowIndexes(self) -> np.ndarray:
+        # Row of every trajectory.
+        return self.trajectories.rowIndexes()
+
+    def stepRowIndexes(self) -> np.ndarray:
+        # Row of every step.
+        return np.repeat(self.rowIndexes(), self.lengths())
+
+    @staticmethod
+    def concat(trajectories: list['Trajectories']) -> 'Trajectories':
+        steps = RaggedArray.concat([trajectory.steps for trajectory in trajectories])
+        trajectoryCounts = np.cumsum([0, *[len(trajectory.steps) for trajectory in trajectories]])
+        trajectoryOffsets = [
+            RaggedArray(trajectory.trajectories.items + trajectoryCount, trajectory.trajectories.offsets)
+            for trajectory, trajectoryCount in zip(trajectories, trajectoryCounts)
+        ]
+        return Trajectories(steps, RaggedArray.concat(trajectoryOffsets))
+
+
+def joinRows(values: pd.Series) -> tuple[bytes, np.ndarray, np.ndarray]:
+    # All JSON values of a column as one buffer, one value per line, with the position of the start and end of every
+    # value. Missing values are read as empty lists.
+    text = '\n'.join(values.fillna('[]').str.strip()).encode() + b'\n'
+    rowEnds = np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == ord('\n'))
+    rowStarts = np.concatenate([[0], rowEnds[:-1] + 1])
+    return text, rowStarts, rowEnds
+
+
+def findBytes(text: bytes, character: bytes) -> np.ndarray:
+    return np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == ord(character))
+
+
+def getValues(buffer: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # The bytes from every start up to its end as a fixed width bytes array, padded with zero bytes.
+    width = max(int((ends - starts).max()), 1)
+    positions = starts[:, None] + np.arange(width)
+    characters = buffer.take(positions, mode='clip')
+    characters[positions >= ends[:, None]] = 0
+    return characters.view(f'S{width}').ravel()
+
+
+def parseIntegers(values: np.ndarray) -> np.ndarray | None:
+    # Most values are small integers, which are much quicker to read digit by digit for all values at once than to
+    # hand to a float parser. Returns None if there is anything else than digits, a minus and whitespace.
+    characters = values.view(np.uint8).reshape(len(values), -1)
+    isDigit = (characters >= ord('0')) & (characters <= ord('9'))
+    isNegative = (characters == ord('-')).any(axis=1)
+    isPadding = (characters == 0) | (characters == ord(' ')) | (characters == ord('-'))
+    if not (isDigit | isPadding).all():
+        return None
+    integers = np.zeros(len(values), dtype=np.int64)
+    for column in range(characters.shape[1]):
+        integers = np.where(isDigit[:, column], integers * 10 + (characters[:, column] - ord('0')), integers)
+    return np.where(isNegative, -integers, integers)
+
+
+def parseObjects(text: bytes, objectCount: int, itemType: np.dtype) -> np.ndarray | None:
+    # Read the values of objectCount flat JSON objects straight from the buffer, without turning every object into a
+    # dict first. This relies on every object having the same keys in the same order, as System.Text.Json writes them.
+    # Returns None if the buffer does not look like that, so the caller can fall back to a regular JSON parser.
+    items = np.zeros(objectCount, dtype=itemType)
+    if objectCount == 0:
+        return items
+    keys = list(orjson.loads(text[text.index(b'{'):text.index(b'}') + 1]).keys())
+
+    # None of the keys or values contain a colon, comma or closing brace, so every value sits between a colon and the
+    # first comma or closing brace after it.
+    buffer = np.frombuffer(text, dtype=np.uint8)
+    valueStarts = np.flatnonzero(buffer == ord(':')) + 1
+    if len(valueStarts) != objectCount * len(keys):
+        return None
+    separators = np.flatnonzero((buffer == ord(',')) | (buffer == ord('}')))
+    valueEnds = separators[np.searchsorted(separators, valueStarts)]
+
+    for index, key in enumerate(keys):
+        if key not in itemType.names:
+            continue
+        values = getValues(buffer, valueStarts[index::len(keys)], valueEnds[index::len(keys)])
+        if key == 'action' or itemType[key] == np.bool_:
+            values = np.char.strip(values)
+        if key == 'action':
+            names, nameIndexes = np.unique(values, return_inverse=True)
+            actions = np.array([
+                actionNames.index(name) if name in actionNames else -1
+                for name in [orjson.loads(bytes(name)) for name in names]
+            ])
+            items[key] = actions[nameIndexes]
+        elif itemType[key] == np.bool_:
+            items[key] = values == b'true'
+        else:
+            numbers = parseIntegers(values)
+            if numbers is None:
+                try:
+                    numbers = values.astype(np.float64)
+                except ValueError:
+                    return None
+            items[key] = numbers
+    return items
+
+
+def toItems(objects: list[dict], itemType: np.dtype) -> np.ndarray:
+    items = np.zeros(len(objects), dtype=itemType)
+    for key in itemType.names:
+        if key == 'action':
+            names = [cell.get(key, '') for cell in objects]
+            items[key] = [actionNames.index(name) if name in actionNames else -1 for name in names]
+        else:
+            items[key] = [cell.get(key, 0) for cell in objects]
+    return items
+
+
+def decodeArchives(values: pd.Series) -> RaggedArray:
+    # Archive cells of every row of an archive column.
+    text, rowStarts, rowEnds = joinRows(values)
+    objectStarts = findBytes(text, b'{')
+    offsets = np.concatenate([[0], np.searchsorted(objectStarts, rowEnds)])
+
+    cells = parseObjects(text, len(objectStarts), cellType)
+    if cells is None:
+        cells = toItems([cell for value in values.fillna('[]') for cell in orjson.loads(value)], cellType)
+    return RaggedArray(cells, offsets)
+
+
+def decodeTrajectories(values: pd.Series) -> Trajectories:
+    # Terminal trajectories of every row of a terminalTrajectories column.
+    text, rowStarts, rowEnds = joinRows(values)
+    objectStarts = findBytes(text, b'{')
+    # Every [ opens a trajectory, apart from the one that opens the list of trajectories of a row.
+    listStarts = findBytes(text, b'[')
+    trajectoryStarts = listStarts[~np.isin(listStarts, rowStarts)]
+    stepOffsets = np.concatenate([np.searchsorted(objectStarts, trajectoryStarts), [len(objectStarts)]])
+    trajectoryOffsets = np.concatenate([[0], np.searchsorted(trajectoryStarts, rowEnds)])
+
+    steps = parseObjects(text, len(objectStarts), stepType)
+    if steps is None:
+        steps = toItems(
+            [step for value in values.fillna('[]') for trajectory in orjson.loads(value) for step in trajectory],
+            stepType
+        )
+    return Trajectories(
+        RaggedArray(steps, stepOffsets),
+        RaggedArray(np.arange(len(trajectoryStarts)), trajectoryOffsets),
+    )
+
+
+class SweepTraces:
+    # Archives and terminal trajectories of every row of a sweep, together with the columns to group them by. Row i of
+    # rows belongs to row i of archives and trajectories.
+
+    def __init__(self, rows: pd.DataFrame, archives: RaggedArray, trajectories: Trajectories):
+        self.rows = rows
+        self.archives = archives
+        self.trajectories = trajectories
+
+
+def readTraces(files: list[str]) -> SweepTraces:
+    frames: list[pd.DataFrame] = []
+    archives: list[RaggedArray] = []
+    trajectories: list[Trajectories] = []
+    for file in files:
+        frame = LogLoader.readLog(
+            file,
+            ['generation', 'level', 'id', 'fitness', *LogLoader.geneColumns, *LogLoader.jsonColumns]
+        )
+        archives.append(decodeArchives(frame['archive']))
+        trajectories.append(decodeTrajectories(frame['terminalTrajectories']))
+        frame = frame.drop(columns=LogLoader.jsonColumns)
+        frame['filename'] = pd.Series(file.split('/')[-1], index=frame.index, dtype='category')
+        frames.append(frame)
+    rows = LogLoader.concatLogs(frames)
+    LogLoader.addTGMColumns(rows)
+    return SweepTraces(rows, RaggedArray.concat(archives), Trajectories.concat(trajectories))
+
+
+def readTracesInFolder(path: str) -> SweepTraces:
+    return readTraces(LogLoader.getLogFilesInFolder(path))
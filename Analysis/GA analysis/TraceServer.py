@@ -0,0 +1,301 @@
+import argparse
+import functools
+import os
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import orjson
+import pandas as pd
+
+import Aggregation
+import ArchiveHeatmaps
+import LogLoader
+import TraceDecoder
+import TraceStore
+
+
+# The trace visualisation, which the server hosts next to the data it serves.
+visualisationFolder: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Trace visualisation')
+
+# Columns rows can be selected by, with one or more values each, e.g. ?level=3&componentField=isTrigger.
+filterColumns: list[str] = ['filename', 'level', 'generation', *LogLoader.geneColumns, 'TGM', 'TGMgroup']
+integerColumns: list[str] = ['level', 'generation']
+
+# Columns heatmaps can be broken down by, see ArchiveHeatmaps.makeHeatmaps.
+breakdownColumns: list[str] = ['level', 'generation', 'filename', *LogLoader.geneColumns, 'TGM', 'TGMgroup']
+
+defaultPageSize: int = 100
+maxPageSize: int = 1000
+
+defaultCacheSize: int = 256 * 1024 * 1024
+
+
+class QueryError(ValueError):
+    pass
+
+
+class ResponseCache:
+    # Least recently used cache of response bodies, limited by their total size in bytes rather than their number, as
+    # a heatmap response is a few kilobytes and a page of trajectories can be megabytes.
+
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.responses: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[str, bytes] | None:
+        with self.lock:
+            if key not in self.responses:
+                return None
+            self.responses.move_to_end(key)
+            return self.responses[key]
+
+    def put(self, key: tuple, response: tuple[str, bytes]):
+        with self.lock:
+            if key in self.responses:
+                return
+            self.responses[key] = response
+            self.size += len(response[1])
+            while self.size > self.maxBytes and len(self.responses) > 1:
+                _, evictedResponse = self.responses.popitem(last=False)
+                self.size -= len(evictedResponse[1])
+
+
+def readRowTable(folder: str, store: TraceStore.TraceStore) -> pd.DataFrame:
+    # The rows of the store, in store order, with the genes, TGM columns and fitness of every row.
+    rowTable = store.getRowTable()
+    frames: list[pd.DataFrame] = []
+    storeIndexes: list[np.ndarray] = []
+    for fileNumber, name in enumerate(store.files):
+        isInFile = store.rows['file'] == fileNumber
+        frame = LogLoader.readLog(os.path.join(folder, name), ['fitness', *LogLoader.geneColumns])
+        frames.append(frame.iloc[store.rows['row'][isInFile]])
+        storeIndexes.append(np.flatnonzero(isInFile))
+    if len(frames) == 0:
+        return rowTable
+    genes = LogLoader.concatLogs(frames)
+    genes.index = np.concatenate(storeIndexes)
+    genes = genes.sort_index()
+    LogLoader.addTGMColumns(genes)
+    for column in ['fitness', *LogLoader.geneColumns, 'TGM', 'TGMgroup']:
+        rowTable[column] = genes[column].to_numpy()
+    rowTable['cellCount'] = store.rows['cellEnd'] - store.rows['cellStart']
+    rowTable['trajectoryCount'] = store.rows['trajectoryEnd'] - store.rows['trajectoryStart']
+    return rowTable
+
+
+def downsampleSteps(steps: np.ndarray, maxSteps: int) -> np.ndarray:
+    # At most maxSteps evenly spread steps of a trajectory, always including its first and last step.
+    if maxSteps <= 0 or len(steps) <= maxSteps:
+        return steps
+    return steps[np.unique(np.linspace(0, len(steps) - 1, max(maxSteps, 2)).round().astype(np.int64))]
+
+
+class TraceData:
+    # Answers the queries of the trace visualisation from the trace store of a sweep, so the browser only downloads the
+    # heatmaps and trajectories it draws instead of parsing whole GA logs.
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.store = TraceStore.TraceStore.open(folder)
+        self.rows = readRowTable(folder, self.store)
+
+    def getOptions(self) -> dict:
+        # Every value rows can be selected by, to fill the controls of the visualisation.
+        return {
+            'levelSize': {'width': TraceDecoder.levelWidth, 'height': TraceDecoder.levelHeight},
+            'actionNames': TraceDecoder.actionNames,
+            'rowCount': len(self.rows),
+            **{
+                column: sorted(self.rows[column].dropna().unique().tolist())
+                for column in filterColumns if column in self.rows
+            },
+        }
+
+    def selectRows(self, query: dict[str, list[str]]) -> np.ndarray:
+        # Store indexes of the rows that have one of the given values in every filtered column.
+        isSelected = np.ones(len(self.rows), dtype=bool)
+        for column in filterColumns:
+            if column not in query:
+                continue
+            values = [value for values in query[column] for value in values.split(',')]
+            if column in integerColumns:
+                try:
+                    values = [int(value) for value in values]
+                except ValueError:
+                    raise QueryError(f'{column} has to be an integer')
+            isSelected &= self.rows[column].isin(values).to_numpy()
+        if 'minFitness' in query:
+            isSelected &= self.rows['fitness'].to_numpy() >= getNumber(query, 'minFitness', float, 0)
+        return np.flatnonzero(isSelected)
+
+    def getPage(self, query: dict[str, list[str]]) -> tuple[np.ndarray, dict]:
+        # Store indexes of one page of the selected rows, and where the page is in the selection.
+        indexes = self.selectRows(query)
+        page = getNumber(query, 'page', int, 0)
+        pageSize = getNumber(query, 'pageSize', int, defaultPageSize)
+        if page < 0 or not 0 < pageSize <= maxPageSize:
+            raise QueryError(f'page has to be 0 or more, and pageSize between 1 and {maxPageSize}')
+        pageInfo = {
+            'total': len(indexes),
+            'page': page,
+            'pageSize': pageSize,
+            'pageCount': -(-len(indexes) // pageSize),
+        }
+        return indexes[page * pageSize:(page + 1) * pageSize], pageInfo
+
+    def getRowRecords(self, indexes: np.ndarray) -> list[dict]:
+        rows = self.rows.iloc[indexes].drop(columns=['TGMgroup'])
+        rows.insert(0, 'index', indexes)
+        return [
+            {column: (None if pd.isna(value) else value) for column, value in row.items()}
+            for row in rows.astype(object).to_dict('records')
+        ]
+
+    def getRows(self, query: dict[str, list[str]]) -> dict:
+        indexes, pageInfo = self.getPage(query)
+        return {**pageInfo, 'rows': self.getRowRecords(indexes)}
+
+    def getHeatmap(self, query: dict[str, list[str]]) -> dict[str, np.ndarray]:
+        # Archive heatmaps of the selected rows, merged into one level grid, or into one grid per value of the by
+        # column.
+        keys = query.get('by', [])
+        if any(key not in breakdownColumns for key in keys):
+            raise QueryError(f'heatmaps can only be broken down by {", ".join(breakdownColumns)}')
+        indexes = self.selectRows(query)
+        cellStarts = self.store.rows['cellStart'][indexes]
+        cellEnds = self.store.rows['cellEnd'][indexes]
+        archives = TraceDecoder.RaggedArray(
+            self.store.cells[Aggregation.gatherRanges(cellStarts, cellEnds)],
+            np.concatenate([[0], np.cumsum(cellEnds - cellStarts)])
+        )
+        traces = TraceDecoder.SweepTraces(self.rows.iloc[indexes].reset_index(drop=True), archives, None)
+        return ArchiveHeatmaps.makeHeatmaps(traces, keys)
+
+    def getTrajectories(self, query: dict[str, list[str]]) -> dict:
+        # One page of the selected rows with their terminal trajectories. Every trajectory is a set of step columns, as
+        # that is much smaller in JSON than a list of step objects, with its steps downsampled to maxSteps and the
+        # trajectories of a row to maxTrajectories when given.
+        indexes, pageInfo = self.getPage(query)
+        maxSteps = getNumber(query, 'maxSteps', int, 0)
+        maxTrajectories = getNumber(query, 'maxTrajectories', int, 0)
+        rows = self.getRowRecords(indexes)
+        for row, index in zip(rows, indexes):
+            trajectories = self.store.getTrajectories(index)
+            if maxTrajectories > 0:
+                trajectories = trajectories[:maxTrajectories]
+            row['trajectories'] = [
+                {
+                    column: steps[column].tolist()
+                    for column in ['x', 'y', 'startX', 'startY', 'action']
+                }
+                for steps in (downsampleSteps(trajectory, maxSteps) for trajectory in trajectories)
+            ]
+        return {**pageInfo, 'actionNames': TraceDecoder.actionNames, 'rows': rows}
+
+
+def getNumber(query: dict[str, list[str]], name: str, numberType: type, default):
+    if name not in query:
+        return default
+    try:
+        return numberType(query[name][-1])
+    except ValueError:
+        raise QueryError(f'{name} has to be a number')
+
+
+def encodeHeatmap(heatmaps: dict[str, np.ndarray], responseFormat: str) -> tuple[str, bytes]:
+    # JSON with the grids flattened in row major order along with their shape, or the grids as consecutive little
+    # endian arrays, int32 timesSeen, timesChosen and cellCount followed by float64 maxReward, with the shape and the
+    # breakdown values in a JSON header line.
+    grids = ['timesSeen', 'timesChosen', 'cellCount', 'maxReward']
+    shape = list(heatmaps['timesSeen'].shape)
+    breakdown = {key: values.tolist() for key, values in heatmaps.items() if key not in grids}
+    if responseFormat == 'binary':
+        header = orjson.dumps({'shape': shape, **breakdown}) + b'\n'
+        return 'application/octet-stream', header + b''.join(
+            heatmaps[grid].astype('<f8' if grid == 'maxReward' else '<i4').tobytes() for grid in grids
+        )
+    return 'application/json', orjson.dumps(
+        {'shape': shape, **breakdown, **{grid: heatmaps[grid].ravel() for grid in grids}},
+        option=orjson.OPT_SERIALIZE_NUMPY
+    )
+
+
+class TraceRequestHandler(SimpleHTTPRequestHandler):
+    # Serves the trace visualisation as static files, and its data under /api/.
+
+    def __init__(self, *arguments, traceData: TraceData, cache: ResponseCache, **keywordArguments):
+        self.traceData = traceData
+        self.cache = cache
+        super().__init__(*arguments, directory=visualisationFolder, **keywordArguments)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith('/api/'):
+            super().do_GET()
+            return
+        query = parse_qs(url.query)
+        # The order of query parameters does not change the response, so it does not change the cache key either.
+        cacheKey = (url.path, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        response = self.cache.get(cacheKey)
+        if response is None:
+            try:
+                response = self.makeResponse(url.path, query)
+            except QueryError as error:
+                self.send_error(HTTPStatus.BAD_REQUEST, str(error))
+                return
+            if response is None:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            self.cache.put(cacheKey, response)
+        contentType, body = response
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def makeResponse(self, path: str, query: dict[str, list[str]]) -> tuple[str, bytes] | None:
+        if path == '/api/options':
+            return 'application/json', orjson.dumps(self.traceData.getOptions(), option=orjson.OPT_SERIALIZE_NUMPY)
+        if path == '/api/rows':
+            return 'application/json', orjson.dumps(self.traceData.getRows(query), option=orjson.OPT_SERIALIZE_NUMPY)
+        if path == '/api/heatmap':
+            return encodeHeatmap(self.traceData.getHeatmap(query), query.get('format', ['json'])[-1])
+        if path == '/api/trajectories':
+            return 'application/json', orjson.dumps(
+                self.traceData.getTrajectories(query),
+                option=orjson.OPT_SERIALIZE_NUMPY
+            )
+        return None
+
+
+def serve(folder: str, host: str, port: int, cacheSize: int = defaultCacheSize):
+    traceData = TraceData(folder)
+    handler = functools.partial(TraceRequestHandler, traceData=traceData, cache=ResponseCache(cacheSize))
+    with ThreadingHTTPServer((host, port), handler) as server:
+        print(f'Serving {len(traceData.rows)} rows of {folder} at http://{host}:{port}/')
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve the trace visualisation with archive heatmaps and trajectories of a sweep.'
+    )
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=defaultCacheSize // (1024 * 1024),
+        help='megabytes of responses to keep in memory'
+    )
+    arguments = parser.parse_args()
+    serve(LogLoader.resolveFolder(arguments.folder), arguments.host, arguments.port, arguments.cache_size * 1024 * 1024)
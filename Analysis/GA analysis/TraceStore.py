@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import LogLoader
+import TraceDecoder
+
+
+storeFolderName: str = 'trace store'
+manifestFileName: str = 'store.json'
+
+# Every row of the GA logs in the store, in the order they were added. The archive cells of a row are
+# cells[cellStart:cellEnd], and its terminal trajectories are trajectories[trajectoryStart:trajectoryEnd].
+rowType = np.dtype([
+    ('file', np.int32),
+    ('row', np.int32),
+    ('generation', np.int32),
+    ('level', np.int32),
+    ('cellStart', np.int64),
+    ('cellEnd', np.int64),
+    ('trajectoryStart', np.int64),
+    ('trajectoryEnd', np.int64),
+])
+
+# The steps of a trajectory are steps[stepStart:stepEnd].
+trajectoryType = np.dtype([
+    ('stepStart', np.int64),
+    ('stepEnd', np.int64),
+])
+
+# Record type of every file of the store.
+recordTypes: dict[str, np.dtype] = {
+    'rows': rowType,
+    'cells': TraceDecoder.cellType,
+    'trajectories': trajectoryType,
+    'steps': TraceDecoder.stepType,
+}
+
+
+def getStoreFolder(folder: str) -> str:
+    return os.path.join(folder, LogLoader.cacheFolderName, storeFolderName)
+
+
+def getRecordPath(storeFolder: str, name: str) -> str:
+    return os.path.join(storeFolder, f'{name}.bin')
+
+
+def readManifest(storeFolder: str) -> dict:
+    # The GA logs in the store and the number of records of every type. Records after these counts are left over from
+    # an update that did not finish and are not part of the store.
+    manifestPath = os.path.join(storeFolder, manifestFileName)
+    if not os.path.exists(manifestPath):
+        return {'files': [], 'counts': {name: 0 for name in recordTypes}}
+    with open(manifestPath) as manifestFile:
+        return json.load(manifestFile)
+
+
+def writeManifest(storeFolder: str, manifest: dict):
+    manifestPath = os.path.join(storeFolder, manifestFileName)
+    # Replacing the manifest commits an update, so write it to a temporary file first.
+    temporaryManifestPath = f'{manifestPath}.{os.getpid()}.tmp'
+    with open(temporaryManifestPath, 'w') as manifestFile:
+        json.dump(manifest, manifestFile, indent=2)
+    os.replace(temporaryManifestPath, manifestPath)
+
+
+def appendRecords(storeFolder: str, records: dict[str, np.ndarray], counts: dict[str, int]):
+    # Write records after the committed ones of every file, overwriting the leftovers of an unfinished update.
+    for name, items in records.items():
+        recordPath = getRecordPath(storeFolder, name)
+        with open(recordPath, 'r+b' if os.path.exists(recordPath) else 'wb') as recordFile:
+            recordFile.seek(counts[name] * recordTypes[name].itemsize)
+            recordFile.write(items.astype(recordTypes[name], copy=False).tobytes())
+            recordFile.truncate()
+
+
+def makeRecords(file: str, fileNumber: int, firstRow: int, counts: dict[str, int]) -> tuple[dict[str, np.ndarray], int]:
+    # Records of the rows of a GA log from firstRow onwards, placed after counts records of every type, and the number
+    # of rows of the GA log.
+    frame = LogLoader.readLog(file, ['generation', 'level', *LogLoader.jsonColumns])
+    frame = frame.iloc[firstRow:]
+    archives = TraceDecoder.decodeArchives(frame['archive'])
+    trajectories = TraceDecoder.decodeTrajectories(frame['terminalTrajectories'])
+
+    rows = np.zeros(len(frame), dtype=rowType)
+    rows['file'] = fileNumber
+    rows['row'] = np.arange(firstRow, firstRow + len(frame))
+    rows['generation'] = frame['generation'].to_numpy()
+    rows['level'] = frame['level'].to_numpy()
+    rows['cellStart'] = archives.offsets[:-1] + counts['cells']
+    rows['cellEnd'] = archives.offsets[1:] + counts['cells']
+    rows['trajectoryStart'] = trajectories.trajectories.offsets[:-1] + counts['trajectories']
+    rows['trajectoryEnd'] = trajectories.trajectories.offsets[1:] + counts['trajectories']
+    trajectoryRecords = np.zeros(len(trajectories.steps), dtype=trajectoryType)
+    trajectoryRecords['stepStart'] = trajectories.steps.offsets[:-1] + counts['steps']
+    trajectoryRecords['stepEnd'] = trajectories.steps.offsets[1:] + counts['steps']
+    return {
+        'rows': rows,
+        'cells': archives.items,
+        'trajectories': trajectoryRecords,
+        'steps': trajectories.steps.items,
+    }, firstRow + len(frame)
+
+
+def isReplaced(file: str, storedFile: dict) -> bool:
+    # Whether a GA log in the store no longer starts with the bytes that were stored. Stores written before
+    # fingerprints were kept are written again from scratch.
+    fileStat = os.stat(file)
+    if storedFile['size'] == fileStat.st_size and storedFile['modificationTime'] == fileStat.st_mtime_ns:
+        return False
+    return 'fingerprint' not in storedFile \
+        or not LogLoader.isAppendedTo(file, storedFile['size'], storedFile['fingerprint'])
+
+
+def updateStore(folder: str) -> bool:
+    # Append the rows that were added to the GA logs of a folder since the last update to its store. The store is
+    # append only, so it is written again from scratch when a GA log shrank, was rewritten or disappeared. Returns
+    # whether anything changed.
+    storeFolder = getStoreFolder(folder)
+    manifest = readManifest(storeFolder)
+    currentFiles = {os.path.basename(file): file for file in LogLoader.getLogFilesInFolder(folder)}
+    for storedFile in manifest['files']:
+        if storedFile['name'] not in currentFiles or isReplaced(currentFiles[storedFile['name']], storedFile):
+            shutil.rmtree(storeFolder)
+            manifest = readManifest(storeFolder)
+            break
+    os.makedirs(storeFolder, exist_ok=True)
+
+    storedFiles = {storedFile['name']: storedFile for storedFile in manifest['files']}
+    isChanged = False
+    for name, file in currentFiles.items():
+        fileStat = os.stat(file)
+        storedFile = storedFiles.get(name)
+        if storedFile is None:
+            storedFile = {'name': name, 'size': 0, 'modificationTime': 0, 'fingerprint': 0, 'rowCount': 0}
+            manifest['files'].append(storedFile)
+        elif storedFile['size'] == fileStat.st_size and storedFile['modificationTime'] == fileStat.st_mtime_ns:
+            continue
+        records, rowCount = makeRecords(
+            file,
+            manifest['files'].index(storedFile),
+            storedFile['rowCount'],
+            manifest['counts']
+        )
+        appendRecords(storeFolder, records, manifest['counts'])
+        for recordName, items in records.items():
+            manifest['counts'][recordName] += len(items)
+        storedFile.update(
+            size=fileStat.st_size,
+            modificationTime=fileStat.st_mtime_ns,
+            fingerprint=LogLoader.fingerprintPrefix(file, fileStat.st_size),
+            rowCount=rowCount
+        )
+        # Commit every GA log on its own, so an interrupted update only has to redo the GA log it was at.
+        writeManifest(storeFolder, manifest)
+        isChanged = True
+    return isChanged
+
+
+def mapRecords(storeFolder: str, name: str, count: int) -> np.ndarray:
+    # A memory map can not be empty.
+    if count == 0:
+        return np.zeros(0, dtype=recordTypes[name])
+    return np.memmap(getRecordPath(storeFolder, name), dtype=recordTypes[name], mode='r', shape=(count,))
+
+
+class TraceStore:
+    # Read only view of the store of a folder. The records are memory mapped, so slicing out the archive or the
+    # trajectories of one row only reads those from disk.
+
+    def __init__(self, folder: str):
+        storeFolder = getStoreFolder(folder)
+        manifest = readManifest(storeFolder)
+        self.files: list[str] = [storedFile['name'] for storedFile in manifest['files']]
+        self.rows = mapRecords(storeFolder, 'rows', manifest['counts']['rows'])
+        self.cells = mapRecords(storeFolder, 'cells', manifest['counts']['cells'])
+        self.trajectories = mapRecords(storeFolder, 'trajectories', manifest['counts']['trajectories'])
+        self.steps = mapRecords(storeFolder, 'steps', manifest['counts']['steps'])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @staticmethod
+    def open(folder: str) -> 'TraceStore':
+        # The store of a folder, brought up to date with the GA logs in it first.
+        updateStore(folder)
+        return TraceStore(folder)
+
+    def getRowTable(self) -> pd.DataFrame:
+        # File name, row number, generation and level of every row of the store, in store order. Row numbers count the
+        # rows of a GA log from 0.
+        return pd.DataFrame({
+            'filename': pd.Categorical.from_codes(self.rows['file'], categories=self.files) if len(self.files) > 0
+            else pd.Categorical([]),
+            'row': self.rows['row'],
+            'generation': self.rows['generation'],
+            'level': self.rows['level'],
+        })
+
+    def findRow(self, filename: str, row: int) -> int:
+        # Index in the store of a row of a GA log.
+        indexes = np.flatnonzero((self.rows['file'] == self.files.index(filename)) & (self.rows['row'] == row))
+        if len(indexes) == 0:
+            raise KeyError(f'row {row} of {filename} is not in the trace store')
+        return int(indexes[0])
+
+    def getArchive(self, index: int) -> np.ndarray:
+        return self.cells[self.rows['cellStart'][index]:self.rows['cellEnd'][index]]
+
+    def getTrajectories(self, index: int) -> list[np.ndarray]:
+        trajectories = self.trajectories[self.rows['trajectoryStart'][index]:self.rows['trajectoryEnd'][index]]
+        return [self.steps[start:end] for start, end in zip(trajectories['stepStart'], trajectories['stepEnd'])]
+
+    def getTraces(self) -> TraceDecoder.SweepTraces:
+        # All rows of the store as SweepTraces, with the memory mapped cells and steps as items. The records of every
+        # type follow on from each other, so the ends of a type give its offsets.
+        cellOffsets = np.concatenate([[0], self.rows['cellEnd']])
+        trajectoryOffsets = np.concatenate([[0], self.rows['trajectoryEnd']])
+        stepOffsets = np.concatenate([[0], self.trajectories['stepEnd']])
+        return TraceDecoder.SweepTraces(
+            self.getRowTable(),
+            TraceDecoder.RaggedArray(self.cells, cellOffsets),
+            TraceDecoder.Trajectories(
+                TraceDecoder.RaggedArray(self.steps, stepOffsets),
+                TraceDecoder.RaggedArray(np.arange(len(self.trajectories)), trajectoryOffsets),
+            ),
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert the archives and terminal trajectories of a sweep into a memory mapped binary store.'
+    )
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    arguments = parser.parse_args()
+    sweepFolder = LogLoader.resolveFolder(arguments.folder)
+    updateStore(sweepFolder)
+    store = TraceStore(sweepFolder)
+    print(
+        f'{len(store)} rows, {len(store.cells)} archive cells, {len(store.trajectories)} trajectories and '
+        f'{len(store.steps)} steps in {getStoreFolder(sweepFolder)}'
+    )
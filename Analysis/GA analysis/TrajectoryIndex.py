@@ -0,0 +1,222 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import LogLoader
+import TraceDecoder
+
+
+indexFileName: str = 'trajectory index.npz'
+
+# Every posting is one int64 of a file number, generation and row number, in that order from the highest bits down, so
+# sorted postings are sorted by file, generation and row. Together they take 63 bits, so the sign bit is never set and
+# shifting a posting right gives back its file number.
+fileBits: int = 23
+generationBits: int = 16
+rowBits: int = 24
+
+
+def encodePostings(files: np.ndarray, generations: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    return (
+        (np.asarray(files, dtype=np.int64) << (generationBits + rowBits))
+        | (np.asarray(generations, dtype=np.int64) << rowBits)
+        | np.asarray(rows, dtype=np.int64)
+    )
+
+
+def getCellKeys(levels: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    return (np.asarray(levels, dtype=np.int64) * TraceDecoder.levelHeight + y) * TraceDecoder.levelWidth + x
+
+
+def makeCSR(keys: np.ndarray, postings: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Sort (key, posting) pairs, remove duplicates and group them into a sorted posting list per key.
+    order = np.lexsort((postings, keys))
+    keys = keys[order]
+    postings = postings[order]
+    isNew = np.ones(len(keys), dtype=bool)
+    isNew[1:] = (keys[1:] != keys[:-1]) | (postings[1:] != postings[:-1])
+    keys = keys[isNew]
+    postings = postings[isNew]
+    uniqueKeys, starts = np.unique(keys, return_index=True)
+    return uniqueKeys, np.concatenate([starts, [len(keys)]]), postings
+
+
+class TrajectoryIndex:
+    # Inverted index from (level, x, y) grid cells to the GA log rows with a terminal trajectory through the cell. The
+    # rows of a cell are a sorted posting list, see encodePostings, so sets of cells can be intersected and merged with
+    # the sorted set operations of numpy.
+    #
+    # The index of a folder is kept in its cache folder and brought up to date by update, which only decodes the rows
+    # that were added to the GA logs since the last update.
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.files: list[str] = []
+        # Size, modification time and fingerprint of every file when it was indexed, and the number of rows indexed.
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.modificationTimes = np.zeros(0, dtype=np.int64)
+        self.fingerprints = np.zeros(0, dtype=np.int64)
+        self.rowCounts = np.zeros(0, dtype=np.int64)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.int64)
+
+    def getIndexPath(self) -> str:
+        return os.path.join(self.folder, LogLoader.cacheFolderName, indexFileName)
+
+    @staticmethod
+    def load(folder: str) -> 'TrajectoryIndex':
+        # The saved index of a folder, brought up to date with the GA logs in it.
+        index = TrajectoryIndex(folder)
+        if os.path.exists(index.getIndexPath()):
+            with np.load(index.getIndexPath()) as savedIndex:
+                index.files = savedIndex['files'].tolist()
+                for name in ['sizes', 'modificationTimes', 'rowCounts', 'keys', 'offsets', 'postings']:
+                    setattr(index, name, savedIndex[name])
+                # Indexes saved before fingerprints were kept are read again from scratch.
+                index.fingerprints = savedIndex['fingerprints'] if 'fingerprints' in savedIndex \
+                    else np.zeros(len(index.files), dtype=np.int64)
+        if index.update():
+            index.save()
+        return index
+
+    def save(self):
+        indexPath = self.getIndexPath()
+        os.makedirs(os.path.dirname(indexPath), exist_ok=True)
+        # Write to a temporary file first, so other processes never read a half written index.
+        temporaryIndexPath = f'{indexPath}.{os.getpid()}.tmp.npz'
+        np.savez(
+            temporaryIndexPath,
+            files=np.array(self.files, dtype=str),
+            sizes=self.sizes,
+            modificationTimes=self.modificationTimes,
+            fingerprints=self.fingerprints,
+            rowCounts=self.rowCounts,
+            keys=self.keys,
+            offsets=self.offsets,
+            postings=self.postings,
+        )
+        os.replace(temporaryIndexPath, indexPath)
+
+    def update(self) -> bool:
+        # Index new GA logs and rows appended to indexed ones. A GA log that shrank, was rewritten or disappeared is
+        # removed from the index first, and reindexed if it is still there. Returns whether anything changed.
+        newKeys: list[np.ndarray] = []
+        newPostings: list[np.ndarray] = []
+        removedFiles: list[int] = []
+        currentFiles = {os.path.basename(file): file for file in LogLoader.getLogFilesInFolder(self.folder)}
+
+        for fileNumber, name in enumerate(self.files):
+            if name not in currentFiles and self.rowCounts[fileNumber] > 0:
+                removedFiles.append(fileNumber)
+                self.sizes[fileNumber] = self.modificationTimes[fileNumber] = self.rowCounts[fileNumber] = 0
+                self.fingerprints[fileNumber] = 0
+        for name, file in currentFiles.items():
+            if name not in self.files:
+                if len(self.files) == 1 << fileBits:
+                    raise ValueError(f'can not index more than {1 << fileBits} GA logs in {self.folder}')
+                self.files.append(name)
+                self.sizes = np.append(self.sizes, 0)
+                self.modificationTimes = np.append(self.modificationTimes, 0)
+                self.fingerprints = np.append(self.fingerprints, 0)
+                self.rowCounts = np.append(self.rowCounts, 0)
+            fileNumber = self.files.index(name)
+            fileStat = os.stat(file)
+            isUnchanged = fileStat.st_size == self.sizes[fileNumber] \
+                and fileStat.st_mtime_ns == self.modificationTimes[fileNumber]
+            if isUnchanged:
+                continue
+            if self.rowCounts[fileNumber] > 0 \
+                    and not LogLoader.isAppendedTo(file, self.sizes[fileNumber], self.fingerprints[fileNumber]):
+                removedFiles.append(fileNumber)
+                self.rowCounts[fileNumber] = 0
+            keys, postings, rowCount = indexRows(file, fileNumber, int(self.rowCounts[fileNumber]))
+            newKeys.append(keys)
+            newPostings.append(postings)
+            self.sizes[fileNumber] = fileStat.st_size
+            self.modificationTimes[fileNumber] = fileStat.st_mtime_ns
+            self.fingerprints[fileNumber] = LogLoader.fingerprintPrefix(file, fileStat.st_size)
+            self.rowCounts[fileNumber] = rowCount
+
+        if len(newKeys) == 0 and len(removedFiles) == 0:
+            return False
+        keys = np.repeat(self.keys, np.diff(self.offsets))
+        postings = self.postings
+        if len(removedFiles) > 0:
+            isKept = ~np.isin(postings >> (generationBits + rowBits), removedFiles)
+            keys = keys[isKept]
+            postings = postings[isKept]
+        self.keys, self.offsets, self.postings = makeCSR(
+            np.concatenate([keys, *newKeys]),
+            np.concatenate([postings, *newPostings])
+        )
+        return True
+
+    def getPostings(self, level: int, x: int, y: int) -> np.ndarray:
+        position = np.searchsorted(self.keys, getCellKeys(level, x, y))
+        if position == len(self.keys) or self.keys[position] != getCellKeys(level, x, y):
+            return np.zeros(0, dtype=np.int64)
+        return self.postings[self.offsets[position]:self.offsets[position + 1]]
+
+    def findAll(self, cells: list[tuple[int, int, int]]) -> np.ndarray:
+        # Postings of the rows with terminal trajectories through every one of the (level, x, y) cells.
+        postings = self.getPostings(*cells[0])
+        for cell in cells[1:]:
+            postings = np.intersect1d(postings, self.getPostings(*cell), assume_unique=True)
+        return postings
+
+    def findAny(self, cells: list[tuple[int, int, int]]) -> np.ndarray:
+        # Postings of the rows with terminal trajectories through at least one of the (level, x, y) cells.
+        return np.unique(np.concatenate([self.getPostings(*cell) for cell in cells]))
+
+    def getRows(self, postings: np.ndarray) -> pd.DataFrame:
+        # File name, generation and row number of every posting. Row numbers count the rows of a GA log from 0.
+        fileNumbers = postings >> (generationBits + rowBits)
+        return pd.DataFrame({
+            'filename': pd.Categorical.from_codes(fileNumbers, categories=self.files) if len(self.files) > 0
+            else pd.Categorical([]),
+            'generation': (postings >> rowBits) & ((1 << generationBits) - 1),
+            'row': postings & ((1 << rowBits) - 1),
+        })
+
+
+def indexRows(file: str, fileNumber: int, firstRow: int) -> tuple[np.ndarray, np.ndarray, int]:
+    # Cell keys and postings of every cell the terminal trajectories of the rows from firstRow onwards pass through,
+    # including the cell they start in, and the number of rows of the file.
+    frame = LogLoader.readLog(file, ['generation', 'level', 'terminalTrajectories'])
+    if len(frame) > 1 << rowBits:
+        raise ValueError(f'can not index more than {1 << rowBits} rows of {file}')
+    rows = frame.iloc[firstRow:]
+    trajectories = TraceDecoder.decodeTrajectories(rows['terminalTrajectories'])
+    steps = trajectories.steps.items
+    stepRows = trajectories.stepRowIndexes()
+    x = np.concatenate([steps['x'], steps['startX']])
+    y = np.concatenate([steps['y'], steps['startY']])
+    stepRows = np.concatenate([stepRows, stepRows])
+    isInLevel = (x >= 0) & (x < TraceDecoder.levelWidth) & (y >= 0) & (y < TraceDecoder.levelHeight)
+    stepRows = stepRows[isInLevel]
+
+    keys = getCellKeys(rows['level'].to_numpy()[stepRows], x[isInLevel], y[isInLevel])
+    postings = encodePostings(
+        np.full(len(stepRows), fileNumber),
+        rows['generation'].to_numpy()[stepRows],
+        stepRows + firstRow
+    )
+    return keys, postings, len(frame)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Update the trajectory index of a sweep and list the rows with terminal trajectories through cells.'
+    )
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    parser.add_argument('level', type=int)
+    parser.add_argument('cells', nargs='+', help='x,y of every cell')
+    parser.add_argument('--any', action='store_true', help='list rows through any of the cells instead of all of them')
+    arguments = parser.parse_args()
+    trajectoryIndex = TrajectoryIndex.load(LogLoader.resolveFolder(arguments.folder))
+    queryCells = [(arguments.level, *map(int, cell.split(','))) for cell in arguments.cells]
+    rowPostings = trajectoryIndex.findAny(queryCells) if arguments.any else trajectoryIndex.findAll(queryCells)
+    print(trajectoryIndex.getRows(rowPostings).to_string(index=False))
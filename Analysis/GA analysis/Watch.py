@@ -0,0 +1,208 @@
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import Diversity
+import FitnessConsistency
+import LogLoader
+import LogStream
+
+
+# Most bytes read from a GA log at once, so catching up on a long run does not read the whole file into memory.
+defaultBlockSize: int = 64 * 1024 * 1024
+
+
+class LogTail:
+    # Reads the rows that were appended to a GA log since the previous read. The GA flushes the log after every
+    # generation, but a flush can still end halfway through a row, so only complete lines are parsed and the rest is
+    # read again next time.
+
+    def __init__(self, file: str, blockSize: int = defaultBlockSize):
+        self.file = file
+        self.blockSize = blockSize
+        self.offset = 0
+        self.fingerprint = LogLoader.fingerprintPrefix(file, 0)
+        self.header = b''
+
+    def wasReplaced(self) -> bool:
+        # The GA log was removed, shrank or was rewritten, so the rows read so far are no longer valid.
+        return not LogLoader.isAppendedTo(self.file, self.offset, self.fingerprint)
+
+    def readNewRows(self):
+        with open(self.file, 'rb') as logFile:
+            while True:
+                logFile.seek(self.offset)
+                block = logFile.read(self.blockSize)
+                end = block.rfind(b'\n') + 1
+                if end == 0:
+                    return
+                self.offset += end
+                self.fingerprint = LogLoader.fingerprintPrefix(self.file, self.offset)
+                lines = block[:end]
+                if not self.header:
+                    headerEnd = lines.index(b'\n') + 1
+                    self.header, lines = lines[:headerEnd], lines[headerEnd:]
+                if lines:
+                    yield pd.read_csv(
+                        io.BytesIO(self.header + lines),
+                        usecols=['generation', 'level', 'fitness', *LogLoader.geneColumns],
+                        dtype={column: 'category' for column in LogLoader.geneColumns},
+                    )
+
+
+def getLevelGenerations(table: pd.DataFrame) -> pd.MultiIndex:
+    # level and generation are floats or integers depending on the zero fitness filter, so compare them as floats.
+    return pd.MultiIndex.from_arrays([
+        table['level'].to_numpy(dtype=np.float64),
+        table['generation'].to_numpy(dtype=np.float64),
+    ])
+
+
+def replaceRows(table: pd.DataFrame, newRows: pd.DataFrame, changed: pd.MultiIndex) -> pd.DataFrame:
+    # Swap the rows of the changed levels and generations for newly calculated ones. Every level and generation comes
+    # entirely from either the old or the new rows, so a stable sort on level and generation restores the order a full
+    # recalculation would give.
+    keptRows = table[~getLevelGenerations(table).isin(changed)]
+    table = pd.concat([keptRows, newRows]).sort_values(['level', 'generation'], kind='stable')
+    return table.astype(newRows.dtypes.to_dict())
+
+
+def selectLevelGenerations(aggregate, changed: pd.MultiIndex):
+    levelGenerations = pd.MultiIndex.from_arrays([
+        aggregate.index.get_level_values(0).to_numpy(dtype=np.float64),
+        aggregate.index.get_level_values(1).to_numpy(dtype=np.float64),
+    ])
+    return aggregate[levelGenerations.isin(changed)]
+
+
+class SweepWatcher:
+    # Keeps the Diversity tables and figures and the FitnessConsistency plots of a folder of GA logs up to date while
+    # the GA is still writing them. Only appended rows are parsed, and only the rows of the tables and the plots of the
+    # levels they belong to are recalculated.
+
+    def __init__(self, folder: str, label: str, includeZeroFitness: bool = False, tablesOnly: bool = False):
+        self.folder = folder
+        self.label = label
+        self.includeZeroFitness = includeZeroFitness
+        self.tablesOnly = tablesOnly
+        self.reset()
+
+    def reset(self):
+        self.sweep = LogStream.SweepAccumulator(self.includeZeroFitness)
+        self.tails: dict[str, LogTail] = {}
+        self.tables: dict | None = None
+
+    def poll(self) -> list[int]:
+        # Read everything that was appended since the last poll, and return the levels that have new rows.
+        if any(tail.wasReplaced() for tail in self.tails.values()):
+            print(f'A GA log in {self.folder} was replaced, reading all GA logs again')
+            self.reset()
+
+        changedLevels: set[int] = set()
+        changed: list[pd.MultiIndex] = []
+        for file in LogLoader.getLogFilesInFolder(self.folder):
+            tail = self.tails.setdefault(file, LogTail(file))
+            for rows in tail.readNewRows():
+                changedLevels.update(int(level) for level in rows['level'].dropna().unique())
+                changed.append(self.sweep.addChunk(file.split('/')[-1], rows))
+        if len(changedLevels) == 0:
+            return []
+
+        changedLevelGenerations = getLevelGenerations(pd.concat([index.to_frame() for index in changed]))
+        self.updateTables(changedLevelGenerations)
+        self.save(sorted(changedLevels))
+        return sorted(changedLevels)
+
+    def updateTables(self, changed: pd.MultiIndex):
+        runSummary = self.sweep.getRunSummary()
+        tgmCounts = self.sweep.getCountPerRun('TGM')
+        tgmGroupCounts = self.sweep.getCountPerRun('TGMgroup')
+        if self.tables is None:
+            self.tables = Diversity.makeTables(runSummary, tgmCounts, tgmGroupCounts, self.sweep.getTGMGenes())
+            return
+
+        # TGM coverage is relative to the TGMs found at a level across all of its generations, so recalculate every
+        # generation of the changed levels.
+        runLevels = runSummary.index.get_level_values(0).to_numpy(dtype=np.float64)
+        isInChangedLevel = np.isin(runLevels, changed.get_level_values(0))
+        changed = pd.MultiIndex.from_arrays([
+            runLevels[isInChangedLevel],
+            runSummary.index.get_level_values(1).to_numpy(dtype=np.float64)[isInChangedLevel],
+        ]).unique()
+        changedTables = Diversity.makeTables(
+            selectLevelGenerations(runSummary, changed),
+            selectLevelGenerations(tgmCounts, changed),
+            selectLevelGenerations(tgmGroupCounts, changed),
+            self.sweep.getTGMGenes(),
+        )
+        for name in ['medianTGMCount', 'medianTGMGroupCount']:
+            self.tables[name] = replaceRows(self.tables[name], changedTables[name], changed)
+        self.tables['populationDiversity'] = replaceRows(
+            self.tables['populationDiversity'],
+            changedTables['populationDiversity'],
+            changed
+        ).reset_index(drop=True)
+        self.tables['tgmGroups'] = sorted(set(self.tables['tgmGroups']).union(changedTables['tgmGroups']))
+
+    def save(self, changedLevels: list[int]):
+        Diversity.saveTables(self.tables, self.label, [level for level in changedLevels if level in Diversity.levels])
+        if not self.tablesOnly:
+            for figureJob in Diversity.getFigureJobs(self.tables, self.label):
+                Diversity.renderFigure(*figureJob)
+        fitnessCounts = self.sweep.getFitnessCounts()
+        for level in changedLevels:
+            FitnessConsistency.makeCountsPlot(level, fitnessCounts, self.label, self.tablesOnly)
+
+
+def watch(
+    folder: str,
+    interval: float,
+    label: str | None = None,
+    includeZeroFitness: bool = False,
+    tablesOnly: bool = False
+):
+    os.makedirs('./data', exist_ok=True)
+    if not tablesOnly:
+        os.makedirs('./plots', exist_ok=True)
+        # Figures are only written to disk, never shown.
+        os.environ['MPLBACKEND'] = 'Agg'
+    folder = LogLoader.resolveFolder(folder)
+    if label is None:
+        label = LogLoader.getLabel(folder, LogLoader.getLogFilesInFolder(folder))
+    watcher = SweepWatcher(folder, label, includeZeroFitness, tablesOnly)
+    while True:
+        changedLevels = watcher.poll()
+        if len(changedLevels) > 0:
+            print(f'{time.strftime("%H:%M:%S")} updated {label} for levels {", ".join(map(str, changedLevels))}')
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Keep the diversity and fitness consistency outputs of a folder of GA logs up to date while the '
+                    'GA is still running.'
+    )
+    parser.add_argument('folder', help='folder with GA logs, or commit hash of a folder in ./data/')
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=30,
+        help='seconds between checks for new rows'
+    )
+    parser.add_argument(
+        '--label',
+        default=None,
+        help='label of the output files, defaults to the folder name and the number of runs per level at start up'
+    )
+    parser.add_argument('--include-zero-fitness', action='store_true')
+    parser.add_argument(
+        '--tables-only',
+        action='store_true',
+        help='only keep the CSV files up to date, without drawing any figures'
+    )
+    arguments = parser.parse_args()
+    watch(arguments.folder, arguments.interval, arguments.label, arguments.include_zero_fitness, arguments.tables_only)
@@ -13,10 +13,22 @@ const actionPalette = {
     DO_NOTHING: '#004eff',
 }
 
-let table
+// Rows to draw, selected with the query string of the page, e.g. ?level=3&componentField=isTrigger&page=2. The data
+// is served by "GA analysis/TraceServer.py", which also hosts this page.
+const query = new URLSearchParams(window.location.search)
+if (!query.has('componentField')) {
+    query.set('componentField', 'isTrigger')
+}
+
+let heatmap
+let trajectoryPage
 
 function preload() {
-    table = loadTable('../../../Logs/GA log 2023-12-27-T-20-31-26 - level 3 - population 100.csv', 'csv', 'header')
+    const heatmapQuery = new URLSearchParams(query)
+    heatmapQuery.delete('page')
+    heatmapQuery.delete('pageSize')
+    heatmap = loadJSON(`/api/heatmap?${heatmapQuery}`)
+    trajectoryPage = loadJSON(`/api/trajectories?${query}`)
 }
 
 function setup() {
@@ -24,41 +36,32 @@ function setup() {
 
     colorMode(HSB, 360, 100, 100)
 
-    const sampleRows = table.findRows('isTrigger', 'componentField')
-    renderArchive(sampleRows)
-    for (const row of sampleRows) {
-        const trajectories = JSON.parse(row.get('terminalTrajectories'))
-        if (trajectories.length === 0) {
+    renderArchive(heatmap)
+    for (const row of trajectoryPage.rows) {
+        if (row.trajectories.length === 0) {
             continue
         }
-        renderRow(trajectories)
+        renderRow(row.trajectories.map(trajectory => toSteps(trajectory, trajectoryPage.actionNames)))
     }
 }
 
-function renderArchive(sampleRows) {
-    const colCells = new Map()
-    for (const row of sampleRows) {
-        const archive = JSON.parse(row.get('archive'))
-        for (const cell of archive) {
-            if (colCells.has(`${cell.x}-${cell.y}`)) {
-                const existingCell = colCells.get(`${cell.x}-${cell.y}`)
-                existingCell.timesSeen += cell.timesSeen
-                existingCell.timesChosen += cell.timesChosen
-            } else {
-                colCells.set(`${cell.x}-${cell.y}`, cell)
-            }
-        }
-    }
-    console.log(colCells)
+function toSteps(trajectory, actionNames) {
+    // Trajectories are sent as columns of steps, which is a lot smaller than a list of step objects.
+    return trajectory.x.map((x, index) => ({
+        x,
+        y: trajectory.y[index],
+        startX: trajectory.startX[index],
+        startY: trajectory.startY[index],
+        action: actionNames[trajectory.action[index]],
+    }))
+}
 
+function renderArchive(heatmap) {
+    // The archive cells of all selected rows, merged by position on the server.
     let maxSeenCount = 0
-    let maxChosenCount = 0
-    for (const cell of colCells.values()) {
-        if (cell.timesSeen > maxSeenCount) {
-            maxSeenCount = cell.timesSeen
-        }
-        if (cell.timesChosen > maxChosenCount) {
-            maxChosenCount = cell.timesChosen
+    for (const timesSeen of heatmap.timesSeen) {
+        if (timesSeen > maxSeenCount) {
+            maxSeenCount = timesSeen
         }
     }
 
@@ -66,9 +69,9 @@ function renderArchive(sampleRows) {
     noFill()
     for (let x = 0; x < levelSize.width; x++) {
         for (let y = 0; y < levelSize.height; y++) {
-            const cellFromArchive = colCells.get(`${x}-${y}`)
-            if (cellFromArchive) {
-                fill(lerpColor(color(60, 100, 100), color(0, 100, 100), cellFromArchive.timesSeen / maxSeenCount))
+            const index = y * levelSize.width + x
+            if (heatmap.cellCount[index] > 0) {
+                fill(lerpColor(color(60, 100, 100), color(0, 100, 100), heatmap.timesSeen[index] / maxSeenCount))
             } else {
                 fill(0, 0, 100)
             }